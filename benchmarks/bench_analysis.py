@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_analysis.py
+Description: This script benchmarks analysis.perform_analysis compared with the single pass analysis_fused engine
+Author: Jack Gilmore
+Date: 2024-06-26
+"""
+
+import argparse
+import logging
+import time
+import pandas as pd
+from synthetic_data import make_prisoner_data_frame
+import analysis
+import analysis_fused
+import database
+
+
+def best_time(perform_analysis, data_frame: pd.DataFrame, repeats: int) -> float:
+    """
+    Measures the best time to analyse a DataFrame over a number of repeats
+
+    Parameters:
+    perform_analysis (Callable): An analysis engine taking a DataFrame.
+    data_frame (pd.DataFrame): The prisoner dataset.
+    repeats (int): How many times to repeat the analysis.
+
+    Returns:
+    float: The best analysis time in seconds.
+    """
+    best = float("inf")
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        perform_analysis(data_frame)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    # Keep the analysis engines' log output out of the timings
+    logging.disable(logging.INFO)
+
+    # Names aren't analysed, drop them to save memory
+    data_frame = make_prisoner_data_frame(args.rows).drop(columns="name")
+    compact_data_frame = database.build_prisoner_data_frame(data_frame)
+
+    assert analysis_fused.perform_analysis(data_frame) == analysis.perform_analysis(
+        data_frame
+    )
+
+    print(f"Analysing {args.rows:,} prisoners (best of {args.repeats})")
+
+    for label, frame in [("Object columns", data_frame), ("Compact columns", compact_data_frame)]:
+        pandas_seconds = best_time(analysis.perform_analysis, frame, args.repeats)
+        fused_seconds = best_time(analysis_fused.perform_analysis, frame, args.repeats)
+
+        print(f"  {label}")
+        print(f"    analysis.perform_analysis:       {pandas_seconds:.3f} s")
+        print(f"    analysis_fused.perform_analysis: {fused_seconds:.3f} s")
+        print(f"    Speedup:                         {pandas_seconds / fused_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
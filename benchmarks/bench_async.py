@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_async.py
+Description: This script load tests the API with concurrent requests, comparing the async data layer with the
+             previous handlers that called the synchronous database functions
+Author: Jack Gilmore
+Date: 2024-06-29
+"""
+
+import argparse
+import asyncio
+import functools
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from synthetic_data import make_prisoner_data_frame, src_dir
+import analysis_sql
+import database
+from models import Prisoner, Prisoner_Out
+
+USERNAME = "bench"
+PASSWORD = "bench"
+
+# The API as it was before the async data layer: sync handlers use threadpool slots and prisoner_by_id
+# blocks the event loop while it queries the database
+sync_app = FastAPI()
+security = HTTPBasic()
+
+
+@functools.cache
+def get_dimensions() -> dict:
+    # The benchmark dataset doesn't change, so the lookup values are only read once
+    with database.get_engine().connect() as connection:
+        return database.read_dimensions(connection)
+
+
+def read_prisoner_rows(statement) -> list[database.PrisonerRow]:
+    """
+    Runs a query from database.prisoner_table_select on the synchronous engine and resolves its lookup IDs
+    """
+    with database.get_engine().connect() as connection:
+        rows = connection.execute(statement).all()
+
+    return database.to_prisoner_rows(rows, get_dimensions())
+
+
+def sync_authenticate_user(credentials: HTTPBasicCredentials = Depends(security)):
+    if credentials.username != USERNAME or credentials.password != PASSWORD:
+        raise HTTPException(status_code=401, detail="Incorrect credentials supplied")
+    return True
+
+
+@sync_app.get("/api/prisoners/{prisoner_id}")
+async def sync_prisoner_by_id(
+    prisoner_id: int, authenticated: bool = Depends(sync_authenticate_user)
+) -> Prisoner_Out:
+    prisoners = read_prisoner_rows(
+        database.prisoner_table_select().where(Prisoner.prisoner_id == prisoner_id)
+    )
+    if prisoners:
+        return Prisoner_Out.from_row(prisoners[0])
+    raise HTTPException(status_code=404, detail="Prisoner not found")
+
+
+@sync_app.get("/api/prisoners")
+def sync_read_prisoners(
+    after: int = Query(0),
+    per_page: int = Query(100),
+    authenticated: bool = Depends(sync_authenticate_user),
+):
+    prisoners, next_cursor = database.split_next_cursor(
+        read_prisoner_rows(
+            database.prisoner_table_select()
+            .where(Prisoner.prisoner_id > after)
+            .limit(per_page + 1)
+        ),
+        per_page,
+    )
+    return {
+        "items": [Prisoner_Out.from_row(prisoner) for prisoner in prisoners],
+        "next_cursor": next_cursor,
+    }
+
+
+@sync_app.get("/api/analysis")
+def sync_analysis_output():
+    return analysis_sql.perform_summary_analysis()
+
+
+def free_port() -> int:
+    """
+    Finds a free TCP port to run a server on
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(app: str, app_dir: str, port: int, env: dict) -> subprocess.Popen:
+    """
+    Starts uvicorn in a subprocess and waits until it accepts requests
+
+    Parameters:
+    app (str): The app to serve, e.g. "main:app".
+    app_dir (str): The folder to import the app from, also used as the working directory.
+    port (int): The port to listen on.
+    env (dict): The environment variables for the server.
+
+    Returns:
+    subprocess.Popen: The server process.
+    """
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "--app-dir", app_dir, "--port", str(port),
+         "--log-level", "warning", app],
+        cwd=src_dir,
+        env=env,
+    )
+
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/analysis", timeout=1)
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+
+    server.kill()
+    raise RuntimeError(f"{app} didn't start")
+
+
+async def load_test(port: int, rows: int, requests: int, concurrency: int) -> tuple[float, list[float]]:
+    """
+    Sends a mix of prisoner lookups, pages and analysis requests from a number of concurrent clients
+
+    Parameters:
+    port (int): The port the API is listening on.
+    rows (int): The number of prisoners in the database.
+    requests (int): The total number of requests to send.
+    concurrency (int): How many requests are in flight at once.
+
+    Returns:
+    tuple[float, list[float]]: The total time taken in seconds and the latency of each request in seconds.
+    """
+    rng = random.Random(42)
+    paths = []
+    for _ in range(requests):
+        kind = rng.random()
+        if kind < 0.7:
+            paths.append(f"/api/prisoners/{rng.randint(1, rows)}")
+        elif kind < 0.9:
+            paths.append(f"/api/prisoners?after={rng.randint(0, rows)}&per_page=100")
+        else:
+            paths.append("/api/analysis")
+
+    latencies = []
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{port}",
+        auth=(USERNAME, PASSWORD),
+        limits=httpx.Limits(max_connections=concurrency),
+        timeout=60,
+    ) as client:
+
+        async def worker():
+            while not queue.empty():
+                path = queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.get(path)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    return elapsed, latencies
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """
+    Gets a percentile of some values, e.g. 0.99 for p99
+    """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--requests", type=int, default=3_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        connection_string = f"sqlite:///{os.path.join(temp_dir, 'bench.db')}"
+
+        database.init_engine(connection_string)
+        database.load_data_frame_to_database(make_prisoner_data_frame(args.rows))
+        database.dispose_engine()
+
+        env = dict(
+            os.environ,
+            DB_CONNECTION_STRING=connection_string,
+            API_USERNAME=USERNAME,
+            API_PASSWORD=PASSWORD,
+        )
+        benchmarks_dir = os.path.dirname(os.path.realpath(__file__))
+
+        print(
+            f"{args.requests:,} requests from {args.concurrency} concurrent clients over {args.rows:,} prisoners"
+        )
+
+        for label, app, app_dir in [
+            ("Sync database calls", "bench_async:sync_app", benchmarks_dir),
+            ("Async data layer   ", "main:app", src_dir),
+        ]:
+            port = free_port()
+            server = start_server(app, app_dir, port, env)
+
+            try:
+                elapsed, latencies = asyncio.run(
+                    load_test(port, args.rows, args.requests, args.concurrency)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+            print(
+                f"  {label}: {len(latencies) / elapsed:,.0f} requests/s, "
+                f"p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+                f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_auth.py
+Description: This script benchmarks checking API credentials against hashed passwords on every request
+             compared with the cache of verified credentials
+Author: Jack Gilmore
+Date: 2024-07-04
+"""
+
+import argparse
+import time
+# Importing synthetic_data puts src on the path
+import synthetic_data
+import auth
+
+USERNAME = "bench"
+PASSWORD = "a-very-secure-password"
+
+
+def time_checks(check, requests: int) -> float:
+    """
+    Measures the average time to check a user's credentials
+
+    Parameters:
+    check (Callable): A function taking a username and password.
+    requests (int): How many times to check them.
+
+    Returns:
+    float: The average time in milliseconds.
+    """
+    start = time.perf_counter()
+
+    for _ in range(requests):
+        assert check(USERNAME, PASSWORD)
+
+    return (time.perf_counter() - start) / requests * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--hashed-requests", type=int, default=20)
+    args = parser.parse_args()
+
+    plain_authenticator = auth.Authenticator(
+        auth.PlainCredentialStore({USERNAME: PASSWORD})
+    )
+    plain_authenticator.authenticate(USERNAME, PASSWORD)
+    plain_ms = time_checks(plain_authenticator.authenticate, args.requests)
+
+    print(f"Checking credentials ({args.requests:,} requests, {args.hashed_requests} hashed)")
+    print(f"  Plain text, cached:            {plain_ms:.4f} ms/request")
+
+    for scheme in ("scrypt", "pbkdf2_sha256"):
+        store = auth.HashedCredentialStore(
+            {USERNAME: auth.hash_password(PASSWORD, scheme)}
+        )
+        authenticator = auth.Authenticator(store)
+
+        hashed_ms = time_checks(store.verify, args.hashed_requests)
+
+        # Verify the credentials once first, so only cache hits are timed
+        authenticator.authenticate(USERNAME, PASSWORD)
+        cached_ms = time_checks(authenticator.authenticate, args.requests)
+
+        print(f"  {scheme + ', every request:':<30} {hashed_ms:.4f} ms/request")
+        print(f"  {scheme + ', cached:':<30} {cached_ms:.4f} ms/request")
+        print(f"  {'Speedup:':<30} {hashed_ms / cached_ms:,.0f}x")
+
+
+if __name__ == "__main__":
+    main()
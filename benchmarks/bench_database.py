@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_database.py
+Description: This script benchmarks per-request database overhead with and without the shared connection pool
+Author: Jack Gilmore
+Date: 2024-06-21
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import sqlalchemy
+from sqlalchemy.orm import sessionmaker, joinedload
+from synthetic_data import make_prisoner_data_frame
+import database
+from models import Prisoner
+
+
+def lookup_with_new_engine(connection_string: str, prisoner_id: int) -> Prisoner:
+    """
+    Looks up a prisoner the way every request used to: with a brand new engine, pool and connection
+
+    Parameters:
+    connection_string (str): The database URL.
+    prisoner_id (int): The prisoner ID to query.
+
+    Returns:
+    Prisoner: The prisoner record.
+    """
+    engine = sqlalchemy.create_engine(connection_string)
+    session = sessionmaker(bind=engine)()
+
+    try:
+        return (
+            session.query(Prisoner)
+            .options(
+                joinedload(Prisoner.gender),
+                joinedload(Prisoner.crime),
+                joinedload(Prisoner.prison),
+            )
+            .filter_by(prisoner_id=prisoner_id)
+            .one_or_none()
+        )
+    finally:
+        session.close()
+
+
+def time_requests(lookup, requests: int, rows: int) -> float:
+    """
+    Times a number of prisoner lookups
+
+    Parameters:
+    lookup (Callable): A function taking a prisoner ID.
+    requests (int): The number of lookups to make.
+    rows (int): The number of prisoners in the database.
+
+    Returns:
+    float: The mean time per lookup in milliseconds.
+    """
+    start = time.perf_counter()
+
+    for request in range(requests):
+        lookup(request % rows + 1)
+
+    return (time.perf_counter() - start) / requests * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--requests", type=int, default=2_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        connection_string = f"sqlite:///{os.path.join(temp_dir, 'bench.db')}"
+
+        database.init_engine(connection_string)
+        database.load_data_frame_to_database(make_prisoner_data_frame(args.rows))
+
+        new_engine_ms = time_requests(
+            lambda prisoner_id: lookup_with_new_engine(connection_string, prisoner_id),
+            args.requests,
+            args.rows,
+        )
+        shared_engine_ms = time_requests(
+            database.get_prisoner_by_id, args.requests, args.rows
+        )
+
+        database.dispose_engine()
+
+    print(f"Prisoner lookups over {args.rows:,} rows, {args.requests:,} requests")
+    print(f"  New engine per request: {new_engine_ms:.3f} ms/request")
+    print(f"  Shared engine and pool: {shared_engine_ms:.3f} ms/request")
+    print(f"  Speedup:                {new_engine_ms / shared_engine_ms:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_dataframe.py
+Description: This script benchmarks the memory use and analysis speed of the object dtype prisoner DataFrame
+             compared with the compact layout from database.build_prisoner_data_frame
+Author: Jack Gilmore
+Date: 2024-06-26
+"""
+
+import argparse
+import time
+import pandas as pd
+from synthetic_data import make_prisoner_data_frame
+import analysis
+import database
+
+
+def best_time(data_frame: pd.DataFrame, repeats: int) -> float:
+    """
+    Measures the best time to analyse a DataFrame over a number of repeats
+
+    Parameters:
+    data_frame (pd.DataFrame): The prisoner dataset.
+    repeats (int): How many times to repeat the analysis.
+
+    Returns:
+    float: The best analysis time in seconds.
+    """
+    best = float("inf")
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        analysis.perform_analysis(data_frame)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    wide_data_frame = make_prisoner_data_frame(args.rows)
+    compact_data_frame = database.build_prisoner_data_frame(wide_data_frame)
+
+    wide_seconds = best_time(wide_data_frame, args.repeats)
+    compact_seconds = best_time(compact_data_frame, args.repeats)
+
+    print(f"Memory usage of {args.rows:,} prisoners in bytes")
+    print(database.get_memory_report(wide_data_frame, compact_data_frame).to_string())
+    print(f"\nanalysis.perform_analysis (best of {args.repeats})")
+    print(f"  Object and int64 columns: {wide_seconds:.3f} s")
+    print(f"  Categorical and downcast: {compact_seconds:.3f} s")
+    print(f"  Speedup:                  {wide_seconds / compact_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_extraction.py
+Description: This script benchmarks serial compared with parallel PDF page extraction
+Author: Jack Gilmore
+Date: 2024-06-22
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from synthetic_pdf import make_prisoner_pdf
+from load_data import extract_pages
+
+
+def time_extraction(path: str, pages: int, workers: int) -> tuple[float, int]:
+    """
+    Times extracting every data page of a PDF
+
+    Parameters:
+    path (str): The path to the PDF.
+    pages (int): The number of pages in the PDF, including the instructions page.
+    workers (int): The number of worker processes.
+
+    Returns:
+    tuple[float, int]: The elapsed seconds and the number of lines extracted.
+    """
+    start = time.perf_counter()
+    line_count = sum(len(lines) for lines in extract_pages(path, range(1, pages), workers))
+
+    return time.perf_counter() - start, line_count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=3_000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "bench.pdf")
+        make_prisoner_pdf(path, args.pages)
+
+        serial_seconds, serial_lines = time_extraction(path, args.pages + 1, 1)
+        parallel_seconds, parallel_lines = time_extraction(
+            path, args.pages + 1, args.workers
+        )
+
+    assert serial_lines == parallel_lines
+
+    print(f"Extracting {args.pages:,} pages ({serial_lines:,} lines)")
+    print(f"  Serial:               {serial_seconds:.2f} s")
+    print(f"  {args.workers} workers:{' ' * (12 - len(str(args.workers)))}{parallel_seconds:.2f} s")
+    print(f"  Speedup:              {serial_seconds / parallel_seconds:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_loader.py
+Description: This script benchmarks loading prisoner data into the database
+Author: Jack Gilmore
+Date: 2024-06-22
+"""
+
+import argparse
+import os
+import tempfile
+import time
+import pandas as pd
+from synthetic_data import make_prisoner_data_frame
+import database
+from models import Gender, Crime, Prison, Base
+
+
+def iterrows_loader(data_frame: pd.DataFrame) -> None:
+    """
+    Loads prisoners the way load_data_frame_to_database used to: building a dict per row with iterrows
+    and writing the result with DataFrame.to_sql
+    """
+    db_engine = database.get_engine()
+    Base.metadata.create_all(db_engine)
+    session = database.create_session()
+
+    try:
+        for column, lookup_class, attribute in (
+            ("gender", Gender, "title"),
+            ("crime", Crime, "name"),
+            ("prison", Prison, "name"),
+        ):
+            for value in data_frame[column].unique():
+                session.add(lookup_class(**{attribute: value}))
+        session.commit()
+
+        gender_map = {g.title: g.id for g in session.query(Gender).all()}
+        crime_map = {c.name: c.id for c in session.query(Crime).all()}
+        prison_map = {p.name: p.id for p in session.query(Prison).all()}
+
+        prisoner_data = []
+        for _, row in data_frame.iterrows():
+            prisoner_data.append(
+                {
+                    "prisoner_id": row["prisoner_id"],
+                    "name": row["name"],
+                    "age": row["age"],
+                    "gender_id": gender_map[row["gender"]],
+                    "crime_id": crime_map[row["crime"]],
+                    "sentence_years": row["sentence_years"],
+                    "prison_id": prison_map[row["prison"]],
+                }
+            )
+
+        pd.DataFrame(prisoner_data).to_sql(
+            name="prisoners", con=db_engine, if_exists="replace", index=False
+        )
+    finally:
+        session.close()
+
+
+def rows_per_second(loader, data_frame: pd.DataFrame, temp_dir: str) -> float:
+    """
+    Measures loading throughput into a fresh database
+
+    Parameters:
+    loader (Callable): A function loading a DataFrame into the database.
+    data_frame (pd.DataFrame): The prisoner data.
+    temp_dir (str): A folder to create the database in.
+
+    Returns:
+    float: Rows loaded per second.
+    """
+    database_path = os.path.join(temp_dir, f"{loader.__name__}.db")
+    database.init_engine(f"sqlite:///{database_path}")
+
+    start = time.perf_counter()
+    loader(data_frame)
+    elapsed = time.perf_counter() - start
+
+    database.dispose_engine()
+
+    return len(data_frame) / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    args = parser.parse_args()
+
+    data_frame = make_prisoner_data_frame(args.rows)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        iterrows_throughput = rows_per_second(iterrows_loader, data_frame, temp_dir)
+        bulk_throughput = rows_per_second(
+            database.load_data_frame_to_database, data_frame, temp_dir
+        )
+
+    print(f"Loading {args.rows:,} synthetic prisoners")
+    print(f"  iterrows + to_sql:                {iterrows_throughput:,.0f} rows/s")
+    print(f"  factorised lookups + executemany: {bulk_throughput:,.0f} rows/s")
+    print(f"  Speedup:                          {bulk_throughput / iterrows_throughput:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_logging.py
+Description: This script benchmarks the per-request cost of rendering the human readable analysis report
+             compared with skipping it when INFO logging is disabled, as it is in the API
+Author: Jack Gilmore
+Date: 2024-06-27
+"""
+
+import argparse
+import logging
+import time
+from synthetic_data import make_prisoner_data_frame
+import analysis
+
+
+def mean_milliseconds(request, requests: int) -> float:
+    """
+    Times a number of simulated analysis requests
+
+    Parameters:
+    request (Callable): A function handling one request.
+    requests (int): The number of requests to make.
+
+    Returns:
+    float: The mean time per request in milliseconds.
+    """
+    start = time.perf_counter()
+
+    for _ in range(requests):
+        request()
+
+    return (time.perf_counter() - start) / requests * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    data_frame = make_prisoner_data_frame(args.rows)
+
+    def request():
+        analysis.log_analysis(analysis.perform_analysis(data_frame))
+
+    # Send log records nowhere, so only building and formatting them is measured
+    root_logger = logging.getLogger()
+    root_logger.handlers = [logging.NullHandler()]
+
+    root_logger.setLevel(logging.INFO)
+    rendered_ms = mean_milliseconds(request, args.requests)
+
+    root_logger.setLevel(logging.WARNING)
+    lazy_ms = mean_milliseconds(request, args.requests)
+
+    print(f"Analysis of {args.rows:,} prisoners, {args.requests:,} requests")
+    print(f"  INFO enabled, report rendered:   {rendered_ms:.3f} ms/request")
+    print(f"  INFO disabled, report skipped:   {lazy_ms:.3f} ms/request")
+    print(f"  Saving:                          {rendered_ms - lazy_ms:.3f} ms/request")
+
+
+if __name__ == "__main__":
+    main()
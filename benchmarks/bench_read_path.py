@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_read_path.py
+Description: This script benchmarks reading prisoners through the ORM compared with the Core row path
+Author: Jack Gilmore
+Date: 2024-06-21
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from synthetic_data import make_prisoner_data_frame
+import database
+from models import Prisoner_Out
+
+
+def orm_path(rows: int) -> list[Prisoner_Out]:
+    """
+    Reads prisoners as ORM objects with joined relationships and converts them with Prisoner.to_out
+    """
+    return [prisoner.to_out() for prisoner in database.get_paginated_prisoners(1, rows)]
+
+
+def core_path(rows: int) -> list[Prisoner_Out]:
+    """
+    Reads prisoners as flat Core rows, resolving their lookup IDs in Python, and maps them straight to Prisoner_Out
+    """
+    with database.get_engine().connect() as connection:
+        dimensions = database.read_dimensions(connection)
+        prisoners = connection.execute(
+            database.prisoner_table_select().limit(rows)
+        ).all()
+
+    return [
+        Prisoner_Out.from_row(row)
+        for row in database.to_prisoner_rows(prisoners, dimensions)
+    ]
+
+
+def rows_per_second(read, rows: int, repeats: int) -> float:
+    """
+    Measures the best read throughput over a number of repeats
+
+    Parameters:
+    read (Callable): A function reading a number of prisoners.
+    rows (int): The number of prisoners to read.
+    repeats (int): How many times to repeat the read.
+
+    Returns:
+    float: Rows read per second.
+    """
+    best = float("inf")
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        read(rows)
+        best = min(best, time.perf_counter() - start)
+
+    return rows / best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database.init_engine(f"sqlite:///{os.path.join(temp_dir, 'bench.db')}")
+        database.load_data_frame_to_database(make_prisoner_data_frame(args.rows))
+
+        orm_throughput = rows_per_second(orm_path, args.rows, args.repeats)
+        core_throughput = rows_per_second(core_path, args.rows, args.repeats)
+
+        database.dispose_engine()
+
+    print(f"Reading {args.rows:,} prisoners into Prisoner_Out (best of {args.repeats})")
+    print(f"  ORM + joinedload + to_out: {orm_throughput:,.0f} rows/s")
+    print(f"  Core rows + from_row:      {core_throughput:,.0f} rows/s")
+    print(f"  Speedup:                   {core_throughput / orm_throughput:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
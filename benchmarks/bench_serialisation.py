@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_serialisation.py
+Description: This script benchmarks encoding a list of prisoners as an API response through pydantic and
+             FastAPI's response model compared with orjson straight from the rows
+Author: Jack Gilmore
+Date: 2024-07-01
+"""
+
+import argparse
+import asyncio
+import time
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from synthetic_data import make_prisoner_data_frame
+import database
+import responses
+from models import Prisoner_Out
+
+# A route with the response model the list endpoint used to validate against, so we can reuse its field
+model_app = FastAPI()
+
+
+@model_app.get("/api/prisoners", response_model=list[Prisoner_Out])
+def list_prisoners():
+    pass
+
+
+response_field = model_app.routes[-1].response_field
+
+
+def response_model_path(prisoners: list) -> bytes:
+    """
+    Encodes prisoners as the list endpoint did before: a Prisoner_Out per row, validated and converted by
+    FastAPI's response model, then encoded with the standard json module
+    """
+    content = asyncio.run(
+        serialize_response(
+            field=response_field,
+            response_content=[Prisoner_Out.from_row(prisoner) for prisoner in prisoners],
+        )
+    )
+
+    return JSONResponse(content).body
+
+
+def orjson_path(prisoners: list) -> bytes:
+    """
+    Encodes prisoners as the list endpoint does now: dicts straight from the rows, encoded with orjson
+    """
+    return ORJSONResponse(responses.prisoner_dicts(prisoners)).body
+
+
+def best_time(encode, prisoners: list, repeats: int) -> float:
+    """
+    Measures the best time to encode some prisoners over a number of repeats
+
+    Parameters:
+    encode (Callable): A function encoding a list of prisoner rows.
+    prisoners (list): The prisoner rows.
+    repeats (int): How many times to repeat the encoding.
+
+    Returns:
+    float: The best time in seconds.
+    """
+    best = float("inf")
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        encode(prisoners)
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 100_000])
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        prisoners = [
+            database.PrisonerRow(*prisoner)
+            for prisoner in make_prisoner_data_frame(rows)[
+                list(database.PRISONER_COLUMNS)
+            ].itertuples(index=False)
+        ]
+
+        # Both paths have to give the same JSON
+        assert response_model_path(prisoners[:10]) == orjson_path(prisoners[:10])
+
+        model_time = best_time(response_model_path, prisoners, args.repeats)
+        orjson_time = best_time(orjson_path, prisoners, args.repeats)
+
+        print(f"Encoding {rows:,} prisoners (best of {args.repeats})")
+        print(f"  Prisoner_Out + response model + json: {model_time * 1000:,.1f} ms")
+        print(f"  Row dicts + orjson:                   {orjson_time * 1000:,.1f} ms")
+        print(f"  Speedup:                              {model_time / orjson_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
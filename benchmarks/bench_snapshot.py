@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_snapshot.py
+Description: This script benchmarks loading the dataset for analysis from the database compared with the columnar snapshot
+Author: Jack Gilmore
+Date: 2024-06-25
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from synthetic_data import make_prisoner_data_frame
+import database
+import snapshot
+
+
+def best_time(load, repeats: int) -> float:
+    """
+    Measures the best time to load the dataset over a number of repeats
+
+    Parameters:
+    load (Callable): A function loading the dataset into a DataFrame.
+    repeats (int): How many times to repeat the load.
+
+    Returns:
+    float: The best load time in seconds.
+    """
+    best = float("inf")
+
+    for _ in range(repeats):
+        start = time.perf_counter()
+        load()
+        best = min(best, time.perf_counter() - start)
+
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        snapshot_path = os.path.join(temp_dir, "prisoners.arrow")
+
+        database.init_engine(f"sqlite:///{os.path.join(temp_dir, 'bench.db')}")
+        database.load_data_frame_to_database(make_prisoner_data_frame(args.rows))
+
+        start = time.perf_counter()
+        snapshot.write_snapshot(snapshot_path)
+        write_seconds = time.perf_counter() - start
+
+        database_seconds = best_time(
+            database.get_all_prisoners_as_dataframe, args.repeats
+        )
+        snapshot_seconds = best_time(
+            lambda: snapshot.load_snapshot(snapshot.ANALYSIS_COLUMNS, snapshot_path),
+            args.repeats,
+        )
+
+        database.dispose_engine()
+
+    print(f"Loading {args.rows:,} prisoners for analysis (best of {args.repeats})")
+    print(f"  Writing the snapshot:       {write_seconds:.3f} s")
+    print(f"  Database via Core rows:     {database_seconds:.3f} s")
+    print(f"  Memory-mapped snapshot:     {snapshot_seconds:.3f} s")
+    print(f"  Speedup:                    {database_seconds / snapshot_seconds:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
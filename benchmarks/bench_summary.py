@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: bench_summary.py
+Description: This script benchmarks aggregating the prisoners table for every analysis compared with reading the
+             summary tables written at load time
+Author: Jack Gilmore
+Date: 2024-06-28
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from synthetic_data import make_prisoner_data_frame
+import analysis_sql
+import database
+
+
+def mean_milliseconds(perform_analysis, requests: int) -> float:
+    """
+    Times a number of analysis requests
+
+    Parameters:
+    perform_analysis (Callable): An analysis engine.
+    requests (int): The number of requests to make.
+
+    Returns:
+    float: The mean time per request in milliseconds.
+    """
+    start = time.perf_counter()
+
+    for _ in range(requests):
+        perform_analysis()
+
+    return (time.perf_counter() - start) / requests * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    # Keep the analysis engines' log output out of the timings
+    logging.disable(logging.INFO)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        database.init_engine(f"sqlite:///{os.path.join(temp_dir, 'bench.db')}")
+        database.load_data_frame_to_database(make_prisoner_data_frame(args.rows))
+
+        sql_ms = mean_milliseconds(analysis_sql.perform_analysis, args.requests)
+        summary_ms = mean_milliseconds(
+            analysis_sql.perform_summary_analysis, args.requests
+        )
+
+        database.dispose_engine()
+
+    print(f"Analysis of {args.rows:,} prisoners, {args.requests:,} requests")
+    print(f"  Aggregating the prisoners table: {sql_ms:.3f} ms/request")
+    print(f"  Reading the summary tables:      {summary_ms:.3f} ms/request")
+    print(f"  Speedup:                         {sql_ms / summary_ms:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: synthetic_data.py
+Description: This script generates synthetic prisoner datasets of any size for benchmarking
+Author: Jack Gilmore
+Date: 2024-06-21
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+# Add the 'src' directory to the sys.path so benchmarks can import the application modules
+src_dir = os.path.join(os.path.dirname(__file__), "..", "src")
+sys.path.insert(0, src_dir)
+
+GENDERS = ["Male", "Female"]
+CRIMES = [
+    "Assault",
+    "Burglary",
+    "Drug Possession",
+    "Fraud",
+    "Murder",
+    "Robbery",
+    "Theft",
+    "Vandalism",
+]
+PRISONS = [
+    "Aberdeen",
+    "Barlinnie",
+    "Dumfries",
+    "Edinburgh",
+    "Glasgow",
+    "Inverness",
+    "Perth",
+    "Polmont",
+]
+
+
+def make_prisoner_data_frame(rows: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Generates a random prisoner dataset with the same columns as load_data.data_to_pandas
+
+    Parameters:
+    rows (int): The number of prisoners to generate.
+    seed (int, optional): The random seed. Defaults to 42.
+
+    Returns:
+    pd.DataFrame: The synthetic prisoner dataset.
+    """
+    rng = np.random.default_rng(seed)
+
+    return pd.DataFrame(
+        {
+            "prisoner_id": np.arange(1, rows + 1),
+            "name": [f"Prisoner {index}" for index in range(1, rows + 1)],
+            "age": rng.integers(16, 90, rows),
+            "gender": np.array(GENDERS, dtype=object)[rng.integers(0, len(GENDERS), rows)],
+            "crime": np.array(CRIMES, dtype=object)[rng.integers(0, len(CRIMES), rows)],
+            "sentence_years": rng.integers(1, 40, rows),
+            "prison": np.array(PRISONS, dtype=object)[rng.integers(0, len(PRISONS), rows)],
+        }
+    )
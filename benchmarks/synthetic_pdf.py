@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: synthetic_pdf.py
+Description: This script generates synthetic prisoner PDFs laid out like coding-test.pdf for benchmarking
+Author: Jack Gilmore
+Date: 2024-06-22
+"""
+
+import pymupdf
+from synthetic_data import make_prisoner_data_frame
+from load_data import DATASET_HEADER
+
+GENDER_CODES = {"Male": "M", "Female": "F"}
+
+
+def make_prisoner_pdf(path: str, pages: int, rows_per_page: int = 50) -> int:
+    """
+    Writes a PDF with an instructions page followed by pages of CSV prisoner rows
+
+    Parameters:
+    path (str): Where to save the PDF.
+    pages (int): The number of pages of prisoner rows.
+    rows_per_page (int, optional): The number of prisoner rows on each page. Defaults to 50.
+
+    Returns:
+    int: The number of prisoner rows written.
+    """
+    data_frame = make_prisoner_data_frame(pages * rows_per_page)
+    data_frame["gender"] = data_frame["gender"].map(GENDER_CODES)
+    lines = data_frame.to_csv(index=False, header=False).splitlines()
+
+    document = pymupdf.open()
+
+    instructions_page = document.new_page()
+    instructions_page.insert_text((72, 72), "Synthetic prisoner dataset", fontsize=11)
+
+    for page_number in range(pages):
+        page_lines = lines[page_number * rows_per_page : (page_number + 1) * rows_per_page]
+
+        if page_number == 0:
+            page_lines = [DATASET_HEADER] + page_lines
+
+        page = document.new_page()
+        page.insert_text((36, 36), "\n".join(page_lines), fontsize=6)
+
+    document.save(path)
+    document.close()
+
+    return len(lines)
@@ -9,6 +9,48 @@ Date: 2024-06-12
 
 import logging
 import pandas as pd
+from diagnostics import LazyText, log_frame
+
+# Using age bands as defined in Scottish prison population statistics technical manual
+# https://www.gov.scot/publications/scottish-prison-population-statistics/pages/analytical-factors-and-measurements/#Age%20Bands
+# Each band includes its upper edge but not its lower edge
+AGE_BAND_EDGES = [
+    0,
+    16,
+    17,
+    20,
+    22,
+    24,
+    29,
+    34,
+    39,
+    44,
+    49,
+    54,
+    59,
+    64,
+    69,
+    74,
+    float("inf"),
+]
+AGE_BAND_LABELS = [
+    "Under 16",
+    "16-17",
+    "18-20",
+    "21-22",
+    "23-24",
+    "25-29",
+    "30-34",
+    "35-39",
+    "40-44",
+    "45-49",
+    "50-54",
+    "55-59",
+    "60-64",
+    "65-69",
+    "70-74",
+    "75 or over",
+]
 
 
 def years_number_to_formatted_string(years_number: float) -> str:
@@ -52,7 +94,7 @@ def prisoners_by_crime_type(data_frame: pd.DataFrame) -> pd.DataFrame:
 
     # Group by crime column and get prisoner counts
     prisoners_by_crime_type = (
-        data_frame.groupby("crime").size().reset_index(name="count")
+        data_frame.groupby("crime", observed=True).size().reset_index(name="count")
     )
 
     # Sort the results alphabetically by crime
@@ -60,9 +102,6 @@ def prisoners_by_crime_type(data_frame: pd.DataFrame) -> pd.DataFrame:
         by="crime", ascending=True
     ).reset_index(drop=True)
 
-    logging.info(f"Prisoners by crime type")
-    logging.info(f"\n{prisoners_by_crime_type.to_string(index=False)}")
-
     return prisoners_by_crime_type
 
 
@@ -80,13 +119,6 @@ def average_sentence_length(data_frame: pd.DataFrame) -> float:
     # Get the average of the sentence_years column
     average_sentence_length = data_frame["sentence_years"].mean()
 
-    # Convert the value to years and months
-    formatted_average_sentence_length = years_number_to_formatted_string(
-        average_sentence_length
-    )
-
-    logging.info(f"Average sentence length: {formatted_average_sentence_length}")
-
     return average_sentence_length
 
 
@@ -102,7 +134,9 @@ def average_sentence_length_by_crime_type(data_frame) -> pd.DataFrame:
                   in years and in a readable "years and months" format.
     """
     sentence_length_by_crime_type = (
-        data_frame.groupby("crime")["sentence_years"].mean().reset_index()
+        data_frame.groupby("crime", observed=True)["sentence_years"]
+        .mean()
+        .reset_index()
     )
     sentence_length_by_crime_type.columns = ["crime", "average_sentence_years"]
 
@@ -116,9 +150,6 @@ def average_sentence_length_by_crime_type(data_frame) -> pd.DataFrame:
         by="crime", ascending=True
     ).reset_index(drop=True)
 
-    logging.info(f"Average sentence length by crime type")
-    logging.info(f"\n{sentence_length_by_crime_type.to_string(index=False)}")
-
     return sentence_length_by_crime_type
 
 
@@ -134,16 +165,15 @@ def gender_distribution(data_frame: pd.DataFrame) -> pd.DataFrame:
     """
 
     # Group by gender column and get prisoner counts
-    prisoners_by_gender = data_frame.groupby("gender").size().reset_index(name="count")
+    prisoners_by_gender = (
+        data_frame.groupby("gender", observed=True).size().reset_index(name="count")
+    )
 
     # Sort the results
     prisoners_by_gender = prisoners_by_gender.sort_values(
         by="count", ascending=False
     ).reset_index(drop=True)
 
-    logging.info(f"Gender distribution")
-    logging.info(f"\n{prisoners_by_gender.to_string(index=False)}")
-
     return prisoners_by_gender
 
 
@@ -160,7 +190,7 @@ def gender_distribution_by_crime_type(df: pd.DataFrame) -> pd.DataFrame:
 
     # Group by crime type and gender, then count occurrences
     gender_distribution_by_crime = (
-        df.groupby(["crime", "gender"]).size().unstack(fill_value=0)
+        df.groupby(["crime", "gender"], observed=True).size().unstack(fill_value=0)
     )
 
     # Sort the results
@@ -168,9 +198,6 @@ def gender_distribution_by_crime_type(df: pd.DataFrame) -> pd.DataFrame:
         by="crime", ascending=True
     )
 
-    logging.info(f"Gender distribution by crime type")
-    logging.info(f"\n{gender_distribution_by_crime}")
-
     return gender_distribution_by_crime
 
 
@@ -186,16 +213,15 @@ def prisoners_by_prison(data_frame: pd.DataFrame) -> pd.DataFrame:
     """
 
     # Group by prison column and get prisoner counts
-    prisoners_by_prison = data_frame.groupby("prison").size().reset_index(name="count")
+    prisoners_by_prison = (
+        data_frame.groupby("prison", observed=True).size().reset_index(name="count")
+    )
 
     # Sort the results alphabetically by prison
     prisoners_by_prison = prisoners_by_prison.sort_values(
         by="prison", ascending=True
     ).reset_index(drop=True)
 
-    logging.info(f"Prisoners by prison")
-    logging.info(f"\n{prisoners_by_prison.to_string(index=False)}")
-
     return prisoners_by_prison
 
 
@@ -210,50 +236,10 @@ def age_distribution(data_frame: pd.DataFrame) -> pd.DataFrame:
     pd.DataFrame: A DataFrame with the distribution of ages.
     """
 
-    # Using age bands as defined in Scottish prison population statistics technical manual
-    # https://www.gov.scot/publications/scottish-prison-population-statistics/pages/analytical-factors-and-measurements/#Age%20Bands
-
-    # Define the bin edges and labels
-    bin_edges = [
-        0,
-        16,
-        17,
-        20,
-        22,
-        24,
-        29,
-        34,
-        39,
-        44,
-        49,
-        54,
-        59,
-        64,
-        69,
-        74,
-        float("inf"),
-    ]
-    bin_labels = [
-        "Under 16",
-        "16-17",
-        "18-20",
-        "21-22",
-        "23-24",
-        "25-29",
-        "30-34",
-        "35-39",
-        "40-44",
-        "45-49",
-        "50-54",
-        "55-59",
-        "60-64",
-        "65-69",
-        "70-74",
-        "75 or over",
-    ]
-
     # Create the bins
-    age_bins = pd.cut(data_frame["age"], bins=bin_edges, labels=bin_labels, right=True)
+    age_bins = pd.cut(
+        data_frame["age"], bins=AGE_BAND_EDGES, labels=AGE_BAND_LABELS, right=True
+    )
 
     # Count the number of occurrences in each bin
     age_distribution = (
@@ -261,12 +247,60 @@ def age_distribution(data_frame: pd.DataFrame) -> pd.DataFrame:
     )
     age_distribution = age_distribution.rename(columns={"index": "age_group"})
 
-    logging.info(f"Age distribution")
-    logging.info(f"\n{age_distribution.to_string(index=False)}")
-
     return age_distribution
 
 
+def log_analysis(analysis_output: dict) -> None:
+    """
+    Logs a human readable report of the output of perform_analysis (or any other analysis engine).
+    The report is kept apart from the analysis itself and is only rendered if INFO logging is enabled.
+
+    Parameters:
+    analysis_output (dict): A dict of all the analysis statistics
+    """
+
+    log_frame(
+        "Prisoners by crime type",
+        lambda: pd.DataFrame(analysis_output["prisoners_by_crime_type"]),
+    )
+
+    logging.info(
+        "Average sentence length: %s",
+        LazyText(
+            years_number_to_formatted_string,
+            analysis_output["average_sentence_length"],
+        ),
+    )
+
+    log_frame(
+        "Average sentence length by crime type",
+        lambda: pd.DataFrame(analysis_output["average_sentence_length_by_crime_type"]),
+    )
+
+    log_frame(
+        "Gender distribution",
+        lambda: pd.DataFrame(analysis_output["gender_distribution"]),
+    )
+
+    log_frame(
+        "Gender distribution by crime type",
+        lambda: pd.DataFrame.from_dict(
+            analysis_output["gender_distribution_by_crime_type"], orient="index"
+        ),
+        index=True,
+    )
+
+    log_frame(
+        "Prisoners by prison",
+        lambda: pd.DataFrame(analysis_output["prisoners_by_prison"]),
+    )
+
+    log_frame(
+        "Age distribution",
+        lambda: pd.DataFrame(analysis_output["age_distribution"]),
+    )
+
+
 def dataframe_to_oriented_dict(data_frame: pd.DataFrame, orient_direction="records") -> dict:
     """
     Converts a DataFrame to a dict oriented by records
@@ -322,3 +356,86 @@ def perform_analysis(data_frame: pd.DataFrame) -> dict:
         "prisoners_by_prison": dataframe_to_oriented_dict(prisoners_by_prison_stat),
         "age_distribution": dataframe_to_oriented_dict(age_distribution_stat),
     }
+
+
+def analysis_from_aggregates(
+    crime_gender_counts: dict,
+    crime_sentence_totals: dict,
+    prison_counts: dict,
+    age_band_counts: dict,
+) -> dict:
+    """
+    Builds the same output as perform_analysis from pre-aggregated counts and sums.
+    This lets other analysis engines (e.g. ones that aggregate in SQL) return identical results
+    without holding the whole dataset in memory.
+
+    Parameters:
+    crime_gender_counts (dict): Prisoner counts keyed by (crime, gender) tuples.
+    crime_sentence_totals (dict): The sum of sentence_years keyed by crime.
+    prison_counts (dict): Prisoner counts keyed by prison.
+    age_band_counts (dict): Prisoner counts keyed by index into AGE_BAND_LABELS.
+
+    Returns
+    dict: A dict of all the analysis statistics
+    """
+
+    crimes = sorted({crime for crime, _ in crime_gender_counts})
+    genders = sorted({gender for _, gender in crime_gender_counts})
+
+    crime_counts = {crime: 0 for crime in crimes}
+    gender_counts = {gender: 0 for gender in genders}
+    for (crime, gender), count in crime_gender_counts.items():
+        crime_counts[crime] += count
+        gender_counts[gender] += count
+
+    total_count = sum(crime_counts.values())
+    total_sentence_years = sum(crime_sentence_totals.values())
+
+    average_sentence_length_stat = (
+        total_sentence_years / total_count if total_count else float("nan")
+    )
+
+    average_sentence_length_by_crime_type_stat = []
+    for crime in crimes:
+        average_sentence_years = crime_sentence_totals[crime] / crime_counts[crime]
+        average_sentence_length_by_crime_type_stat.append(
+            {
+                "crime": crime,
+                "average_sentence_years": average_sentence_years,
+                "average_sentence": years_number_to_formatted_string(
+                    average_sentence_years
+                ),
+            }
+        )
+
+    # Most common gender first, ties broken alphabetically
+    gender_distribution_stat = [
+        {"gender": gender, "count": count}
+        for gender, count in sorted(
+            gender_counts.items(), key=lambda item: (-item[1], item[0])
+        )
+    ]
+
+    return {
+        "prisoners_by_crime_type": [
+            {"crime": crime, "count": crime_counts[crime]} for crime in crimes
+        ],
+        "average_sentence_length": average_sentence_length_stat,
+        "average_sentence_length_by_crime_type": average_sentence_length_by_crime_type_stat,
+        "gender_distribution": gender_distribution_stat,
+        "gender_distribution_by_crime_type": {
+            crime: {
+                gender: crime_gender_counts.get((crime, gender), 0)
+                for gender in genders
+            }
+            for crime in crimes
+        },
+        "prisoners_by_prison": [
+            {"prison": prison, "count": prison_counts[prison]}
+            for prison in sorted(prison_counts)
+        ],
+        "age_distribution": [
+            {"age": label, "count": age_band_counts.get(index, 0)}
+            for index, label in enumerate(AGE_BAND_LABELS)
+        ],
+    }
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: analysis_fused.py
+Description: This script performs the same analysis as analysis.py in a single pass, by factorising each key column
+             once and counting integer codes with numpy instead of running a separate groupby for every statistic
+Author: Jack Gilmore
+Date: 2024-06-26
+"""
+
+import logging
+import numpy as np
+import pandas as pd
+from analysis import AGE_BAND_EDGES, AGE_BAND_LABELS, analysis_from_aggregates
+
+
+def factorise(values: pd.Series) -> tuple[np.ndarray, list]:
+    """
+    Converts a column to integer codes. Categorical columns already have codes so this is free for them.
+
+    Parameters:
+    values (pd.Series): The column to factorise.
+
+    Returns:
+    tuple[np.ndarray, list]: The code of each value (-1 for missing values) and the value each code stands for.
+    """
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), values.cat.categories.tolist()
+
+    codes, uniques = pd.factorize(values)
+
+    return codes, uniques.tolist()
+
+
+def age_band_codes(ages: pd.Series) -> np.ndarray:
+    """
+    Puts each age into the same bands as analysis.age_distribution
+
+    Parameters:
+    ages (pd.Series): The age of each prisoner.
+
+    Returns:
+    np.ndarray: The index into AGE_BAND_LABELS of each age, or -1 if the age is outside every band.
+    """
+    ages = ages.to_numpy()
+
+    if not np.issubdtype(ages.dtype, np.integer) or not len(ages):
+        # Bands include their upper edge, so the band is one before the first edge that isn't below the age
+        return np.searchsorted(AGE_BAND_EDGES, ages, side="left") - 1
+
+    # Whole number ages only span a small range, so band each possible age once and look the bands up
+    youngest = ages.min()
+    possible_ages = np.arange(youngest, ages.max() + 1)
+    age_bands = np.searchsorted(AGE_BAND_EDGES, possible_ages, side="left") - 1
+
+    return age_bands[ages - youngest]
+
+
+def valid_codes(*codes: np.ndarray) -> np.ndarray:
+    """
+    Finds the rows where none of the codes are missing
+
+    Parameters:
+    codes (np.ndarray): Codes from factorise.
+
+    Returns:
+    np.ndarray: A boolean mask, or a slice of every row when nothing is missing so no copies are made.
+    """
+    if all(len(code) == 0 or code.min() >= 0 for code in codes):
+        return slice(None)
+
+    return np.logical_and.reduce([code >= 0 for code in codes])
+
+
+def perform_analysis(data_frame: pd.DataFrame) -> dict:
+    """
+    Performs a range of basic analysis on the prisoner dataset in one vectorised pass
+
+    Parameters:
+    data_frame (pd.DataFrame): The DataFrame containing prisoner data.
+
+    Returns
+    dict: A dict of all the analysis statistics, identical to analysis.perform_analysis
+    """
+
+    logging.info("Performing fused analysis")
+
+    crime_codes, crimes = factorise(data_frame["crime"])
+    gender_codes, genders = factorise(data_frame["gender"])
+    prison_codes, prisons = factorise(data_frame["prison"])
+    age_bands = age_band_codes(data_frame["age"])
+    sentence_years = data_frame["sentence_years"].to_numpy()
+
+    # Count crime and gender together, every other crime and gender statistic is derived from these counts
+    has_crime_and_gender = valid_codes(crime_codes, gender_codes)
+    crime_gender_codes = (
+        crime_codes[has_crime_and_gender].astype(np.intp) * len(genders)
+        + gender_codes[has_crime_and_gender]
+    )
+    crime_gender_matrix = np.bincount(
+        crime_gender_codes, minlength=len(crimes) * len(genders)
+    ).reshape(len(crimes), len(genders))
+
+    # Sentences are whole years, so the float sums are exact
+    sentence_totals = np.bincount(
+        crime_codes[has_crime_and_gender],
+        weights=sentence_years[has_crime_and_gender],
+        minlength=len(crimes),
+    )
+
+    prison_totals = np.bincount(
+        prison_codes[valid_codes(prison_codes)], minlength=len(prisons)
+    )
+    age_band_totals = np.bincount(
+        age_bands[valid_codes(age_bands)], minlength=len(AGE_BAND_LABELS)
+    )
+
+    crime_gender_counts = {
+        (crimes[crime_code], genders[gender_code]): int(count)
+        for (crime_code, gender_code), count in np.ndenumerate(crime_gender_matrix)
+        if count
+    }
+
+    crime_sentence_totals = {
+        crimes[crime_code]: int(total)
+        for crime_code, total in enumerate(sentence_totals)
+        if crime_gender_matrix[crime_code].any()
+    }
+
+    return analysis_from_aggregates(
+        crime_gender_counts,
+        crime_sentence_totals,
+        {
+            prisons[prison_code]: count
+            for prison_code, count in enumerate(prison_totals.tolist())
+            if count
+        },
+        dict(enumerate(age_band_totals.tolist())),
+    )
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: analysis_sql.py
+Description: This script performs the same analysis as analysis.py but aggregates inside the database,
+             so only one row per group is ever loaded into memory
+Author: Jack Gilmore
+Date: 2024-06-20
+"""
+
+import logging
+import database
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from typing import Optional
+from analysis import analysis_from_aggregates
+from models import (
+    Analysis_Filters,
+    Prisoner,
+    Gender,
+    Crime,
+    Prison,
+    CrimeGenderSummary,
+    PrisonSummary,
+    AgeBandSummary,
+)
+
+
+def filter_conditions(filters: Optional[Analysis_Filters]) -> list:
+    """
+    Builds the WHERE conditions that select the prisoners matching some filters.
+    Names are turned into lookup IDs first so the indexes on the prisoners table can be used.
+
+    Parameters:
+    filters (Analysis_Filters): The filters, or None to select every prisoner.
+
+    Returns:
+    list: The conditions, which all have to be true for a prisoner to match.
+    """
+    if filters is None:
+        return []
+
+    conditions = []
+
+    for values, id_column, lookup_column in [
+        (filters.prison, Prisoner.prison_id, Prison.name),
+        (filters.crime, Prisoner.crime_id, Crime.name),
+        (filters.gender, Prisoner.gender_id, Gender.title),
+    ]:
+        if values is not None:
+            lookup_id = lookup_column.class_.id
+            conditions.append(
+                id_column.in_(select(lookup_id).where(lookup_column.in_(values)))
+            )
+
+    for minimum, maximum, column in [
+        (filters.min_age, filters.max_age, Prisoner.age),
+        (filters.min_sentence, filters.max_sentence, Prisoner.sentence_years),
+    ]:
+        if minimum is not None:
+            conditions.append(column >= minimum)
+        if maximum is not None:
+            conditions.append(column <= maximum)
+
+    return conditions
+
+
+def crime_gender_aggregates(
+    session: Session, filters: Optional[Analysis_Filters] = None
+) -> tuple[dict, dict]:
+    """
+    Counts prisoners and sums sentences for every combination of crime and gender.
+
+    Parameters:
+    session (Session): The database session.
+    filters (Analysis_Filters, optional): Only count prisoners matching these filters. Defaults to every prisoner.
+
+    Returns:
+    tuple[dict, dict]: Prisoner counts keyed by (crime, gender) and sentence totals keyed by crime.
+    """
+    query = (
+        select(
+            Crime.name,
+            Gender.title,
+            func.count(),
+            func.sum(Prisoner.sentence_years),
+        )
+        .select_from(Prisoner)
+        .join(Crime, Prisoner.crime_id == Crime.id)
+        .join(Gender, Prisoner.gender_id == Gender.id)
+        .where(*filter_conditions(filters))
+        .group_by(Crime.name, Gender.title)
+    )
+
+    crime_gender_counts = {}
+    crime_sentence_totals = {}
+
+    for crime, gender, count, sentence_total in session.execute(query):
+        crime_gender_counts[(crime, gender)] = count
+        crime_sentence_totals[crime] = (
+            crime_sentence_totals.get(crime, 0) + sentence_total
+        )
+
+    return crime_gender_counts, crime_sentence_totals
+
+
+def prison_counts(session: Session, filters: Optional[Analysis_Filters] = None) -> dict:
+    """
+    Counts prisoners in each prison.
+
+    Parameters:
+    session (Session): The database session.
+    filters (Analysis_Filters, optional): Only count prisoners matching these filters. Defaults to every prisoner.
+
+    Returns:
+    dict: Prisoner counts keyed by prison name.
+    """
+    query = (
+        select(Prison.name, func.count())
+        .select_from(Prisoner)
+        .join(Prison, Prisoner.prison_id == Prison.id)
+        .where(*filter_conditions(filters))
+        .group_by(Prison.name)
+    )
+
+    return {prison: count for prison, count in session.execute(query)}
+
+
+def age_band_counts(
+    session: Session, filters: Optional[Analysis_Filters] = None
+) -> dict:
+    """
+    Counts prisoners in each age band.
+
+    Parameters:
+    session (Session): The database session.
+    filters (Analysis_Filters, optional): Only count prisoners matching these filters. Defaults to every prisoner.
+
+    Returns:
+    dict: Prisoner counts keyed by index into analysis.AGE_BAND_LABELS.
+    """
+    age_band = database.age_band_expression().label("age_band")
+
+    query = (
+        select(age_band, func.count())
+        .select_from(Prisoner)
+        .where(age_band.isnot(None), *filter_conditions(filters))
+        .group_by(age_band)
+    )
+
+    return {band: count for band, count in session.execute(query)}
+
+
+def sql_aggregates(
+    session: Session, filters: Optional[Analysis_Filters] = None
+) -> tuple[dict, dict, dict, dict]:
+    """
+    Aggregates the prisoners table in the database.
+
+    Parameters:
+    session (Session): The database session.
+    filters (Analysis_Filters, optional): Only count prisoners matching these filters. Defaults to every prisoner.
+
+    Returns:
+    tuple[dict, dict, dict, dict]: The arguments to analysis.analysis_from_aggregates.
+    """
+    crime_gender_counts, crime_sentence_totals = crime_gender_aggregates(
+        session, filters
+    )
+
+    return (
+        crime_gender_counts,
+        crime_sentence_totals,
+        prison_counts(session, filters),
+        age_band_counts(session, filters),
+    )
+
+
+def perform_analysis(filters: Optional[Analysis_Filters] = None) -> dict:
+    """
+    Performs a range of basic analysis on the prisoner dataset by aggregating in the database
+
+    Parameters:
+    filters (Analysis_Filters, optional): Only analyse prisoners matching these filters. Defaults to every prisoner.
+
+    Returns
+    dict: A dict of all the analysis statistics, identical to analysis.perform_analysis
+    """
+
+    logging.info("Performing analysis in database")
+
+    session = database.create_session()
+
+    try:
+        return analysis_from_aggregates(*sql_aggregates(session, filters))
+    finally:
+        session.close()
+
+
+def summary_aggregates(session: Session) -> tuple[dict, dict, dict, dict]:
+    """
+    Reads the aggregates written to the summary tables by database.refresh_summary_tables.
+    Each table only has one row per group, so this is the same amount of work however many prisoners there are.
+
+    Parameters:
+    session (Session): The database session.
+
+    Returns:
+    tuple[dict, dict, dict, dict]: The arguments to analysis.analysis_from_aggregates.
+    """
+    crime_gender_counts = {}
+    crime_sentence_totals = {}
+
+    crime_gender_query = (
+        select(
+            Crime.name,
+            Gender.title,
+            CrimeGenderSummary.prisoner_count,
+            CrimeGenderSummary.sentence_years_total,
+        )
+        .select_from(CrimeGenderSummary)
+        .join(Crime, CrimeGenderSummary.crime_id == Crime.id)
+        .join(Gender, CrimeGenderSummary.gender_id == Gender.id)
+    )
+
+    for crime, gender, count, sentence_total in session.execute(crime_gender_query):
+        crime_gender_counts[(crime, gender)] = count
+        crime_sentence_totals[crime] = (
+            crime_sentence_totals.get(crime, 0) + sentence_total
+        )
+
+    prison_query = (
+        select(Prison.name, PrisonSummary.prisoner_count)
+        .select_from(PrisonSummary)
+        .join(Prison, PrisonSummary.prison_id == Prison.id)
+    )
+
+    age_band_query = select(AgeBandSummary.age_band, AgeBandSummary.prisoner_count)
+
+    return (
+        crime_gender_counts,
+        crime_sentence_totals,
+        {prison: count for prison, count in session.execute(prison_query)},
+        {band: count for band, count in session.execute(age_band_query)},
+    )
+
+
+def perform_summary_analysis() -> dict:
+    """
+    Performs the analysis from the summary tables written when the data was loaded
+
+    Returns
+    dict: A dict of all the analysis statistics, identical to analysis.perform_analysis
+    """
+
+    logging.info("Performing analysis from summary tables")
+
+    session = database.create_session()
+
+    try:
+        return analysis_from_aggregates(*summary_aggregates(session))
+    finally:
+        session.close()
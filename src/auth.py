@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: auth.py
+Description: This script checks API credentials against a pluggable credential store of hashed passwords.
+             Verified credentials are cached for a while, so the slow password hash only runs the first time
+             a user is seen. Run it with a username to hash a password for the credentials file.
+Author: Jack Gilmore
+Date: 2024-07-04
+"""
+
+import abc
+import argparse
+import base64
+import getpass
+import hashlib
+import hmac
+import secrets
+import sys
+from typing import Dict, List, Optional
+from cache import VersionedCache
+
+# Constants
+# Scrypt is memory hard, so it is the default. PBKDF2 is there for hashes made by other tools
+DEFAULT_SCHEME = "scrypt"
+SCRYPT_N = 2**14
+SCRYPT_R = 8
+SCRYPT_P = 1
+PBKDF2_ITERATIONS = 600_000
+SALT_SIZE = 16
+HASH_SIZE = 32
+
+# Verified credentials don't depend on the dataset, so they are all cached under the same version
+CREDENTIALS_CACHE_VERSION = 0
+
+
+def encode_bytes(value: bytes) -> str:
+    return base64.b64encode(value).decode("ascii")
+
+
+def decode_bytes(value: str) -> bytes:
+    return base64.b64decode(value.encode("ascii"))
+
+
+def hash_password(password: str, scheme: str = DEFAULT_SCHEME, **parameters) -> str:
+    """
+    Hashes a password with a random salt
+
+    Parameters:
+    password (str): The password.
+    scheme (str, optional): "scrypt" or "pbkdf2_sha256". Defaults to DEFAULT_SCHEME.
+    parameters: The cost parameters, n, r and p for scrypt or iterations for PBKDF2.
+                Default to the constants above.
+
+    Returns:
+    str: The scheme, cost parameters, salt and hash separated by $, e.g. scrypt$16384$8$1$<salt>$<hash>
+    """
+    salt = secrets.token_bytes(SALT_SIZE)
+
+    if scheme == "scrypt":
+        n = parameters.get("n", SCRYPT_N)
+        r = parameters.get("r", SCRYPT_R)
+        p = parameters.get("p", SCRYPT_P)
+        digest = hashlib.scrypt(
+            password.encode(), salt=salt, n=n, r=r, p=p, dklen=HASH_SIZE
+        )
+
+        return f"scrypt${n}${r}${p}${encode_bytes(salt)}${encode_bytes(digest)}"
+
+    if scheme == "pbkdf2_sha256":
+        iterations = parameters.get("iterations", PBKDF2_ITERATIONS)
+        digest = hashlib.pbkdf2_hmac(
+            "sha256", password.encode(), salt, iterations, dklen=HASH_SIZE
+        )
+
+        return f"pbkdf2_sha256${iterations}${encode_bytes(salt)}${encode_bytes(digest)}"
+
+    raise ValueError(f"Unknown password hashing scheme {scheme!r}")
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """
+    Checks a password against a hash made by hash_password, comparing the hashes in constant time
+
+    Parameters:
+    password (str): The password to check.
+    password_hash (str): The hash to check it against.
+
+    Returns:
+    bool: True if the password matches.
+    """
+    scheme, *fields = password_hash.split("$")
+
+    try:
+        if scheme == "scrypt":
+            n, r, p, salt, expected = fields
+            digest = hashlib.scrypt(
+                password.encode(),
+                salt=decode_bytes(salt),
+                n=int(n),
+                r=int(r),
+                p=int(p),
+                dklen=len(decode_bytes(expected)),
+            )
+        elif scheme == "pbkdf2_sha256":
+            iterations, salt, expected = fields
+            digest = hashlib.pbkdf2_hmac(
+                "sha256",
+                password.encode(),
+                decode_bytes(salt),
+                int(iterations),
+                dklen=len(decode_bytes(expected)),
+            )
+        else:
+            return False
+    except ValueError:
+        # A malformed hash never matches
+        return False
+
+    return hmac.compare_digest(digest, decode_bytes(expected))
+
+
+class CredentialStore(abc.ABC):
+    """
+    Somewhere API users are kept. Subclasses check a user's password however they store it.
+    """
+
+    @abc.abstractmethod
+    def verify(self, username: str, password: str) -> bool:
+        """
+        Checks a user's password. This can be slow, so the API caches the result.
+
+        Parameters:
+        username (str): The username.
+        password (str): The password.
+
+        Returns:
+        bool: True if the user exists and the password is theirs.
+        """
+
+
+class HashedCredentialStore(CredentialStore):
+    """
+    Users with passwords hashed by hash_password, kept in memory
+    """
+
+    def __init__(self, password_hashes: Dict[str, str]):
+        self.password_hashes = dict(password_hashes)
+        self._unknown_user_hash = None
+
+    @classmethod
+    def from_file(cls, path: str) -> "HashedCredentialStore":
+        """
+        Reads users from a file with a username:hash line per user, as printed by running this script.
+        Blank lines and lines starting with # are skipped.
+
+        Parameters:
+        path (str): The path of the credentials file.
+
+        Returns:
+        HashedCredentialStore: The users in the file.
+        """
+        password_hashes = {}
+
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                line = line.strip()
+
+                if not line or line.startswith("#"):
+                    continue
+
+                username, separator, password_hash = line.partition(":")
+
+                if not separator:
+                    raise ValueError(f"Expected username:hash in {path}, got {line!r}")
+
+                password_hashes[username] = password_hash
+
+        return cls(password_hashes)
+
+    def verify(self, username: str, password: str) -> bool:
+        password_hash = self.password_hashes.get(username)
+
+        if password_hash is None:
+            # Hash the password anyway so unknown usernames take as long to reject as wrong passwords
+            if self._unknown_user_hash is None:
+                self._unknown_user_hash = hash_password(secrets.token_hex())
+
+            verify_password(password, self._unknown_user_hash)
+            return False
+
+        return verify_password(password, password_hash)
+
+
+class PlainCredentialStore(CredentialStore):
+    """
+    Users with plain text passwords, for the API_USERNAME and API_PASSWORD set in .env
+    """
+
+    def __init__(self, passwords: Dict[str, str]):
+        self.passwords = dict(passwords)
+
+    def verify(self, username: str, password: str) -> bool:
+        expected = self.passwords.get(username)
+
+        # Compare even for unknown usernames so they take as long to reject as wrong passwords
+        matches = hmac.compare_digest(
+            password.encode(), (expected if expected is not None else "").encode()
+        )
+
+        return expected is not None and matches
+
+
+class Authenticator:
+    """
+    Checks credentials against a credential store, caching the verified ones for a number of seconds.
+    The cache keeps a keyed hash of each password rather than the password itself, and failed attempts
+    aren't cached so guessing passwords always pays for the full hash.
+    """
+
+    def __init__(
+        self,
+        store: CredentialStore,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 300,
+    ):
+        self.store = store
+        self.cache = VersionedCache(max_entries=max_entries, ttl=ttl)
+        # A key that only lives as long as the process, so the cached hashes are no use to anyone else
+        self._key = secrets.token_bytes(32)
+
+    def _password_digest(self, username: str, password: str) -> bytes:
+        return hmac.new(
+            self._key, f"{username}\0{password}".encode(), hashlib.sha256
+        ).digest()
+
+    def is_cached(self, username: str, password: str) -> bool:
+        """
+        Checks if these credentials were verified recently. This is quick enough to run on every request.
+
+        Parameters:
+        username (str): The username.
+        password (str): The password.
+
+        Returns:
+        bool: True if the credentials are cached, False if they need verifying.
+        """
+        password_digest = self._password_digest(username, password)
+
+        # A different password for a cached user counts as a miss, and leaves the verified one cached
+        cached_digest = self.cache.get(
+            CREDENTIALS_CACHE_VERSION,
+            username,
+            matches=lambda digest: hmac.compare_digest(digest, password_digest),
+        )
+
+        return cached_digest is not None
+
+    def verify(self, username: str, password: str) -> bool:
+        """
+        Checks credentials against the store, caching them if they are right.
+        This runs the slow password hash, so run it in the threadpool.
+
+        Parameters:
+        username (str): The username.
+        password (str): The password.
+
+        Returns:
+        bool: True if the credentials are right.
+        """
+        if not self.store.verify(username, password):
+            return False
+
+        self.cache.set(
+            CREDENTIALS_CACHE_VERSION,
+            self._password_digest(username, password),
+            username,
+        )
+
+        return True
+
+    def authenticate(self, username: str, password: str) -> bool:
+        """
+        Checks credentials, using the cache if they were verified recently
+
+        Parameters:
+        username (str): The username.
+        password (str): The password.
+
+        Returns:
+        bool: True if the credentials are right.
+        """
+        return self.is_cached(username, password) or self.verify(username, password)
+
+
+def parse_arguments(args: List[str]) -> argparse.Namespace:
+    """
+    Parses the command line arguments
+
+    Parameters:
+    args: A list of arguments, including the script name
+
+    Returns:
+    argparse.Namespace: The parsed arguments
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Hashes a password and prints a line for the API credentials file"
+    )
+    parser.add_argument("username", help="The API user the password is for")
+    parser.add_argument(
+        "--scheme",
+        choices=["scrypt", "pbkdf2_sha256"],
+        default=DEFAULT_SCHEME,
+        help=f"Password hashing scheme (default: {DEFAULT_SCHEME})",
+    )
+
+    return parser.parse_args(args[1:])
+
+
+def main(args: List[str]) -> None:
+    """
+    Main function that orchestrates the script's functionality.
+
+    Parameters:
+    args: A list of arguments
+    """
+
+    arguments = parse_arguments(args)
+
+    password = getpass.getpass(f"Password for {arguments.username}: ")
+
+    print(f"{arguments.username}:{hash_password(password, arguments.scheme)}")
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: build_static.py
+Description: This script builds the dashboard for production. Assets get content hashed file names so browsers
+             can cache them for good, and compressible files get pre-compressed .br and .gz variants.
+Author: Jack Gilmore
+Date: 2024-07-02
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+from typing import List
+from compression import (
+    STATIC_BUILD_DIRECTORY,
+    STATIC_SOURCE_DIRECTORY,
+    write_compressed_variants,
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s"
+)
+
+# Constants
+MANIFEST_NAME = "manifest.json"
+# Pages that link to the assets, which keep their names so their URLs don't change
+PAGE_NAMES = ("index.html", "404.html")
+HASH_LENGTH = 10
+# Files smaller than this aren't worth compressing
+COMPRESSION_MINIMUM_SIZE = 1024
+COMPRESSIBLE_SUFFIXES = (".html", ".css", ".js", ".map", ".svg", ".json", ".ico", ".txt")
+# Links to local files in src and href attributes, e.g. src="/assets/js/custom-charts.js"
+LOCAL_LINK_PATTERN = re.compile(r'((?:src|href)=["\'])(/[^"\'#?]+)')
+
+
+def hashed_name(path: str, content: bytes) -> str:
+    """
+    Adds a hash of a file's content to its name, e.g. chart.js becomes chart.3f2a9c1d0b.js
+
+    Parameters:
+    path (str): The file path.
+    content (bytes): The file content.
+
+    Returns:
+    str: The path with the content hash before the extension.
+    """
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    root, extension = os.path.splitext(path)
+
+    return f"{root}.{digest}{extension}"
+
+
+def copy_hashed_assets(source: str, output: str) -> dict:
+    """
+    Copies every asset to the build, both under its own name and its content hashed name.
+    The original names stay so links the pages don't control (e.g. source maps or social cards) still work.
+
+    Parameters:
+    source (str): The folder of static files.
+    output (str): The build folder.
+
+    Returns:
+    dict: The hashed URL of each asset, keyed by its original URL.
+    """
+    manifest = {}
+
+    for directory, _, file_names in os.walk(source):
+        for file_name in sorted(file_names):
+            source_path = os.path.join(directory, file_name)
+            relative_path = os.path.relpath(source_path, source)
+
+            with open(source_path, "rb") as file:
+                content = file.read()
+
+            output_path = os.path.join(output, relative_path)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            shutil.copy2(source_path, output_path)
+
+            if relative_path in PAGE_NAMES:
+                continue
+
+            hashed_path = hashed_name(relative_path, content)
+            shutil.copy2(source_path, os.path.join(output, hashed_path))
+
+            url = "/" + relative_path.replace(os.sep, "/")
+            manifest[url] = "/" + hashed_path.replace(os.sep, "/")
+
+    return manifest
+
+
+def rewrite_links(output: str, manifest: dict) -> None:
+    """
+    Points the links in each page at the content hashed assets
+
+    Parameters:
+    output (str): The build folder.
+    manifest (dict): The hashed URL of each asset, keyed by its original URL.
+    """
+
+    def replace_link(match: re.Match) -> str:
+        return match.group(1) + manifest.get(match.group(2), match.group(2))
+
+    for page_name in PAGE_NAMES:
+        page_path = os.path.join(output, page_name)
+
+        if not os.path.isfile(page_path):
+            continue
+
+        with open(page_path, encoding="utf-8") as file:
+            page = file.read()
+
+        with open(page_path, "w", encoding="utf-8") as file:
+            file.write(LOCAL_LINK_PATTERN.sub(replace_link, page))
+
+
+def compress_files(output: str) -> dict:
+    """
+    Pre-compresses every compressible file in the build
+
+    Parameters:
+    output (str): The build folder.
+
+    Returns:
+    dict: The total size of the compressible files and of their variants, keyed by encoding.
+    """
+    totals = {"identity": 0, "br": 0, "gzip": 0}
+
+    for directory, _, file_names in os.walk(output):
+        for file_name in file_names:
+            path = os.path.join(directory, file_name)
+
+            if (
+                not file_name.endswith(COMPRESSIBLE_SUFFIXES)
+                or os.path.getsize(path) < COMPRESSION_MINIMUM_SIZE
+            ):
+                continue
+
+            sizes = write_compressed_variants(path)
+
+            for encoding in totals:
+                # Files that didn't get smaller are sent uncompressed
+                totals[encoding] += sizes.get(encoding, sizes["identity"])
+
+    return totals
+
+
+def build_static(
+    source: str = STATIC_SOURCE_DIRECTORY, output: str = STATIC_BUILD_DIRECTORY
+) -> dict:
+    """
+    Builds the dashboard into a new folder, replacing any previous build
+
+    Parameters:
+    source (str, optional): The folder of static files. Defaults to STATIC_SOURCE_DIRECTORY.
+    output (str, optional): The build folder. Defaults to STATIC_BUILD_DIRECTORY.
+
+    Returns:
+    dict: The hashed URL of each asset, keyed by its original URL.
+    """
+    if os.path.isdir(output):
+        shutil.rmtree(output)
+
+    manifest = copy_hashed_assets(source, output)
+    rewrite_links(output, manifest)
+
+    with open(os.path.join(output, MANIFEST_NAME), "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+
+    totals = compress_files(output)
+
+    logging.info(f"Built {len(manifest)} assets into {output}")
+    logging.info(
+        f"Compressible files: {totals['identity']:,} bytes, "
+        f"{totals['br']:,} with brotli, {totals['gzip']:,} with gzip"
+    )
+
+    return manifest
+
+
+def parse_arguments(args: List[str]) -> argparse.Namespace:
+    """
+    Parses the command line arguments
+
+    Parameters:
+    args: A list of arguments, including the script name
+
+    Returns:
+    argparse.Namespace: The parsed arguments
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Builds the dashboard with content hashed and pre-compressed assets"
+    )
+    parser.add_argument(
+        "--source",
+        default=STATIC_SOURCE_DIRECTORY,
+        help=f"Folder of static files to build (default: {STATIC_SOURCE_DIRECTORY})",
+    )
+    parser.add_argument(
+        "--output",
+        default=STATIC_BUILD_DIRECTORY,
+        help=f"Folder to write the build to, replacing its contents (default: {STATIC_BUILD_DIRECTORY})",
+    )
+
+    return parser.parse_args(args[1:])
+
+
+def main(args: List[str]) -> None:
+    """
+    Main function that orchestrates the script's functionality.
+
+    Parameters:
+    args: A list of arguments
+    """
+
+    arguments = parse_arguments(args)
+
+    build_static(arguments.source, arguments.output)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: cache.py
+Description: This script contains in-process caches used by the API
+Author: Jack Gilmore
+Date: 2024-06-20
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class VersionedCache:
+    """
+    A bounded cache whose entries are only valid for a single dataset version of a single database.
+    Storing a value for a newer version, or for another database's token, discards everything cached before,
+    reading with them is a miss.
+    Entries can also expire after a number of seconds, and hits, misses and evictions are counted for monitoring.
+    """
+
+    def __init__(self, max_entries: int = 64, ttl: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._version = None
+        self._token = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        version: int,
+        key: Hashable = None,
+        matches: Optional[Callable[[Any], bool]] = None,
+        token: Hashable = None,
+    ) -> Optional[Any]:
+        """
+        Gets a cached value for a dataset version.
+
+        Parameters:
+        version (int): The current dataset version.
+        key (Hashable, optional): The key of the value within the version. Defaults to None.
+        matches (Callable, optional): Checks the cached value is the one wanted. If it isn't, the value is kept
+                                      but the lookup counts as a miss. Defaults to accepting any value.
+        token (Hashable, optional): The token of the database the version is of. Defaults to None.
+
+        Returns:
+        Any: The cached value or None if it isn't cached or doesn't match.
+        """
+
+        with self._lock:
+            entry = (
+                self._entries.get(key)
+                if (token, version) == (self._token, self._version)
+                else None
+            )
+
+            if entry is not None and self._has_expired(entry):
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+
+            if entry is None or (matches is not None and not matches(entry[0])):
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry[0]
+
+    def set(
+        self, version: int, value: Any, key: Hashable = None, token: Hashable = None
+    ) -> None:
+        """
+        Caches a value for a dataset version.
+
+        Parameters:
+        version (int): The dataset version the value was computed from.
+        value (Any): The value to cache.
+        key (Hashable, optional): The key of the value within the version. Defaults to None.
+        token (Hashable, optional): The token of the database the version is of. Defaults to None.
+        """
+
+        with self._lock:
+            if (
+                self._version is not None
+                and token == self._token
+                and version < self._version
+            ):
+                # Don't let a slow request for an old version evict newer results.
+                # Versions of another database can't be compared, so its values always replace these
+                return
+
+            if (token, version) != (self._token, self._version):
+                self._entries.clear()
+                self._version = version
+                self._token = token
+
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        """
+        Removes every cached value.
+        """
+
+        with self._lock:
+            self._entries.clear()
+            self._version = None
+            self._token = None
+
+    def stats(self) -> dict:
+        """
+        Gets the size of the cache and how well it is working.
+
+        Returns:
+        dict: The number of entries, the most entries allowed, and the hits, misses and evictions so far.
+              Evictions count entries removed to make room or because they expired, not ones discarded
+              because the dataset version changed.
+        """
+
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _has_expired(self, entry: tuple) -> bool:
+        return self.ttl is not None and time.monotonic() - entry[1] >= self.ttl
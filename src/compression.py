@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: compression.py
+Description: This script compresses API responses with brotli or gzip and serves the dashboard's
+             pre-compressed static files, picking whichever encoding the client accepts
+Author: Jack Gilmore
+Date: 2024-07-02
+"""
+
+import gzip
+import os
+import re
+import zlib
+import brotli
+from typing import Optional
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Encodings we can compress with, most preferred first, and the file suffix of their pre-compressed variants
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+# Only these types are worth compressing, images other than SVG and fonts are compressed already
+COMPRESSIBLE_MEDIA_TYPES = (
+    "text/",
+    "application/json",
+    "application/javascript",
+    "application/x-ndjson",
+    "application/xml",
+    "image/svg+xml",
+    "image/x-icon",
+    "image/vnd.microsoft.icon",
+)
+
+# Compression levels for responses built on every request, chosen for speed over the smallest size
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+
+# The dashboard's static files, and where build_static.py writes the hashed and pre-compressed copy of them
+STATIC_SOURCE_DIRECTORY = "static"
+STATIC_BUILD_DIRECTORY = "static_build"
+
+# Files written by build_static.py have a content hash in their name, e.g. chart.3f2a9c1d0b.js
+HASHED_NAME_PATTERN = re.compile(r"\.[0-9a-f]{10}\.[^./]+$")
+
+# Hashed files never change so browsers can keep them for a year, anything else is checked every time
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def write_compressed_variants(path: str) -> dict:
+    """
+    Writes the .br and .gz variants of a file at maximum compression, keeping only those that are smaller.
+    Each variant is replaced atomically, and a variant left over from a previous version of the file is removed
+    if the new version doesn't compress.
+
+    Parameters:
+    path (str): The file to compress.
+
+    Returns:
+    dict: The size of the file and of each variant written, keyed by encoding ("identity" for the file itself).
+    """
+    with open(path, "rb") as file:
+        content = file.read()
+
+    variants = {
+        "br": brotli.compress(content, quality=11),
+        # A fixed mtime so the same content always gives the same file
+        "gzip": gzip.compress(content, compresslevel=9, mtime=0),
+    }
+    sizes = {"identity": len(content)}
+
+    for encoding, compressed in variants.items():
+        variant_path = path + ENCODING_SUFFIXES[encoding]
+
+        if len(compressed) >= len(content):
+            if os.path.isfile(variant_path):
+                os.remove(variant_path)
+            continue
+
+        temporary_path = f"{variant_path}.{os.getpid()}.tmp"
+
+        with open(temporary_path, "wb") as file:
+            file.write(compressed)
+
+        os.replace(temporary_path, variant_path)
+        sizes[encoding] = len(compressed)
+
+    return sizes
+
+
+def accepted_encodings(accept_encoding: str) -> list[str]:
+    """
+    Gets the encodings we can use for a request, most preferred first
+
+    Parameters:
+    accept_encoding (str): The Accept-Encoding header value.
+
+    Returns:
+    list[str]: The encodings from ENCODING_SUFFIXES the client accepts, in our order of preference.
+    """
+    accepted = set()
+
+    for part in accept_encoding.lower().split(","):
+        name, _, parameters = part.partition(";")
+        parameters = parameters.strip()
+
+        try:
+            quality = float(parameters[2:]) if parameters.startswith("q=") else 1.0
+        except ValueError:
+            quality = 0.0
+
+        # q=0 means the client refuses that encoding
+        if quality > 0:
+            accepted.add(name.strip())
+
+    return [encoding for encoding in ENCODING_SUFFIXES if encoding in accepted]
+
+
+def is_compressible(media_type: Optional[str]) -> bool:
+    """
+    Checks if a response with a media type is worth compressing
+
+    Parameters:
+    media_type (str): The Content-Type header value, if any.
+
+    Returns:
+    bool: True if the response is text-like.
+    """
+    return bool(media_type) and media_type.lower().startswith(COMPRESSIBLE_MEDIA_TYPES)
+
+
+class Compressor:
+    """
+    Incrementally compresses a response body with gzip or brotli
+    """
+
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+            self._process = compressor.process
+            self._finish = compressor.finish
+        else:
+            # wbits of 31 writes a gzip header and trailer around the deflate stream
+            compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            self._process = compressor.compress
+            self._finish = compressor.flush
+
+    def compress(self, data: bytes, last: bool = False) -> bytes:
+        """
+        Compresses the next piece of the body
+
+        Parameters:
+        data (bytes): The next piece of the body.
+        last (bool, optional): True if this is the end of the body. Defaults to False.
+
+        Returns:
+        bytes: The compressed data that is ready to send, which may be empty until enough has been written.
+        """
+        compressed = self._process(data) if data else b""
+
+        return compressed + self._finish() if last else compressed
+
+
+class CompressionMiddleware:
+    """
+    Compresses text responses over a minimum size with brotli or gzip, whichever the client prefers.
+    Streamed responses are compressed as they are sent. Responses that already have a Content-Encoding,
+    like the pre-compressed static files, are sent as they are.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1000):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        encodings = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+
+        if not encodings:
+            await self.app(scope, receive, send)
+            return
+
+        responder = CompressionResponder(send, encodings[0], self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressionResponder:
+    """
+    Wraps the ASGI send function for a single response, compressing the body if it is worth it
+    """
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            # Hold on to the headers until we know if the body will be compressed
+            self.start_message = message
+            headers = Headers(raw=message["headers"])
+            self.passthrough = "content-encoding" in headers or not is_compressible(
+                headers.get("content-type")
+            )
+
+            if self.passthrough:
+                await self._send(message)
+
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            headers = MutableHeaders(raw=self.start_message["headers"])
+            headers.add_vary_header("Accept-Encoding")
+
+            if len(body) < self.minimum_size and not more_body:
+                # Small responses aren't worth the time it takes to compress them
+                self.passthrough = True
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+
+            self.compressor = Compressor(self.encoding)
+            headers["Content-Encoding"] = self.encoding
+
+            if more_body:
+                del headers["Content-Length"]
+
+            body = self.compressor.compress(body, last=not more_body)
+
+            if not more_body:
+                headers["Content-Length"] = str(len(body))
+
+            await self._send(self.start_message)
+        else:
+            body = self.compressor.compress(body, last=not more_body)
+
+        await self._send({**message, "body": body})
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """
+    Serves static files, sending the .br or .gz variant written by write_compressed_variants instead
+    if there is one and the client accepts it. Files with a content hash in their name are cached by browsers
+    for a year, everything else is revalidated with its ETag on every request.
+    """
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        request_headers = Headers(scope=scope)
+
+        if isinstance(response, FileResponse) and response.status_code == 200:
+            response = self.get_encoded_response(response, request_headers)
+
+        if response.status_code in (200, 304):
+            response.headers["Cache-Control"] = (
+                IMMUTABLE_CACHE_CONTROL
+                if HASHED_NAME_PATTERN.search(path)
+                else REVALIDATE_CACHE_CONTROL
+            )
+            # Every file could have compressed variants, so caches need to keep them apart
+            response.headers.add_vary_header("Accept-Encoding")
+
+        return response
+
+    def get_encoded_response(
+        self, response: FileResponse, request_headers: Headers
+    ) -> Response:
+        """
+        Swaps a file response for its most preferred pre-compressed variant the client accepts
+
+        Parameters:
+        response (FileResponse): The response for the uncompressed file.
+        request_headers (Headers): The request headers.
+
+        Returns:
+        Response: The response for the variant, a 304 if the client already has it,
+                  or the original response if there isn't a variant the client accepts.
+        """
+        for encoding in accepted_encodings(request_headers.get("accept-encoding", "")):
+            variant_path = response.path + ENCODING_SUFFIXES[encoding]
+
+            if not os.path.isfile(variant_path):
+                continue
+
+            variant = FileResponse(
+                variant_path,
+                media_type=response.media_type,
+                headers={"Content-Encoding": encoding},
+                stat_result=os.stat(variant_path),
+            )
+
+            if self.is_not_modified(variant.headers, request_headers):
+                return NotModifiedResponse(variant.headers)
+
+            return variant
+
+        return response
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: dashboard_data.py
+Description: This script writes the analysis the dashboard shows to a static JSON file when the data is loaded,
+             so the unfiltered dashboard is served as a cacheable file without any work by the API
+Author: Jack Gilmore
+Date: 2024-07-03
+"""
+
+import logging
+import os
+import orjson
+from typing import Optional
+from compression import ENCODING_SUFFIXES, write_compressed_variants
+from responses import JSON_OPTIONS
+
+# Constants
+DASHBOARD_DATA_DIRECTORY = os.getenv("DASHBOARD_DATA_DIRECTORY", "dashboard_data")
+ANALYSIS_FILE_NAME = "analysis.json"
+
+
+def write_analysis(
+    analysis_result: dict,
+    dataset_token: str,
+    dataset_version: int,
+    directory: str = DASHBOARD_DATA_DIRECTORY,
+) -> str:
+    """
+    Writes the analysis to a JSON file along with the database token and dataset version it was computed from,
+    plus its pre-compressed variants. The file is replaced atomically so the API never serves half of it.
+
+    Parameters:
+    analysis_result (dict): The analysis, in the same shape /api/analysis returns.
+    dataset_token (str): The token of the database the analysis was computed from.
+    dataset_version (int): The dataset version the analysis was computed from.
+    directory (str, optional): The folder to write to. Defaults to DASHBOARD_DATA_DIRECTORY.
+
+    Returns:
+    str: The path of the JSON file.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    path = os.path.join(directory, ANALYSIS_FILE_NAME)
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+
+    with open(temporary_path, "wb") as file:
+        file.write(
+            orjson.dumps(
+                {
+                    **analysis_result,
+                    "dataset_token": dataset_token,
+                    "dataset_version": dataset_version,
+                },
+                option=JSON_OPTIONS,
+            )
+        )
+
+    os.replace(temporary_path, path)
+    write_compressed_variants(path)
+
+    logging.info(f"Wrote the dashboard analysis for dataset version {dataset_version} to {path}")
+
+    return path
+
+
+def remove_analysis(directory: str = DASHBOARD_DATA_DIRECTORY) -> None:
+    """
+    Removes the analysis and its pre-compressed variants, so the dashboard asks the API instead of showing
+    an analysis of an older dataset
+
+    Parameters:
+    directory (str, optional): The folder the analysis is in. Defaults to DASHBOARD_DATA_DIRECTORY.
+    """
+    path = os.path.join(directory, ANALYSIS_FILE_NAME)
+    paths = [path] + [path + suffix for suffix in ENCODING_SUFFIXES.values()]
+
+    for variant_path in paths:
+        if os.path.isfile(variant_path):
+            os.remove(variant_path)
+            logging.info(f"Removed the dashboard analysis at {variant_path}")
+
+
+def get_analysis_token_and_version(
+    directory: str = DASHBOARD_DATA_DIRECTORY,
+) -> Optional[tuple[str, int]]:
+    """
+    Gets the database token and dataset version the dashboard analysis was written from
+
+    Parameters:
+    directory (str, optional): The folder the analysis is in. Defaults to DASHBOARD_DATA_DIRECTORY.
+
+    Returns:
+    tuple[str, int]: The token and dataset version, or None if the analysis hasn't been written or has no token.
+    """
+    path = os.path.join(directory, ANALYSIS_FILE_NAME)
+
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as file:
+        analysis_result = orjson.loads(file.read())
+
+    # Analyses written before they recorded their database's token can't be matched to it
+    if "dataset_token" not in analysis_result:
+        return None
+
+    return analysis_result["dataset_token"], analysis_result["dataset_version"]
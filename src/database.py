@@ -8,119 +8,1005 @@ Date: 2024-06-13
 """
 
 import logging
+import os
+import threading
+import time
+import uuid
+from collections import namedtuple
+import numpy as np
 import pandas as pd
 import sqlalchemy
-from sqlalchemy import create_engine, event
-from sqlalchemy.engine import Engine
+from typing import Iterable, Iterator, Optional, Union
+from dotenv import load_dotenv
+from sqlalchemy import (
+    bindparam,
+    event,
+    insert,
+    update,
+    delete,
+    select,
+    func,
+    case,
+    MetaData,
+    Select,
+    Row,
+    Table,
+)
+from sqlalchemy.engine import URL, Connection, Engine, make_url
+from sqlalchemy.schema import CreateTable
 from sqlalchemy.orm import sessionmaker, Session, joinedload
-from models import Prisoner, Gender, Crime, Prison, Base
+from sqlalchemy.exc import OperationalError
+from analysis import AGE_BAND_EDGES
+from cache import VersionedCache
+from diagnostics import log_frame
+from models import (
+    Prisoner,
+    Gender,
+    Crime,
+    Prison,
+    DatasetVersion,
+    CrimeGenderSummary,
+    PrisonSummary,
+    AgeBandSummary,
+    Base,
+)
+
+# Load environment variables from .env file so database settings apply to every script
+load_dotenv()
 
 # Constants
-DB_CONNECTION_STRING = "sqlite:///database.db"
+DB_CONNECTION_STRING = os.getenv("DB_CONNECTION_STRING", "sqlite:///database.db")
+DATASET_VERSION_ROW_ID = 1
+PRISONER_COLUMNS = (
+    "prisoner_id",
+    "name",
+    "age",
+    "gender",
+    "crime",
+    "sentence_years",
+    "prison",
+)
+PRISONER_TABLE_COLUMNS = (
+    "prisoner_id",
+    "name",
+    "age",
+    "gender_id",
+    "crime_id",
+    "sentence_years",
+    "prison_id",
+)
+
+# A prisoner read for the API, with its lookup values resolved from the dimension cache
+PrisonerRow = namedtuple("PrisonerRow", PRISONER_COLUMNS)
+
+# Prisoner data columns with few distinct values, stored as categoricals in DataFrames
+PRISONER_CATEGORY_COLUMNS = ("gender", "crime", "prison")
+# Prisoner data columns stored as the smallest integer type that fits in DataFrames
+PRISONER_INTEGER_COLUMNS = ("prisoner_id", "age", "sentence_years")
+
+# New prisoners are loaded into this table, then swapped in for the prisoners table once they are all in
+PRISONER_STAGING_TABLE_NAME = "prisoners_staging"
+
+# SQLite limits how many parameters a query can have so long IN lists are split up
+SQL_IN_CHUNK_SIZE = 500
+
+# Lookup tables keyed by the prisoner data column they normalise
+LOOKUP_COLUMNS = {
+    "gender": Gender.title,
+    "crime": Crime.name,
+    "prison": Prison.name,
+}
+
+# How many seconds a dataset version can be reused before checking the database for new data
+DATASET_VERSION_MAX_AGE = float(os.getenv("DATASET_VERSION_MAX_AGE", "2"))
+
+# The lookup tables only change when data is loaded, so their values are cached per dataset token and version
+# and prisoner reads for the API don't have to join them
+dimension_cache = VersionedCache(max_entries=1)
+
+# How many prisoners are inserted per transaction when loading data
+LOAD_BATCH_SIZE = int(os.getenv("DB_LOAD_BATCH_SIZE", "50000"))
+
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# SQLite pragmas applied once to every new pooled connection
+SQLITE_PRAGMAS = {
+    "foreign_keys": "ON",
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),  # Negative values are KiB
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", "268435456"),
+}
+
+# The process wide engine and session factory, see init_engine
+_engine = None
+_session_factory = None
+_engine_lock = threading.RLock()
+
+# Last dataset token and version read from the database and when they were read
+_dataset_version_memo = {"version": None, "token": None, "read_at": 0.0}
+
+
+def _apply_sqlite_pragmas(dbapi_con, con_record):
+    """
+    Configures a new SQLite connection, including making sure foreign keys are enforced
+    """
+
+    cursor = dbapi_con.cursor()
+
+    try:
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+    finally:
+        cursor.close()
+
+
+def _disable_pysqlite_transactions(dbapi_con, con_record):
+    """
+    Stops the sqlite3 module starting transactions itself. It only starts them before INSERT, UPDATE and DELETE,
+    so schema changes would be committed straight away. _begin_sqlite_transaction starts them instead.
+    """
 
+    dbapi_con.isolation_level = None
 
-def _fk_pragma_on_connect(dbapi_con, con_record):
+
+def _begin_sqlite_transaction(connection: Connection):
     """
-    Ensure enforcement of foreign keys
+    Starts a transaction on SQLite whenever SQLAlchemy begins one, so schema changes can be rolled back too
     """
 
-    dbapi_con.execute("pragma foreign_keys=ON")
+    connection.exec_driver_sql("BEGIN")
 
 
-def create_engine() -> Engine:
+def get_pool_options(url: URL) -> dict:
     """
-    Creates and returns a new SQLAlchemy engine.
+    Gets the connection pool settings for an engine
+
+    Parameters:
+    url (URL): The database URL.
+
+    Returns:
+    dict: Keyword arguments for create_engine.
+    """
+
+    # In-memory SQLite databases use a single connection so can't be pooled
+    if url.database in (None, "", ":memory:"):
+        return {}
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+
+
+def create_engine(connection_string: str = None) -> Engine:
+    """
+    Creates and returns a new SQLAlchemy engine with a configured connection pool.
+    Most callers should use get_engine instead so connections are shared.
+
+    Parameters:
+    connection_string (str, optional): The database URL. Defaults to DB_CONNECTION_STRING.
 
     Returns:
     Engine: The SQLAlchemy engine.
     """
-    engine = sqlalchemy.create_engine(
-        DB_CONNECTION_STRING,
-    )
+    url = make_url(connection_string or DB_CONNECTION_STRING)
+
+    engine = sqlalchemy.create_engine(url, **get_pool_options(url))
+
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine, "connect", _apply_sqlite_pragmas)
+        event.listen(engine, "connect", _disable_pysqlite_transactions)
+        event.listen(engine, "begin", _begin_sqlite_transaction)
+
+    return engine
+
+
+def init_engine(connection_string: str = None) -> Engine:
+    """
+    Creates the process wide engine and session factory, replacing any existing ones.
+    The API calls this on startup, everything else creates it on first use.
+
+    Parameters:
+    connection_string (str, optional): The database URL. Defaults to DB_CONNECTION_STRING.
+
+    Returns:
+    Engine: The SQLAlchemy engine.
+    """
+    global _engine, _session_factory
+
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
 
-    # Make sure foreign keys are enforced
-    event.listen(engine, "connect", _fk_pragma_on_connect)
+        _engine = create_engine(connection_string)
+        _session_factory = sessionmaker(bind=_engine)
+        _dataset_version_memo["version"] = None
+        dimension_cache.clear()
 
-    return sqlalchemy.create_engine(DB_CONNECTION_STRING)
+        logging.info(f"Database engine created for {_engine.url}")
+
+        return _engine
+
+
+def get_engine() -> Engine:
+    """
+    Gets the process wide engine, creating it if it doesn't exist yet.
+
+    Returns:
+    Engine: The SQLAlchemy engine.
+    """
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                init_engine()
+
+    return _engine
+
+
+def dispose_engine() -> None:
+    """
+    Closes every pooled connection and discards the process wide engine.
+    """
+    global _engine, _session_factory
+
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+
+        _engine = None
+        _session_factory = None
 
 
 def create_session() -> Session:
     """
-    Creates and returns a new SQLAlchemy session.
+    Creates and returns a new SQLAlchemy session using a pooled connection.
 
     Returns:
     Session: A new SQLAlchemy session.
     """
 
-    db_engine = create_engine()
-    Session = sessionmaker(bind=db_engine)
-    return Session()
+    get_engine()
+    return _session_factory()
 
 
 def load_data_frame_to_database(data_frame: pd.DataFrame) -> None:
     """
-    Loads the DataFrame into an SQLite database file
+    Loads the DataFrame into an SQLite database file, replacing any prisoners already loaded
 
     Parameters:
     data_frame (pd.DataFrame): The DataFrame containing prisoner data.
     """
 
-    db_engine = create_engine()
+    load_data_frames_to_database([data_frame])
+
+
+def load_data_frames_to_database(
+    data_frames: Iterable[pd.DataFrame], batch_size: int = LOAD_BATCH_SIZE
+) -> int:
+    """
+    Loads chunks of prisoner data into the database, replacing any prisoners already loaded.
+    Only one chunk is held in memory at a time, so the dataset can be much larger than memory.
+    The prisoners are loaded into a staging table and swapped in at the end, so if reading the data fails
+    part way through, the prisoners already loaded and the dataset version are left as they were.
+
+    Parameters:
+    data_frames (Iterable[pd.DataFrame]): Chunks of prisoner data with the columns from load_data.data_to_pandas.
+    batch_size (int, optional): The number of prisoners inserted per transaction. Defaults to LOAD_BATCH_SIZE.
+
+    Returns:
+    int: The number of prisoners loaded.
+    """
+
+    db_engine = get_engine()
 
     Base.metadata.create_all(db_engine)
 
-    session = create_session()
+    # Its indexes are built once all the prisoners are in, which is quicker than updating them on every insert
+    with db_engine.begin() as connection:
+        add_dataset_version_token(connection)
+        prisoner_staging_table.drop(connection, checkfirst=True)
+        connection.execute(CreateTable(prisoner_staging_table))
+
+        lookup_ids = {
+            column: get_lookup_ids(connection, column) for column in LOOKUP_COLUMNS
+        }
+
+    prisoner_count = 0
 
     try:
-        # Load Genders
-        genders = data_frame["gender"].unique()
-        for gender in genders:
-            gender_record = Gender(title=gender)
-            session.add(gender_record)
-        session.commit()
-
-        # Load Crimes
-        crimes = data_frame["crime"].unique()
-        for crime in crimes:
-            crime_record = Crime(name=crime)
-            session.add(crime_record)
-        session.commit()
-
-        # Load Prisons
-        prisons = data_frame["prison"].unique()
-        for prison in prisons:
-            prison_record = Prison(name=prison)
-            session.add(prison_record)
-        session.commit()
-
-        # Map IDs
-        gender_map = {g.title: g.id for g in session.query(Gender).all()}
-        crime_map = {c.name: c.id for c in session.query(Crime).all()}
-        prison_map = {p.name: p.id for p in session.query(Prison).all()}
-
-        # Prepare prisoner data with mapped IDs
-        prisoner_data = []
-        for _, row in data_frame.iterrows():
-            prisoner_data.append(
-                {
-                    "prisoner_id": row["prisoner_id"],
-                    "name": row["name"],
-                    "age": row["age"],
-                    "gender_id": gender_map[row["gender"]],
-                    "crime_id": crime_map[row["crime"]],
-                    "sentence_years": row["sentence_years"],
-                    "prison_id": prison_map[row["prison"]],
-                }
+        for data_frame in data_frames:
+            for start in range(0, len(data_frame), batch_size):
+                batch = data_frame.iloc[start : start + batch_size]
+
+                with db_engine.begin() as connection:
+                    insert_prisoners(
+                        connection,
+                        to_prisoner_table_frame(connection, batch, lookup_ids),
+                        prisoner_staging_table,
+                    )
+
+                prisoner_count += len(batch)
+
+            logging.info(f"Loaded {prisoner_count} prisoners")
+
+        # Swap the new prisoners in, summarise them and let readers know the dataset has changed, all at once
+        with db_engine.begin() as connection:
+            Prisoner.__table__.drop(connection, checkfirst=True)
+            connection.exec_driver_sql(
+                f"ALTER TABLE {PRISONER_STAGING_TABLE_NAME} RENAME TO {Prisoner.__tablename__}"
             )
+            create_prisoner_indexes(connection)
+            refresh_summary_tables(connection)
+            bump_dataset_version(connection)
+    finally:
+        # Only left over if loading failed, the swap renames it otherwise
+        with db_engine.begin() as connection:
+            prisoner_staging_table.drop(connection, checkfirst=True)
+
+    return prisoner_count
+
+
+def create_prisoner_staging_table() -> Table:
+    """
+    Builds a copy of the prisoners table definition to load new prisoners into.
+    It lives in its own MetaData, with the lookup tables its foreign keys point at, so create_all ignores it.
+
+    Returns:
+    Table: The staging table, with the same columns and keys as the prisoners table.
+    """
+    metadata = MetaData()
+
+    for lookup_column in LOOKUP_COLUMNS.values():
+        lookup_column.class_.__table__.to_metadata(metadata)
+
+    return Prisoner.__table__.to_metadata(metadata, name=PRISONER_STAGING_TABLE_NAME)
+
+
+prisoner_staging_table = create_prisoner_staging_table()
+
+
+def get_lookup_ids(connection: Connection, column: str) -> dict:
+    """
+    Reads the IDs of every value in a lookup table
+
+    Parameters:
+    connection (Connection): The database connection.
+    column (str): The prisoner data column the lookup table is for, one of LOOKUP_COLUMNS.
+
+    Returns:
+    dict: IDs keyed by the lookup value.
+    """
+    lookup_column = LOOKUP_COLUMNS[column]
+    lookup_table = lookup_column.class_.__table__
+
+    return {
+        value: lookup_id
+        for lookup_id, value in connection.execute(
+            select(lookup_table.c.id, lookup_column)
+        )
+    }
+
+
+def map_lookup_ids(
+    connection: Connection, column: str, values: pd.Series, known_ids: dict
+) -> np.ndarray:
+    """
+    Maps lookup values to their IDs, creating lookup rows for any values that haven't been seen before.
+    Each distinct value is only looked up once no matter how many rows share it.
+
+    Parameters:
+    connection (Connection): The database connection.
+    column (str): The prisoner data column the lookup table is for, one of LOOKUP_COLUMNS.
+    values (pd.Series): The lookup values for each prisoner.
+    known_ids (dict): IDs keyed by lookup value. Updated in place with any newly created values.
+
+    Returns:
+    np.ndarray: The lookup ID for each prisoner.
+    """
+    codes, uniques = pd.factorize(values)
+
+    if (codes == -1).any():
+        raise ValueError(f"Prisoner data has missing {column} values")
+
+    new_values = [value for value in uniques if value not in known_ids]
+
+    if new_values:
+        lookup_column = LOOKUP_COLUMNS[column]
+        connection.execute(
+            insert(lookup_column.class_.__table__),
+            [{lookup_column.key: value} for value in new_values],
+        )
+        known_ids.update(get_lookup_ids(connection, column))
+
+    unique_ids = np.array([known_ids[value] for value in uniques], dtype=np.int64)
+
+    return unique_ids[codes]
+
+
+def to_prisoner_table_frame(
+    connection: Connection, data_frame: pd.DataFrame, lookup_ids: dict
+) -> pd.DataFrame:
+    """
+    Converts prisoner data into the shape of the prisoners table, with lookup values replaced by their IDs
+
+    Parameters:
+    connection (Connection): The database connection.
+    data_frame (pd.DataFrame): The prisoner data with the columns from load_data.data_to_pandas.
+    lookup_ids (dict): Known lookup IDs keyed by prisoner data column, then by value.
 
-        prisoners_df = pd.DataFrame(prisoner_data)
+    Returns:
+    pd.DataFrame: The prisoner data with PRISONER_TABLE_COLUMNS columns.
+    """
+
+    table_frame = pd.DataFrame(
+        {
+            "prisoner_id": data_frame["prisoner_id"].to_numpy(),
+            "name": data_frame["name"].to_numpy(),
+            "age": data_frame["age"].to_numpy(),
+            "sentence_years": data_frame["sentence_years"].to_numpy(),
+        }
+    )
 
-        prisoners_df.to_sql(
-            name="prisoners", con=db_engine, if_exists="replace", index=False
+    for column in LOOKUP_COLUMNS:
+        table_frame[f"{column}_id"] = map_lookup_ids(
+            connection, column, data_frame[column], lookup_ids[column]
         )
+
+    return table_frame[list(PRISONER_TABLE_COLUMNS)]
+
+
+def _table_frame_to_parameters(table_frame: pd.DataFrame) -> list:
+    """
+    Converts table rows to a list of dictionaries, keyed by column, ready for executemany
+    """
+
+    columns = list(table_frame.columns)
+
+    # The DBAPI can't bind numpy scalars so convert whole columns to Python objects at once
+    return [
+        dict(zip(columns, values))
+        for values in zip(*(table_frame[column].tolist() for column in columns))
+    ]
+
+
+def insert_prisoners(
+    connection: Connection,
+    table_frame: pd.DataFrame,
+    table: Table = Prisoner.__table__,
+) -> None:
+    """
+    Inserts prisoners with a single executemany call
+
+    Parameters:
+    connection (Connection): The database connection.
+    table_frame (pd.DataFrame): The prisoners to insert, from to_prisoner_table_frame.
+    table (Table, optional): The table to insert into. Defaults to the prisoners table.
+    """
+
+    connection.execute(insert(table), _table_frame_to_parameters(table_frame))
+
+
+def update_prisoners(connection: Connection, table_frame: pd.DataFrame) -> None:
+    """
+    Updates existing prisoners by prisoner_id with a single executemany call
+
+    Parameters:
+    connection (Connection): The database connection.
+    table_frame (pd.DataFrame): The prisoners to update, from to_prisoner_table_frame.
+    """
+
+    table = Prisoner.__table__
+
+    # The other columns are set from the parameters with their names, so the ID is bound under another name
+    statement = update(table).where(
+        table.c.prisoner_id == bindparam("match_prisoner_id")
+    )
+
+    connection.execute(
+        statement,
+        _table_frame_to_parameters(
+            table_frame.rename(columns={"prisoner_id": "match_prisoner_id"})
+        ),
+    )
+
+
+def get_existing_prisoners(connection: Connection, prisoner_ids: list) -> pd.DataFrame:
+    """
+    Reads the stored prisoners table rows for a list of prisoner IDs
+
+    Parameters:
+    connection (Connection): The database connection.
+    prisoner_ids (list): The prisoner IDs to read.
+
+    Returns:
+    pd.DataFrame: The stored rows indexed by prisoner_id. Missing IDs are left out.
+    """
+
+    prisoner_table = Prisoner.__table__
+    rows = []
+
+    for id_chunk in chunked(prisoner_ids, SQL_IN_CHUNK_SIZE):
+        rows += connection.execute(
+            select(*(prisoner_table.c[column] for column in PRISONER_TABLE_COLUMNS)).where(
+                prisoner_table.c.prisoner_id.in_(id_chunk)
+            )
+        ).all()
+
+    return pd.DataFrame(rows, columns=list(PRISONER_TABLE_COLUMNS)).set_index(
+        "prisoner_id"
+    )
+
+
+def upsert_data_frames_to_database(
+    data_frames: Iterable[pd.DataFrame],
+    batch_size: int = LOAD_BATCH_SIZE,
+    dry_run: bool = False,
+) -> dict:
+    """
+    Incrementally loads chunks of prisoner data: new prisoners are inserted, changed prisoners are updated
+    and unchanged prisoners aren't written at all. Prisoners missing from the data are left as they are.
+
+    Parameters:
+    data_frames (Iterable[pd.DataFrame]): Chunks of prisoner data with the columns from load_data.data_to_pandas.
+    batch_size (int, optional): The number of prisoners compared per transaction. Defaults to LOAD_BATCH_SIZE.
+    dry_run (bool, optional): Work out what would change without writing anything. Defaults to False.
+
+    Returns:
+    dict: The number of prisoners "inserted", "updated" and "unchanged".
+    """
+
+    db_engine = get_engine()
+
+    # Databases loaded before the summary tables existed need them filling in even if no prisoners change
+    has_summary_tables = sqlalchemy.inspect(db_engine).has_table(
+        CrimeGenderSummary.__tablename__
+    )
+
+    Base.metadata.create_all(db_engine)
+
+    with db_engine.begin() as connection:
+        # Databases loaded before the prisoners table had indexes, or the dataset version a token, get them added
+        create_prisoner_indexes(connection)
+        add_dataset_version_token(connection)
+
+        lookup_ids = {
+            column: get_lookup_ids(connection, column) for column in LOOKUP_COLUMNS
+        }
+
+    counts = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    for data_frame in data_frames:
+        for start in range(0, len(data_frame), batch_size):
+            batch = data_frame.iloc[start : start + batch_size]
+
+            with db_engine.connect() as connection:
+                transaction = connection.begin()
+
+                incoming = to_prisoner_table_frame(connection, batch, lookup_ids)
+                existing = get_existing_prisoners(
+                    connection, incoming["prisoner_id"].tolist()
+                )
+
+                is_new = ~incoming["prisoner_id"].isin(existing.index)
+                new_prisoners = incoming[is_new]
+
+                # Compare the remaining prisoners against what's stored, column by column
+                matched = incoming[~is_new]
+                stored = existing.loc[matched["prisoner_id"]]
+                is_changed = (
+                    matched.drop(columns="prisoner_id").to_numpy()
+                    != stored[matched.columns.drop("prisoner_id")].to_numpy()
+                ).any(axis=1)
+                changed_prisoners = matched[is_changed]
+
+                if not dry_run:
+                    if len(new_prisoners):
+                        insert_prisoners(connection, new_prisoners)
+                    if len(changed_prisoners):
+                        update_prisoners(connection, changed_prisoners)
+
+                # Any lookup values created for a dry run are rolled back too
+                if dry_run:
+                    transaction.rollback()
+                else:
+                    transaction.commit()
+
+            counts["inserted"] += len(new_prisoners)
+            counts["updated"] += len(changed_prisoners)
+            counts["unchanged"] += len(matched) - len(changed_prisoners)
+
+    # Only summarise the data again and let readers know it has changed if it actually has
+    if not dry_run and (
+        counts["inserted"] or counts["updated"] or not has_summary_tables
+    ):
+        with db_engine.begin() as connection:
+            refresh_summary_tables(connection)
+            bump_dataset_version(connection)
+
+    logging.info(
+        f"{'Dry run: ' if dry_run else ''}{counts['inserted']} prisoners inserted, "
+        f"{counts['updated']} updated, {counts['unchanged']} unchanged"
+    )
+
+    return counts
+
+
+def chunked(values: list, chunk_size: int) -> Iterator[list]:
+    """
+    Splits a list into consecutive chunks
+
+    Parameters:
+    values (list): The list to split.
+    chunk_size (int): The largest size of each chunk.
+
+    Returns:
+    Iterator[list]: The chunks, in order.
+    """
+    for start in range(0, len(values), chunk_size):
+        yield values[start : start + chunk_size]
+
+
+def age_band_expression():
+    """
+    Builds a SQL CASE expression that puts the age column into the same bands as analysis.age_distribution
+
+    Returns:
+    Case: An expression evaluating to the index of the age band, or NULL if the age is outside every band.
+    """
+    band_conditions = []
+
+    for index, (lower_edge, upper_edge) in enumerate(
+        zip(AGE_BAND_EDGES, AGE_BAND_EDGES[1:])
+    ):
+        condition = Prisoner.age > lower_edge
+
+        if upper_edge != float("inf"):
+            condition = condition & (Prisoner.age <= upper_edge)
+
+        band_conditions.append((condition, index))
+
+    return case(*band_conditions, else_=None)
+
+
+def create_prisoner_indexes(connection: Connection) -> None:
+    """
+    Creates any of the indexes defined on the prisoners table in models.py that don't exist yet
+
+    Parameters:
+    connection (Connection): The database connection. The caller is responsible for committing.
+    """
+    for index in Prisoner.__table__.indexes:
+        index.create(connection, checkfirst=True)
+
+
+def refresh_summary_tables(connection: Connection) -> None:
+    """
+    Rebuilds the summary tables from the prisoners table, so analysis can be served without reading every prisoner.
+    Must be called as part of any write to the prisoner data, in the same transaction as bump_dataset_version.
+
+    Parameters:
+    connection (Connection): The connection the write is being made in. The caller is responsible for committing.
+    """
+
+    for summary in (CrimeGenderSummary, PrisonSummary, AgeBandSummary):
+        connection.execute(delete(summary))
+
+    connection.execute(
+        insert(CrimeGenderSummary).from_select(
+            ["crime_id", "gender_id", "prisoner_count", "sentence_years_total"],
+            select(
+                Prisoner.crime_id,
+                Prisoner.gender_id,
+                func.count(),
+                func.sum(Prisoner.sentence_years),
+            ).group_by(Prisoner.crime_id, Prisoner.gender_id),
+        )
+    )
+
+    connection.execute(
+        insert(PrisonSummary).from_select(
+            ["prison_id", "prisoner_count"],
+            select(Prisoner.prison_id, func.count()).group_by(Prisoner.prison_id),
+        )
+    )
+
+    age_band = age_band_expression().label("age_band")
+    connection.execute(
+        insert(AgeBandSummary).from_select(
+            ["age_band", "prisoner_count"],
+            select(age_band, func.count())
+            .where(age_band.isnot(None))
+            .group_by(age_band),
+        )
+    )
+
+
+def add_dataset_version_token(connection: Connection) -> None:
+    """
+    Adds the token column to dataset_version tables created before it existed.
+    Their token is filled in the next time the dataset version is bumped.
+
+    Parameters:
+    connection (Connection): The database connection. The caller is responsible for committing.
+    """
+    columns = sqlalchemy.inspect(connection).get_columns(DatasetVersion.__tablename__)
+
+    if "token" not in {column["name"] for column in columns}:
+        connection.exec_driver_sql(
+            f"ALTER TABLE {DatasetVersion.__tablename__} ADD COLUMN token VARCHAR"
+        )
+
+
+def bump_dataset_version(connection: Union[Connection, Session]) -> int:
+    """
+    Increments the dataset version. Must be called as part of any write to the prisoner data
+    so that anything cached against the previous version is discarded.
+    The first bump also gives the database a random token, so its versions can't be mistaken for another's.
+
+    Parameters:
+    connection (Connection | Session): The connection or session the write is being made in.
+                                       The caller is responsible for committing.
+
+    Returns:
+    int: The new dataset version.
+    """
+
+    row = connection.execute(
+        select(DatasetVersion.version, DatasetVersion.token).where(
+            DatasetVersion.id == DATASET_VERSION_ROW_ID
+        )
+    ).first()
+
+    if row is None:
+        version = 1
+        connection.execute(
+            insert(DatasetVersion).values(
+                id=DATASET_VERSION_ROW_ID, version=version, token=uuid.uuid4().hex
+            )
+        )
+    else:
+        version = row.version + 1
+        connection.execute(
+            update(DatasetVersion)
+            .where(DatasetVersion.id == DATASET_VERSION_ROW_ID)
+            .values(version=version, token=row.token or uuid.uuid4().hex)
+        )
+
+    _dataset_version_memo["version"] = None
+
+    logging.info(f"Dataset version bumped to {version}")
+
+    return version
+
+
+def get_dataset_version(max_age: float = 0.0) -> int:
+    """
+    Gets the current dataset version.
+
+    Parameters:
+    max_age (float, optional): How many seconds a previously read version can be reused for before
+                               the database is queried again. Defaults to 0 (always query).
+
+    Returns:
+    int: The current dataset version, or 0 if no data has been loaded with versioning yet.
+    """
+
+    return get_dataset_token_and_version(max_age)[1]
+
+
+def get_dataset_token_and_version(max_age: float = 0.0) -> tuple[str, int]:
+    """
+    Gets the token of the database and its current dataset version. Versions are only comparable between
+    reads with the same token.
+
+    Parameters:
+    max_age (float, optional): How many seconds a previously read version can be reused for before
+                               the database is queried again. Defaults to 0 (always query).
+
+    Returns:
+    tuple[str, int]: The token, or an empty string if the database hasn't been given one yet,
+                     and the current dataset version, or 0 if no data has been loaded with versioning yet.
+    """
+
+    memoised = get_memoised_dataset_token_and_version(max_age)
+
+    if memoised is not None:
+        return memoised
+
+    session = create_session()
+
+    try:
+        row = session.execute(
+            select(DatasetVersion.token, DatasetVersion.version).where(
+                DatasetVersion.id == DATASET_VERSION_ROW_ID
+            )
+        ).first()
+        token, version = (row.token or "", row.version) if row else ("", 0)
+    except OperationalError:
+        # The version table or its token column won't exist for databases created before them
+        token, version = "", 0
     finally:
         session.close()
-        db_engine.dispose()
+
+    memoise_dataset_token_and_version(token, version)
+
+    return token, version
+
+
+def get_memoised_dataset_token_and_version(
+    max_age: float,
+) -> Optional[tuple[str, int]]:
+    """
+    Gets the last dataset token and version read from the database, if they were read recently enough
+
+    Parameters:
+    max_age (float): How many seconds ago they can have been read.
+
+    Returns:
+    tuple[str, int]: The token and version, or None if they need reading again.
+    """
+    if (
+        _dataset_version_memo["version"] is not None
+        and time.monotonic() - _dataset_version_memo["read_at"] < max_age
+    ):
+        return _dataset_version_memo["token"], _dataset_version_memo["version"]
+
+    return None
+
+
+def memoise_dataset_token_and_version(token: str, version: int) -> None:
+    """
+    Remembers a dataset token and version just read from the database, see get_memoised_dataset_token_and_version
+    """
+    _dataset_version_memo["token"] = token
+    _dataset_version_memo["version"] = version
+    _dataset_version_memo["read_at"] = time.monotonic()
+
+
+def read_dimensions(connection: Connection) -> dict:
+    """
+    Reads every lookup table so lookup IDs can be turned back into values without a join
+
+    Parameters:
+    connection (Connection): The database connection.
+
+    Returns:
+    dict: For each column in LOOKUP_COLUMNS, the lookup values keyed by ID.
+    """
+    return {
+        column: {
+            lookup_id: value
+            for value, lookup_id in get_lookup_ids(connection, column).items()
+        }
+        for column in LOOKUP_COLUMNS
+    }
+
+
+def to_prisoner_rows(rows: Iterable[Row], dimensions: dict) -> list[PrisonerRow]:
+    """
+    Converts rows from prisoner_table_select to flat prisoner rows by looking up their lookup values
+
+    Parameters:
+    rows (Iterable[Row]): The prisoners table rows.
+    dimensions (dict): The lookup values from read_dimensions.
+
+    Returns:
+    list[PrisonerRow]: The prisoner rows in PRISONER_COLUMNS order.
+
+    Raises:
+    KeyError: If a lookup ID isn't in the dimensions, e.g. a value was added since they were read.
+    """
+    genders = dimensions["gender"]
+    crimes = dimensions["crime"]
+    prisons = dimensions["prison"]
+
+    return [
+        PrisonerRow(
+            prisoner_id,
+            name,
+            age,
+            genders[gender_id],
+            crimes[crime_id],
+            sentence_years,
+            prisons[prison_id],
+        )
+        for prisoner_id, name, age, gender_id, crime_id, sentence_years, prison_id in rows
+    ]
+
+
+def prisoner_table_select() -> Select:
+    """
+    Builds a Core select of prisoners table rows with lookup IDs rather than values, in PRISONER_TABLE_COLUMNS order.
+    Convert them to flat prisoner rows with to_prisoner_rows.
+
+    Returns:
+    Select: The select statement, ordered by prisoner_id.
+    """
+    prisoner_table = Prisoner.__table__
+
+    return select(
+        *(prisoner_table.c[column] for column in PRISONER_TABLE_COLUMNS)
+    ).order_by(prisoner_table.c.prisoner_id)
+
+
+def prisoner_rows_select() -> Select:
+    """
+    Builds a Core select of flat prisoner rows with the lookup values joined in, in PRISONER_COLUMNS order.
+    This skips the ORM so rows come back as plain tuples.
+
+    Returns:
+    Select: The select statement, ordered by prisoner_id.
+    """
+    return (
+        select(
+            Prisoner.prisoner_id,
+            Prisoner.name,
+            Prisoner.age,
+            Gender.title.label("gender"),
+            Crime.name.label("crime"),
+            Prisoner.sentence_years,
+            Prison.name.label("prison"),
+        )
+        .select_from(Prisoner)
+        .join(Gender, Prisoner.gender_id == Gender.id)
+        .join(Crime, Prisoner.crime_id == Crime.id)
+        .join(Prison, Prisoner.prison_id == Prison.id)
+        .order_by(Prisoner.prisoner_id)
+    )
+
+
+def order_by_requested_ids(
+    prisoners: list[PrisonerRow], prisoner_ids: list[int]
+) -> tuple[list[PrisonerRow], list[int]]:
+    """
+    Puts prisoner rows fetched with an IN query back into the order they were asked for
+
+    Parameters:
+    prisoners (list[PrisonerRow]): The prisoner rows that were found, in any order.
+    prisoner_ids (list[int]): The prisoner IDs that were asked for, without duplicates.
+
+    Returns:
+    tuple[list[PrisonerRow], list[int]]: The prisoner rows in the order of prisoner_ids, and the IDs that weren't found.
+    """
+    prisoners_by_id = {prisoner.prisoner_id: prisoner for prisoner in prisoners}
+
+    found = []
+    missing = []
+
+    for prisoner_id in prisoner_ids:
+        if prisoner_id in prisoners_by_id:
+            found.append(prisoners_by_id[prisoner_id])
+        else:
+            missing.append(prisoner_id)
+
+    return found, missing
+
+
+def split_next_cursor(
+    prisoners: list[PrisonerRow], limit: int
+) -> tuple[list[PrisonerRow], Optional[int]]:
+    """
+    Trims a page of prisoners fetched with one extra row, which is there so we know if there is another page
+    without a second query
+
+    Parameters:
+    prisoners (list[PrisonerRow]): Up to limit + 1 prisoner rows.
+    limit (int): The number of prisoners in a page.
+
+    Returns:
+    tuple[list[PrisonerRow], int]: The page of prisoner rows and the cursor for the next page, or None if this is the last page.
+    """
+    if len(prisoners) > limit:
+        prisoners = prisoners[:limit]
+        return prisoners, prisoners[-1].prisoner_id
+
+    return prisoners, None
 
 
 def get_prisoner_by_id(prisoner_id: int) -> Prisoner:
@@ -174,7 +1060,12 @@ def get_paginated_prisoners(page: int = None, per_page: int = None) -> list[Pris
         )
         if page is not None and per_page is not None:
             offset = (page - 1) * per_page
-            prisoners = query.offset(offset).limit(per_page).all()
+            prisoners = (
+                query.order_by(Prisoner.prisoner_id)
+                .offset(offset)
+                .limit(per_page)
+                .all()
+            )
         else:
             prisoners = query.all()
         return prisoners
@@ -182,34 +1073,95 @@ def get_paginated_prisoners(page: int = None, per_page: int = None) -> list[Pris
         session.close()
 
 
+def build_prisoner_data_frame(data_frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converts prisoner data to a compact layout. Low cardinality columns become categoricals with sorted categories,
+    so they group and sort like the original strings, and integer columns are downcast.
+
+    Parameters:
+    data_frame (pd.DataFrame): The prisoner data with PRISONER_COLUMNS columns.
+
+    Returns:
+    pd.DataFrame: The prisoner data with compact column types.
+    """
+
+    columns = {}
+
+    for column in data_frame.columns:
+        values = data_frame[column]
+
+        if column in PRISONER_CATEGORY_COLUMNS and not isinstance(
+            values.dtype, pd.CategoricalDtype
+        ):
+            columns[column] = values.astype("category")
+        elif column in PRISONER_INTEGER_COLUMNS:
+            columns[column] = pd.to_numeric(values, downcast="integer")
+        else:
+            columns[column] = values
+
+    compact_data_frame = pd.DataFrame(columns, index=data_frame.index)
+
+    # Measuring object columns is slow, so the report is only built when it will be seen
+    log_frame(
+        "Prisoner DataFrame memory usage in bytes",
+        lambda: get_memory_report(data_frame, compact_data_frame),
+        level=logging.DEBUG,
+        index=True,
+    )
+
+    return compact_data_frame
+
+
+def get_memory_report(before: pd.DataFrame, after: pd.DataFrame) -> pd.DataFrame:
+    """
+    Compares the memory used by each column of two DataFrames
+
+    Parameters:
+    before (pd.DataFrame): The original DataFrame.
+    after (pd.DataFrame): The DataFrame after converting column types.
+
+    Returns:
+    pd.DataFrame: The bytes used by each column before and after, plus a total row.
+    """
+
+    report = pd.DataFrame(
+        {
+            "before": before.memory_usage(deep=True, index=False),
+            "after": after.memory_usage(deep=True, index=False),
+        }
+    )
+    report.loc["total"] = report.sum()
+    report["saved"] = 1 - report["after"] / report["before"]
+
+    return report
+
+
 def get_all_prisoners_as_dataframe() -> pd.DataFrame:
     """
-    Fetches all prisoners and returns them as a pandas DataFrame.
+    Fetches all prisoners and returns them as a compact pandas DataFrame.
 
     Returns:
-    pd.DataFrame: DataFrame containing all prisoners.
+    pd.DataFrame: DataFrame containing all prisoners, see build_prisoner_data_frame.
     """
 
     session = create_session()
 
     try:
-        prisoners = (
-            session.query(Prisoner)
-            .options(
-                joinedload(Prisoner.gender),
-                joinedload(Prisoner.crime),
-                joinedload(Prisoner.prison),
-            )
-            .all()
-        )
+        return prisoner_rows_to_data_frame(session.execute(prisoner_rows_select()).all())
+    finally:
+        session.close()
 
-        # Convert the list of Prisoner objects to a list of presentable JSON objects
-        prisoners_data = [prisoner.to_json() for prisoner in prisoners]
 
-        # Remove the SQLAlchemy _sa_instance_state entry
-        for data in prisoners_data:
-            data.pop("_sa_instance_state", None)
+def prisoner_rows_to_data_frame(rows: list[Row]) -> pd.DataFrame:
+    """
+    Converts prisoner rows from prisoner_rows_select to a compact pandas DataFrame
 
-        return pd.DataFrame(prisoners_data)
-    finally:
-        session.close()
+    Parameters:
+    rows (list[Row]): The prisoner rows in PRISONER_COLUMNS order.
+
+    Returns:
+    pd.DataFrame: DataFrame containing the prisoners, see build_prisoner_data_frame.
+    """
+    return build_prisoner_data_frame(
+        pd.DataFrame.from_records(rows, columns=list(PRISONER_COLUMNS))
+    )
@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: database_async.py
+Description: This script provides async access to the database for the API, so requests waiting on a query
+             don't block the event loop or hold a threadpool slot. It reuses the queries built in database.py.
+Author: Jack Gilmore
+Date: 2024-06-29
+"""
+
+import logging
+import os
+import database
+from typing import Any, AsyncIterator, Callable, Optional
+from sqlalchemy import event, select, Row
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    async_sessionmaker,
+    create_async_engine as sqlalchemy_create_async_engine,
+)
+from database import PrisonerRow
+from models import DatasetVersion, Prisoner
+
+# The async database URL, defaults to DB_CONNECTION_STRING with an async driver
+ASYNC_DB_CONNECTION_STRING = os.getenv("ASYNC_DB_CONNECTION_STRING")
+
+# Async drivers to use in place of the default synchronous ones
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+}
+
+# The process wide async engine and session factory, see init_async_engine
+_async_engine = None
+_async_session_factory = None
+
+
+def get_async_url(connection_string: str = None) -> URL:
+    """
+    Gets the URL of the database with an async driver
+
+    Parameters:
+    connection_string (str, optional): The database URL. Defaults to ASYNC_DB_CONNECTION_STRING,
+                                       or DB_CONNECTION_STRING with an async driver.
+
+    Returns:
+    URL: The async database URL.
+    """
+    url = make_url(
+        connection_string
+        or ASYNC_DB_CONNECTION_STRING
+        or database.DB_CONNECTION_STRING
+    )
+
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+
+def create_async_engine(connection_string: str = None) -> AsyncEngine:
+    """
+    Creates and returns a new async engine with the same pool settings and SQLite pragmas as database.create_engine.
+    Most callers should use get_async_engine instead so connections are shared.
+
+    Parameters:
+    connection_string (str, optional): The database URL, see get_async_url.
+
+    Returns:
+    AsyncEngine: The SQLAlchemy async engine.
+    """
+    url = get_async_url(connection_string)
+    pool_options = database.get_pool_options(url)
+
+    # Some async drivers (e.g. aiosqlite) don't pool connections unless asked to
+    if pool_options:
+        pool_options["poolclass"] = AsyncAdaptedQueuePool
+
+    engine = sqlalchemy_create_async_engine(url, **pool_options)
+
+    if url.get_backend_name() == "sqlite":
+        event.listen(engine.sync_engine, "connect", database._apply_sqlite_pragmas)
+
+    return engine
+
+
+def init_async_engine(connection_string: str = None) -> AsyncEngine:
+    """
+    Creates the process wide async engine and session factory. The API calls this on startup.
+    Any existing engine should be disposed of with dispose_async_engine first.
+
+    Parameters:
+    connection_string (str, optional): The database URL, see get_async_url.
+
+    Returns:
+    AsyncEngine: The SQLAlchemy async engine.
+    """
+    global _async_engine, _async_session_factory
+
+    _async_engine = create_async_engine(connection_string)
+    _async_session_factory = async_sessionmaker(bind=_async_engine)
+
+    logging.info(f"Async database engine created for {_async_engine.url}")
+
+    return _async_engine
+
+
+def get_async_engine() -> AsyncEngine:
+    """
+    Gets the process wide async engine, creating it on first use
+    """
+    if _async_engine is None:
+        init_async_engine()
+
+    return _async_engine
+
+
+async def dispose_async_engine() -> None:
+    """
+    Closes every pooled connection and discards the process wide async engine
+    """
+    global _async_engine, _async_session_factory
+
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+    _async_engine = None
+    _async_session_factory = None
+
+
+async def run_sync(function: Callable[..., Any], *args) -> Any:
+    """
+    Runs a function written for a synchronous session (e.g. the aggregates in analysis_sql) on an async session,
+    so the same queries can be shared by the API and load_data.py
+
+    Parameters:
+    function (Callable): A function taking a Session followed by args.
+    args: Any other arguments for the function.
+
+    Returns:
+    Any: What the function returns.
+    """
+    get_async_engine()
+
+    async with _async_session_factory() as session:
+        return await session.run_sync(function, *args)
+
+
+async def get_dataset_version(max_age: float = 0.0) -> int:
+    """
+    Gets the current dataset version. Shares its memo with database.get_dataset_version.
+
+    Parameters:
+    max_age (float, optional): How many seconds a previously read version can be reused for before
+                               the database is queried again. Defaults to 0 (always query).
+
+    Returns:
+    int: The current dataset version, or 0 if no data has been loaded with versioning yet.
+    """
+
+    return (await get_dataset_token_and_version(max_age))[1]
+
+
+async def get_dataset_token_and_version(max_age: float = 0.0) -> tuple[str, int]:
+    """
+    Gets the token of the database and its current dataset version.
+    Shares its memo with database.get_dataset_token_and_version.
+
+    Parameters:
+    max_age (float, optional): How many seconds a previously read version can be reused for before
+                               the database is queried again. Defaults to 0 (always query).
+
+    Returns:
+    tuple[str, int]: The token, or an empty string if the database hasn't been given one yet,
+                     and the current dataset version, or 0 if no data has been loaded with versioning yet.
+    """
+
+    memoised = database.get_memoised_dataset_token_and_version(max_age)
+
+    if memoised is not None:
+        return memoised
+
+    try:
+        async with get_async_engine().connect() as connection:
+            result = await connection.execute(
+                select(DatasetVersion.token, DatasetVersion.version).where(
+                    DatasetVersion.id == database.DATASET_VERSION_ROW_ID
+                )
+            )
+            row = result.first()
+            token, version = (row.token or "", row.version) if row else ("", 0)
+    except OperationalError:
+        # The version table or its token column won't exist for databases created before them
+        token, version = "", 0
+
+    database.memoise_dataset_token_and_version(token, version)
+
+    return token, version
+
+
+async def get_dimensions(refresh: bool = False) -> dict:
+    """
+    Gets the lookup values for the current dataset version, only reading the lookup tables when the version or database changes
+
+    Parameters:
+    refresh (bool, optional): Read the lookup tables even if they're cached. Defaults to False.
+
+    Returns:
+    dict: For each column in LOOKUP_COLUMNS, the lookup values keyed by ID.
+    """
+    token, version = await get_dataset_token_and_version(
+        database.DATASET_VERSION_MAX_AGE
+    )
+    dimensions = None if refresh else database.dimension_cache.get(version, token=token)
+
+    if dimensions is None:
+        async with get_async_engine().connect() as connection:
+            dimensions = await connection.run_sync(database.read_dimensions)
+
+        database.dimension_cache.set(version, dimensions, token=token)
+
+    return dimensions
+
+
+async def resolve_prisoner_rows(rows: list[Row]) -> list[PrisonerRow]:
+    """
+    Converts rows from database.prisoner_table_select to flat prisoner rows using the dimension cache
+
+    Parameters:
+    rows (list[Row]): The prisoners table rows.
+
+    Returns:
+    list[PrisonerRow]: The prisoner rows in PRISONER_COLUMNS order.
+    """
+    try:
+        return database.to_prisoner_rows(rows, await get_dimensions())
+    except KeyError:
+        # A lookup value was added after the cached version was read
+        return database.to_prisoner_rows(rows, await get_dimensions(refresh=True))
+
+
+async def get_prisoner_row_by_id(prisoner_id: int) -> Optional[PrisonerRow]:
+    """
+    Get a single prisoner as a flat row, without loading ORM objects or joining the lookup tables
+
+    Parameters:
+    prisoner_id (int): The prisoner ID to query.
+
+    Returns:
+    PrisonerRow: The prisoner row in PRISONER_COLUMNS order, or None if not found.
+    """
+
+    async with get_async_engine().connect() as connection:
+        result = await connection.execute(
+            database.prisoner_table_select().where(Prisoner.prisoner_id == prisoner_id)
+        )
+        prisoners = result.all()
+
+    return (await resolve_prisoner_rows(prisoners))[0] if prisoners else None
+
+
+async def get_paginated_prisoner_rows(page: int, per_page: int) -> list[PrisonerRow]:
+    """
+    Get a page of prisoners as flat rows, without loading ORM objects or joining the lookup tables
+
+    Parameters:
+    page (int): The page number (1-based).
+    per_page (int): The number of records per page.
+
+    Returns:
+    list[PrisonerRow]: The prisoner rows in PRISONER_COLUMNS order.
+    """
+
+    offset = (page - 1) * per_page
+
+    async with get_async_engine().connect() as connection:
+        result = await connection.execute(
+            database.prisoner_table_select().offset(offset).limit(per_page)
+        )
+        prisoners = result.all()
+
+    return await resolve_prisoner_rows(prisoners)
+
+
+async def get_prisoner_rows_after(
+    after: int, limit: int
+) -> tuple[list[PrisonerRow], Optional[int]]:
+    """
+    Get a page of prisoners as flat rows using keyset (cursor) pagination. Unlike offset pagination, this seeks
+    straight to the cursor using the primary key index so every page is as quick to fetch as the first.
+
+    Parameters:
+    after (int): Only return prisoners with a prisoner_id greater than this. Use 0 for the first page.
+    limit (int): The maximum number of prisoners to return.
+
+    Returns:
+    tuple[list[PrisonerRow], int]: The page of prisoner rows and the cursor for the next page,
+                                   or None if this is the last page.
+    """
+
+    async with get_async_engine().connect() as connection:
+        result = await connection.execute(
+            database.prisoner_table_select()
+            .where(Prisoner.prisoner_id > after)
+            .limit(limit + 1)
+        )
+        prisoners = result.all()
+
+    return database.split_next_cursor(await resolve_prisoner_rows(prisoners), limit)
+
+
+async def get_prisoner_rows_by_ids(
+    prisoner_ids: list[int],
+) -> tuple[list[PrisonerRow], list[int]]:
+    """
+    Get many prisoners as flat rows with one IN query per SQL_IN_CHUNK_SIZE IDs, rather than one query per prisoner
+
+    Parameters:
+    prisoner_ids (list[int]): The prisoner IDs to query.
+
+    Returns:
+    tuple[list[PrisonerRow], list[int]]: The prisoner rows in the order they were asked for,
+                                         and the IDs that weren't found.
+    """
+
+    unique_ids = list(dict.fromkeys(prisoner_ids))
+    prisoners = []
+
+    async with get_async_engine().connect() as connection:
+        for id_chunk in database.chunked(unique_ids, database.SQL_IN_CHUNK_SIZE):
+            result = await connection.execute(
+                database.prisoner_table_select().where(
+                    Prisoner.prisoner_id.in_(id_chunk)
+                )
+            )
+            prisoners += result.all()
+
+    return database.order_by_requested_ids(
+        await resolve_prisoner_rows(prisoners), unique_ids
+    )
+
+
+async def get_all_prisoner_rows() -> list[Row]:
+    """
+    Get every prisoner as flat rows, e.g. to build a DataFrame with database.prisoner_rows_to_data_frame
+
+    Returns:
+    list[Row]: The prisoner rows in PRISONER_COLUMNS order.
+    """
+
+    async with get_async_engine().connect() as connection:
+        result = await connection.execute(database.prisoner_rows_select())
+
+        return result.all()
+
+
+async def iter_prisoner_rows(chunk_size: int = 1000) -> AsyncIterator[list[Row]]:
+    """
+    Streams every prisoner from the database in chunks using a server side cursor,
+    so memory use depends on the chunk size rather than the size of the table.
+    The lookup values are joined in the database, which is quicker than the dimension cache for whole table reads.
+
+    Parameters:
+    chunk_size (int, optional): The number of rows fetched per chunk. Defaults to 1000.
+
+    Returns:
+    AsyncIterator[list[Row]]: Chunks of prisoner rows in PRISONER_COLUMNS order.
+    """
+
+    async with get_async_engine().connect() as connection:
+        result = await connection.stream(
+            database.prisoner_rows_select().execution_options(yield_per=chunk_size)
+        )
+
+        async for chunk in result.partitions():
+            yield chunk
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: diagnostics.py
+Description: This script provides logging helpers that only format their output when the log level is enabled,
+             so human readable reports cost nothing when nobody will read them
+Author: Jack Gilmore
+Date: 2024-06-27
+"""
+
+import logging
+import pandas as pd
+from typing import Callable, Union
+
+
+class LazyText:
+    """
+    Defers building a log message until a handler actually formats it.
+    Pass it as a logging argument, e.g. logging.info("%s", LazyText(data_frame.to_string)).
+    """
+
+    def __init__(self, function: Callable[..., str], *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self) -> str:
+        return self.function(*self.args, **self.kwargs)
+
+
+def log_frame(
+    title: str,
+    data_frame: Union[pd.DataFrame, Callable[[], pd.DataFrame]],
+    level: int = logging.INFO,
+    index: bool = False,
+) -> None:
+    """
+    Logs a titled table. Nothing is built or rendered unless the level is enabled.
+
+    Parameters:
+    title (str): The line logged above the table.
+    data_frame (pd.DataFrame | Callable): The table, or a function that builds it.
+    level (int, optional): The logging level. Defaults to logging.INFO.
+    index (bool, optional): Whether to include the DataFrame index. Defaults to False.
+    """
+    if not logging.getLogger().isEnabledFor(level):
+        return
+
+    if callable(data_frame):
+        data_frame = data_frame()
+
+    logging.log(level, title)
+    logging.log(level, "\n%s", data_frame.to_string(index=index))
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: export.py
+Description: This script encodes streamed prisoner rows for bulk export
+Author: Jack Gilmore
+Date: 2024-06-21
+"""
+
+import csv
+import orjson
+from io import StringIO
+from typing import AsyncIterable, AsyncIterator, Sequence
+from responses import JSON_OPTIONS
+
+# Export formats mapped to their media types
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def ndjson_chunk(columns: Sequence[str], chunk: Sequence[tuple]) -> bytes:
+    """
+    Encodes a chunk of rows as newline delimited JSON, one object per row
+    """
+    return b"".join(
+        orjson.dumps(dict(zip(columns, row)), option=JSON_OPTIONS) + b"\n"
+        for row in chunk
+    )
+
+
+def csv_header(columns: Sequence[str]) -> bytes:
+    """
+    Encodes the header row of a CSV export
+    """
+    return csv_chunk(columns, [columns])
+
+
+def csv_chunk(columns: Sequence[str], chunk: Sequence[tuple]) -> bytes:
+    """
+    Encodes a chunk of rows as CSV
+    """
+    buffer = StringIO()
+    csv.writer(buffer, lineterminator="\n").writerows(chunk)
+
+    return buffer.getvalue().encode()
+
+
+async def encode_rows(
+    format: str, columns: Sequence[str], chunks: AsyncIterable[Sequence[tuple]]
+) -> AsyncIterator[bytes]:
+    """
+    Encodes chunks of rows streamed from an async query
+
+    Parameters:
+    format (str): The export format, one of EXPORT_MEDIA_TYPES.
+    columns (Sequence[str]): The column names, in the same order as each row.
+    chunks (AsyncIterable[Sequence[tuple]]): Chunks of rows.
+
+    Returns:
+    AsyncIterator[bytes]: The header if the format has one, then the encoded rows of each chunk.
+    """
+    header_encoder, chunk_encoder = EXPORT_CHUNK_ENCODERS[format]
+
+    if header_encoder is not None:
+        yield header_encoder(columns)
+
+    async for chunk in chunks:
+        yield chunk_encoder(columns, chunk)
+
+
+# The header and chunk encoders each format is built from
+EXPORT_CHUNK_ENCODERS = {
+    "ndjson": (None, ndjson_chunk),
+    "csv": (csv_header, csv_chunk),
+}
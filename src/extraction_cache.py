@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: extraction_cache.py
+Description: This script caches text extracted from the PDF on disk, keyed by content hashes,
+             so unchanged documents and pages don't need to be parsed again
+Author: Jack Gilmore
+Date: 2024-06-24
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import pymupdf
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import Iterator, List, Optional
+
+# Constants
+CACHE_DIRECTORY = os.getenv(
+    "EXTRACTION_CACHE_DIRECTORY",
+    os.path.join(os.path.dirname(os.path.realpath(__file__)), ".extraction_cache"),
+)
+# How many extracted documents are kept, the newest is used to reuse unchanged pages
+MAX_CACHED_DOCUMENTS = 2
+# Pages are written in groups so a cached document can be read back a group at a time
+PAGES_PER_ROW_GROUP = 25
+HASH_BLOCK_SIZE = 1024 * 1024
+
+CACHE_SCHEMA = pa.schema(
+    [
+        ("page_number", pa.int32()),
+        ("page_hash", pa.string()),
+        ("lines", pa.list_(pa.string())),
+    ]
+)
+
+
+def hash_file(path: str) -> str:
+    """
+    Hashes the content of a file
+
+    Parameters:
+    path (str): The path to the file.
+
+    Returns:
+    str: The SHA-256 hex digest of the file.
+    """
+    file_hash = hashlib.sha256()
+
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            file_hash.update(block)
+
+    return file_hash.hexdigest()
+
+
+def hash_pages(path: str, page_numbers: range) -> List[str]:
+    """
+    Hashes the drawing instructions and fonts of each page. This is much cheaper than extracting the text,
+    and pages with the same hash have the same text.
+
+    Parameters:
+    path (str): The path to the PDF.
+    page_numbers (range): The pages to hash (0-based).
+
+    Returns:
+    List[str]: The SHA-256 hex digest of each page, in page order.
+    """
+    page_hashes = []
+
+    with pymupdf.open(path) as document:
+        for page_number in page_numbers:
+            page = document[page_number]
+            page_hash = hashlib.sha256(page.read_contents())
+            page_hash.update(repr(page.get_fonts()).encode())
+            page_hashes.append(page_hash.hexdigest())
+
+    return page_hashes
+
+
+def get_document_path(file_hash: str) -> str:
+    """
+    Gets where the extracted text of a document is cached
+
+    Parameters:
+    file_hash (str): The hash of the PDF, from hash_file.
+
+    Returns:
+    str: The path of the cache file.
+    """
+    return os.path.join(CACHE_DIRECTORY, f"{file_hash}.parquet")
+
+
+class CachedDocument:
+    """
+    The cached text of a previously extracted document
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._parquet_file = pq.ParquetFile(path)
+
+        # Only the hashes are read up front, the text is read a row group at a time when needed
+        page_hashes = self._parquet_file.read(columns=["page_hash"]).column(0)
+        self._page_rows = {
+            page_hash: row for row, page_hash in enumerate(page_hashes.to_pylist())
+        }
+
+        self._row_group_starts = []
+        row_count = 0
+        for row_group in range(self._parquet_file.num_row_groups):
+            self._row_group_starts.append(row_count)
+            row_count += self._parquet_file.metadata.row_group(row_group).num_rows
+
+        self._loaded_row_group = None
+        self._loaded_lines = None
+
+    def iter_pages(self) -> Iterator[List[str]]:
+        """
+        Reads back the text lines of every page
+
+        Returns:
+        Iterator[List[str]]: The text lines of each page, in page order.
+        """
+        for row_group in range(self._parquet_file.num_row_groups):
+            yield from self._read_row_group(row_group)
+
+    def has_page(self, page_hash: str) -> bool:
+        """
+        Checks if a page with this hash is cached
+        """
+        return page_hash in self._page_rows
+
+    def get_page(self, page_hash: str) -> Optional[List[str]]:
+        """
+        Gets the text lines of a page by its hash
+
+        Parameters:
+        page_hash (str): The hash of the page, from hash_pages.
+
+        Returns:
+        List[str]: The text lines of the page, or None if the page isn't cached.
+        """
+        row = self._page_rows.get(page_hash)
+
+        if row is None:
+            return None
+
+        # Find the row group the page is in, pages are usually asked for in order so it's normally already loaded
+        row_group = next(
+            index
+            for index in reversed(range(len(self._row_group_starts)))
+            if self._row_group_starts[index] <= row
+        )
+
+        return self._read_row_group(row_group)[row - self._row_group_starts[row_group]]
+
+    def _read_row_group(self, row_group: int) -> List[List[str]]:
+        if row_group != self._loaded_row_group:
+            self._loaded_lines = (
+                self._parquet_file.read_row_group(row_group, columns=["lines"])
+                .column(0)
+                .to_pylist()
+            )
+            self._loaded_row_group = row_group
+
+        return self._loaded_lines
+
+
+def open_document(file_hash: str) -> Optional[CachedDocument]:
+    """
+    Opens the cached text of a document
+
+    Parameters:
+    file_hash (str): The hash of the PDF, from hash_file.
+
+    Returns:
+    CachedDocument: The cached document, or None if it isn't cached.
+    """
+    path = get_document_path(file_hash)
+
+    return CachedDocument(path) if os.path.exists(path) else None
+
+
+def open_latest_document() -> Optional[CachedDocument]:
+    """
+    Opens the most recently cached document, to reuse any pages that haven't changed since
+
+    Returns:
+    CachedDocument: The cached document, or None if nothing is cached.
+    """
+    paths = sorted(
+        glob.glob(os.path.join(CACHE_DIRECTORY, "*.parquet")), key=os.path.getmtime
+    )
+
+    return CachedDocument(paths[-1]) if paths else None
+
+
+class DocumentWriter:
+    """
+    Writes the text of a document to the cache as it is extracted.
+    The cache file only appears once every page has been written without error.
+    """
+
+    def __init__(self, file_hash: str):
+        self.path = get_document_path(file_hash)
+        self._temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        self._writer = None
+        self._pending_pages = []
+
+    def __enter__(self) -> "DocumentWriter":
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        self._writer = pq.ParquetWriter(
+            self._temporary_path, CACHE_SCHEMA, compression="zstd"
+        )
+        return self
+
+    def write_page(self, page_number: int, page_hash: str, lines: List[str]) -> None:
+        """
+        Adds the text lines of a page to the cache
+
+        Parameters:
+        page_number (int): The page number (0-based).
+        page_hash (str): The hash of the page, from hash_pages.
+        lines (List[str]): The text lines of the page.
+        """
+        self._pending_pages.append((page_number, page_hash, lines))
+
+        if len(self._pending_pages) >= PAGES_PER_ROW_GROUP:
+            self._flush()
+
+    def __exit__(self, exception_type, exception, traceback) -> None:
+        try:
+            if exception_type is None:
+                self._flush()
+            self._writer.close()
+        finally:
+            if exception_type is None:
+                os.replace(self._temporary_path, self.path)
+                prune_documents()
+            elif os.path.exists(self._temporary_path):
+                # Don't leave a partial document behind if extraction failed or was abandoned
+                os.remove(self._temporary_path)
+
+    def _flush(self) -> None:
+        if not self._pending_pages:
+            return
+
+        page_numbers, page_hashes, lines = zip(*self._pending_pages)
+        self._writer.write_table(
+            pa.table(
+                [list(page_numbers), list(page_hashes), list(lines)],
+                schema=CACHE_SCHEMA,
+            )
+        )
+        self._pending_pages = []
+
+
+def prune_documents() -> None:
+    """
+    Removes all but the MAX_CACHED_DOCUMENTS most recently cached documents
+    """
+    paths = sorted(
+        glob.glob(os.path.join(CACHE_DIRECTORY, "*.parquet")), key=os.path.getmtime
+    )
+
+    for path in paths[:-MAX_CACHED_DOCUMENTS]:
+        logging.info(f"Removing old extraction cache {path}")
+        os.remove(path)
@@ -9,13 +9,21 @@ Date: 2024-06-11
 
 import os
 import sys
+import argparse
+import itertools
 import logging
 import pymupdf
 import pandas as pd
 import analysis
+import analysis_sql
+import dashboard_data
 import database
+import extraction_cache
+import snapshot
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from io import StringIO
-from typing import List
+from typing import Iterable, Iterator, List, Optional
 
 # Configure logging
 logging.basicConfig(
@@ -27,75 +35,308 @@ DATA_SOURCE_NAME = "coding-test.pdf"
 DATASET_HEADER = "prisoner_id,name,age,gender,crime,sentence_years,prison"
 GENDER_MAP = {"M": "Male", "F": "Female"}
 
+# Documents with at least this many pages are extracted in parallel by default
+PARALLEL_PAGE_THRESHOLD = 64
+# How many pages are extracted at a time, by each worker when extracting in parallel
+PAGES_PER_RANGE = 25
+# How many rows of the dataset are parsed and loaded at a time
+CHUNK_SIZE = 100_000
+# How many prisoners are printed after loading
+PREVIEW_SIZE = 10
 
-def load_data() -> list:
+
+class DataSourceError(Exception):
     """
-    Loads the data from the PDF, extracts the text and truncates the text lines down to the relevant dataset
+    Raised when the dataset can't be read from the PDF
+    """
+
+
+def get_page_lines(document: pymupdf.Document, page_number: int) -> List[str]:
+    """
+    Extracts the text lines from a page
+
+    Parameters:
+    document (pymupdf.Document): The open PDF.
+    page_number (int): The page number (0-based).
 
     Returns:
-    list: A string array of the dataset with each item a comma separated string for a row in the dataset
+    List[str]: The stripped text lines of the page
     """
 
-    logging.info(f"Opening {DATA_SOURCE_NAME}")
+    # Get plain text encoded as UTF-8, split by newlines and strip whitespace
+    return [line.strip() for line in str.splitlines(document[page_number].get_text())]
+
+
+def extract_page_range(data_source_path: str, start: int, stop: int) -> List[List[str]]:
+    """
+    Extracts the text lines from a range of pages. Runs in worker processes, so opens the document itself.
+
+    Parameters:
+    data_source_path (str): The path to the PDF.
+    start (int): The first page number to extract (0-based).
+    stop (int): The page number to stop before.
+
+    Returns:
+    List[List[str]]: The stripped text lines of each page, in page order
+    """
+
+    with pymupdf.open(data_source_path) as document:
+        return [get_page_lines(document, page_number) for page_number in range(start, stop)]
+
+
+def extract_pages(
+    data_source_path: str, page_numbers: range, workers: Optional[int] = None
+) -> Iterator[List[str]]:
+    """
+    Extracts the text lines from pages of the PDF, fanning the work out across processes for large documents
+
+    Parameters:
+    data_source_path (str): The path to the PDF.
+    page_numbers (range): The pages to extract (0-based).
+    workers (int, optional): The number of worker processes. Defaults to one per CPU for large documents.
+
+    Returns:
+    Iterator[List[str]]: The stripped text lines of each page, in page order
+    """
+
+    if workers is None:
+        workers = os.cpu_count() if len(page_numbers) >= PARALLEL_PAGE_THRESHOLD else 1
+
+    if workers <= 1:
+        with pymupdf.open(data_source_path) as document:
+            for page_number in page_numbers:
+                yield get_page_lines(document, page_number)
+        return
+
+    logging.info(f"Extracting {len(page_numbers)} pages with {workers} workers")
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending_ranges = deque()
+
+        for start in page_numbers[::PAGES_PER_RANGE]:
+            stop = min(start + PAGES_PER_RANGE, page_numbers.stop)
+            pending_ranges.append(
+                executor.submit(extract_page_range, data_source_path, start, stop)
+            )
+
+            # Only keep a few ranges in flight so a slow consumer doesn't buffer the whole document.
+            # Results are taken in submission order, so pages come back in order
+            if len(pending_ranges) >= workers * 2:
+                yield from pending_ranges.popleft().result()
+
+        while pending_ranges:
+            yield from pending_ranges.popleft().result()
+
+
+def get_data_source_path() -> str:
+    """
+    Gets the path of the PDF, which lives in the same folder as this script
+
+    Returns:
+    str: The path to the PDF
+    """
 
     # Build the base path using the folder our script lives in
     script_path = os.path.realpath(os.path.join(os.getcwd(), os.path.dirname(__file__)))
-    data_source_path = os.path.join(script_path, DATA_SOURCE_NAME)
+    return os.path.join(script_path, DATA_SOURCE_NAME)
+
+
+def get_page_count(data_source_path: str) -> int:
+    """
+    Opens the PDF to check it can be read and count its pages
+
+    Parameters:
+    data_source_path (str): The path to the PDF.
+
+    Returns:
+    int: The number of pages in the PDF
+
+    Raises:
+    DataSourceError: If the PDF can't be opened.
+    """
+
+    logging.info(f"Opening {DATA_SOURCE_NAME}")
 
     # Open the document
-    data_source_document = None
     try:
         data_source_document = pymupdf.open(data_source_path)
-    except pymupdf.FileNotFoundError:
-        logging.error(f"Could not find file at path {data_source_path}")
+    except pymupdf.FileNotFoundError as e:
+        raise DataSourceError(f"Could not find file at path {data_source_path}") from e
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}")
+        raise DataSourceError(f"An unexpected error occurred: {e}") from e
 
-    # If we couldn't read the file for some reason, error out gracefully
-    if data_source_document == None:
-        sys.exit(1)
+    page_count = data_source_document.page_count
+    data_source_document.close()
+
+    return page_count
+
+
+def iter_source_pages(
+    workers: Optional[int] = None, use_cache: bool = True
+) -> Iterator[List[str]]:
+    """
+    Extracts the text lines of each page of the PDF, skipping the first page as it contains no relevant content to scrape.
+    If the PDF hasn't changed since it was last extracted, the text is read back from the extraction cache instead,
+    and if only some pages have changed, only those pages are extracted.
+
+    Parameters:
+    workers (int, optional): The number of processes to extract pages with. Defaults to one per CPU for large documents.
+    use_cache (bool, optional): Whether to use the extraction cache. Defaults to True.
+
+    Returns:
+    Iterator[List[str]]: The stripped text lines of each page, in page order
+    """
+
+    data_source_path = get_data_source_path()
+
+    if not use_cache or not os.path.isfile(data_source_path):
+        page_count = get_page_count(data_source_path)
+
+        logging.info(f"Extracting text from {DATA_SOURCE_NAME}")
 
-    data_source_lines = []
+        yield from extract_pages(data_source_path, range(1, page_count), workers)
+        return
 
-    logging.info(f"Extracting text from {DATA_SOURCE_NAME}")
+    file_hash = extraction_cache.hash_file(data_source_path)
+    cached_document = extraction_cache.open_document(file_hash)
+
+    if cached_document is not None:
+        logging.info(f"{DATA_SOURCE_NAME} is unchanged, reading text from {cached_document.path}")
+
+        # Mark the document as the most recently used so unchanged pages are reused from it next time
+        os.utime(cached_document.path)
+
+        yield from cached_document.iter_pages()
+        return
+
+    page_count = get_page_count(data_source_path)
+    page_numbers = range(1, page_count)
+    page_hashes = extraction_cache.hash_pages(data_source_path, page_numbers)
+    previous_document = extraction_cache.open_latest_document()
+
+    def is_cached(index: int) -> bool:
+        return previous_document is not None and previous_document.has_page(
+            page_hashes[index]
+        )
+
+    logging.info(
+        f"Extracting text from {DATA_SOURCE_NAME}, "
+        f"reusing {sum(map(is_cached, range(len(page_numbers))))} unchanged pages"
+    )
 
-    # Loop through the pages, skipping the first one as it contains no relevant content to scrape
-    for page in data_source_document[1:]:
-        # Get plain text encoded as UTF-8
-        page_text = page.get_text()
+    with extraction_cache.DocumentWriter(file_hash) as cache_writer:
+        index = 0
 
-        # Split text by newlines and strip whitespace
-        page_lines = [line.strip() for line in str.splitlines(page_text)]
+        while index < len(page_numbers):
+            if is_cached(index):
+                lines = previous_document.get_page(page_hashes[index])
+                cache_writer.write_page(page_numbers[index], page_hashes[index], lines)
+                yield lines
+                index += 1
+                continue
 
-        # Add the lines to our full list of document lines
-        data_source_lines += page_lines
+            # Extract each run of changed pages together so they can be extracted in parallel
+            stop = index
+            while stop < len(page_numbers) and not is_cached(stop):
+                stop += 1
 
-    line_count = len(data_source_lines)
+            for offset, lines in enumerate(
+                extract_pages(data_source_path, page_numbers[index:stop], workers)
+            ):
+                cache_writer.write_page(
+                    page_numbers[index + offset], page_hashes[index + offset], lines
+                )
+                yield lines
 
-    logging.info(f"Line count: {line_count}")
+            index = stop
+
+
+def iter_dataset_lines(pages: Iterable[List[str]]) -> Iterator[str]:
+    """
+    Finds the header of the dataset and yields it along with every line after it
+
+    Parameters:
+    pages (Iterable[List[str]]): The text lines of each page, in page order
+
+    Returns:
+    Iterator[str]: The header line followed by each comma separated row of the dataset
+
+    Raises:
+    DataSourceError: If there is no header line.
+    """
+
+    lines = itertools.chain.from_iterable(pages)
 
     logging.info("Finding start of dataset")
 
     # Find the text with the header for the CSV
     # We want to ignore any text before this as it isn't data. Just instructions.
-    header_index = next(
-        (
-            index
-            for index, line_string in enumerate(data_source_lines)
-            if DATASET_HEADER in line_string
-        ),
-        -1,
-    )
-
-    # If we don't get a header back, error out gracefully
+    header_index = -1
+    for index, line_string in enumerate(lines):
+        if DATASET_HEADER in line_string:
+            header_index = index
+            yield line_string
+            break
+
+    # If we don't get a header back, stop before anything is loaded
     if header_index == -1:
-        logging.error(f"Could not find a header row with value of {DATASET_HEADER}")
-        sys.exit(1)
+        raise DataSourceError(
+            f"Could not find a header row with value of {DATASET_HEADER}"
+        )
 
     logging.info(f"Header index found at {header_index}")
 
+    yield from lines
+
+
+def iter_data_frames(
+    dataset_lines: Iterable[str], chunk_size: int = CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Parses the dataset into DataFrames of at most chunk_size rows, so the whole dataset never has to be in memory at once
+
+    Parameters:
+    dataset_lines (Iterable[str]): The header line followed by each comma separated row of the dataset
+    chunk_size (int, optional): The largest number of rows in each DataFrame. Defaults to CHUNK_SIZE.
+
+    Returns:
+    Iterator[pd.DataFrame]: The dataset as a series of DataFrames
+    """
+
+    dataset_lines = iter(dataset_lines)
+    header = next(dataset_lines)
+    row_count = 0
+
+    while True:
+        rows = list(itertools.islice(dataset_lines, chunk_size))
+
+        # Blank lines are skipped when parsing, so a chunk of them has no rows
+        if not any(rows):
+            if not rows:
+                break
+            continue
+
+        data_frame = data_to_pandas([header] + rows)
+        row_count += len(data_frame)
+
+        logging.info(f"Parsed {row_count} rows")
+
+        yield data_frame
+
+
+def load_data(workers: Optional[int] = None) -> list:
+    """
+    Loads the data from the PDF, extracts the text and truncates the text lines down to the relevant dataset
+
+    Parameters:
+    workers (int, optional): The number of processes to extract pages with. Defaults to one per CPU for large documents.
+
+    Returns:
+    list: A string array of the dataset with each item a comma separated string for a row in the dataset
+    """
+
     # Truncate our PDF lines down to just the ones from the header onwards
-    data_source = data_source_lines[header_index:]
+    data_source = list(iter_dataset_lines(iter_source_pages(workers)))
 
     data_source_count = len(data_source)
 
@@ -114,7 +355,7 @@ def data_to_pandas(data: List[str]) -> pd.DataFrame:
     data: An array of comma separated strings
 
     Returns:
-    pd.DataFrame: A pandas DataFrame of the dataset
+    pd.DataFrame: A pandas DataFrame of the dataset, see database.build_prisoner_data_frame
     """
 
     logging.info("Converting data to CSV file")
@@ -130,32 +371,141 @@ def data_to_pandas(data: List[str]) -> pd.DataFrame:
     # Remap the gender column with values that read better
     data_frame["gender"] = data_frame["gender"].map(GENDER_MAP)
 
-    logging.info(f"\n{data_frame}")
+    data_frame = database.build_prisoner_data_frame(data_frame)
+
+    # The DataFrame is only rendered if INFO logging is enabled
+    logging.info("\n%s", data_frame)
 
     return data_frame
 
 
+def parse_arguments(args: List[str]) -> argparse.Namespace:
+    """
+    Parses the command line arguments
+
+    Parameters:
+    args: A list of arguments, including the script name
+
+    Returns:
+    argparse.Namespace: The parsed arguments
+    """
+
+    parser = argparse.ArgumentParser(
+        description="Loads the prisoner dataset from the PDF into the database"
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Insert new and update changed prisoners instead of replacing the whole dataset",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Report how many prisoners would be inserted, updated or unchanged without writing anything",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Number of processes to extract PDF pages with (default: one per CPU for large documents)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Extract every page from the PDF even if it was extracted before",
+    )
+    parser.add_argument(
+        "--no-snapshot",
+        action="store_true",
+        help="Don't write the columnar snapshot used by the snapshot analysis engine",
+    )
+    parser.add_argument(
+        "--no-dashboard-data",
+        action="store_true",
+        help="Don't write the static analysis the dashboard shows, and remove any written before, so it asks the API instead",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help=f"Number of rows parsed and loaded at a time, which bounds memory use (default: {CHUNK_SIZE})",
+    )
+
+    return parser.parse_args(args[1:])
+
+
 def main(args: List[str]) -> None:
     """
     Main function that orchestrates the script's functionality.
 
     Parameters:
     args: A list of arguments
+
+    Raises:
+    DataSourceError: If the dataset can't be read from the PDF.
     """
 
+    arguments = parse_arguments(args)
+
     logging.info("Starting processing...")
 
-    # Extract from PDF and load as an array of comma separated strings
-    raw_dataset = load_data()
+    # Stream the dataset from the PDF in chunks, so memory use depends on the chunk size rather than the PDF size
+    data_frames = iter_data_frames(
+        iter_dataset_lines(
+            iter_source_pages(arguments.workers, use_cache=not arguments.no_cache)
+        ),
+        arguments.chunk_size,
+    )
+
+    # Read up to the first chunk before writing anything, so a PDF without the dataset in it fails early
+    first_data_frame = next(data_frames, None)
+
+    if first_data_frame is None:
+        raise DataSourceError(f"The dataset in {DATA_SOURCE_NAME} has no rows")
 
-    # Convert the raw dataset to a Pandas DataFrame
-    data_frame = data_to_pandas(raw_dataset)
+    data_frames = itertools.chain([first_data_frame], data_frames)
 
-    # Perform basic analysis
-    analysis.perform_analysis(data_frame)
+    if arguments.incremental or arguments.dry_run:
+        # Only write the prisoners that have changed since the last load
+        counts = database.upsert_data_frames_to_database(
+            data_frames, dry_run=arguments.dry_run
+        )
 
-    # Load data into SQLite database
-    database.load_data_frame_to_database(data_frame)
+        print(
+            f"{'Would insert' if arguments.dry_run else 'Inserted'} {counts['inserted']}, "
+            f"{'would update' if arguments.dry_run else 'updated'} {counts['updated']}, "
+            f"unchanged {counts['unchanged']}"
+        )
+
+        if arguments.dry_run:
+            return
+    else:
+        # Load data into SQLite database
+        database.load_data_frames_to_database(data_frames)
+
+    # The version only changes if some prisoners did, so anything written from it already is up to date
+    dataset_token, dataset_version = database.get_dataset_token_and_version()
+
+    if not arguments.no_snapshot and snapshot.get_snapshot_token_and_version() != (
+        dataset_token,
+        dataset_version,
+    ):
+        # Write the columnar copy of the dataset for the snapshot analysis engine
+        snapshot.write_snapshot()
+
+    # Perform basic analysis. This aggregates in the database so the dataset doesn't need to be in memory
+    analysis_result = analysis_sql.perform_analysis()
+    analysis.log_analysis(analysis_result)
+
+    if arguments.no_dashboard_data:
+        # Don't leave an analysis of an older dataset for the dashboard to show
+        dashboard_data.remove_analysis()
+    elif dashboard_data.get_analysis_token_and_version() != (
+        dataset_token,
+        dataset_version,
+    ):
+        # Write the analysis for the dashboard, which reads it as a static file instead of asking the API
+        dashboard_data.write_analysis(analysis_result, dataset_token, dataset_version)
 
     # Test retrieve a record
     prisoner = database.get_prisoner_by_id(5)
@@ -166,9 +516,9 @@ def main(args: List[str]) -> None:
     else:
         print("Prisoner not found.")
 
-    # Test retrieve all records
-    paginated_prisoners = database.get_paginated_prisoners()
-    print("\nPrisoners list:")
+    # Test retrieve the first page of records
+    paginated_prisoners = database.get_paginated_prisoners(1, PREVIEW_SIZE)
+    print(f"\nPrisoners list (first {PREVIEW_SIZE}):")
     for prisoner in paginated_prisoners:
         print(
             f"Prisoner ID: {prisoner.prisoner_id}, Name: {prisoner.name}, Age: {prisoner.age}"
@@ -176,4 +526,9 @@ def main(args: List[str]) -> None:
 
 
 if __name__ == "__main__":
-    main(sys.argv)
+    try:
+        main(sys.argv)
+    except DataSourceError as e:
+        # Error out gracefully
+        logging.error(e)
+        sys.exit(1)
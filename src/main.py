@@ -7,15 +7,42 @@ Author: Jack Gilmore
 Date: 2024-06-12
 """
 
-from fastapi import FastAPI, HTTPException, Depends, Query
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
+from contextlib import asynccontextmanager
+import hashlib
 import os
 import analysis
+import analysis_fused
+import analysis_sql
+import auth
 import database
-from models import Prisoner, Prisoner_Out, Base
-from typing import Optional
+import database_async
+import export
+import responses
+import snapshot
+from cache import VersionedCache
+from compression import (
+    STATIC_BUILD_DIRECTORY,
+    STATIC_SOURCE_DIRECTORY,
+    CompressionMiddleware,
+    PrecompressedStaticFiles,
+)
+from dashboard_data import DASHBOARD_DATA_DIRECTORY
+from models import (
+    Analysis_Filters,
+    Prisoner,
+    Prisoner_Batch,
+    Prisoner_Batch_Request,
+    Prisoner_Out,
+    Prisoner_Page,
+    Base,
+)
+from sqlalchemy.exc import OperationalError
+from typing import Literal, Optional, Union
 
 # Load environment variables from .env file
 load_dotenv()
@@ -24,59 +51,396 @@ load_dotenv()
 USERNAME = os.getenv("API_USERNAME")
 PASSWORD = os.getenv("API_PASSWORD")
 
+# How many seconds the API can reuse a dataset version before checking the database again
+DATASET_VERSION_MAX_AGE = database.DATASET_VERSION_MAX_AGE
+
+# Which engine computes /api/analysis: "summary" reads the summary tables written by load_data.py,
+# "sql" aggregates in the database, "pandas" loads every prisoner into a DataFrame,
+# "snapshot" memory-maps the columnar snapshot written by load_data.py
+ANALYSIS_ENGINE = os.getenv("ANALYSIS_ENGINE", "summary")
+
+# A file of API users and their hashed passwords, made with auth.py. Without one, the API has the single user
+# set by API_USERNAME and API_PASSWORD
+CREDENTIALS_FILE = os.getenv("API_CREDENTIALS_FILE")
+
+# How many verified credentials are cached, and for how many seconds before their password is hashed again
+AUTH_CACHE_SIZE = int(os.getenv("API_AUTH_CACHE_SIZE", "1024"))
+AUTH_CACHE_TTL = float(os.getenv("API_AUTH_CACHE_TTL", "300"))
+
+# The most prisoners the API will return in a single response
+MAX_PAGE_SIZE = int(os.getenv("API_MAX_PAGE_SIZE", "1000"))
+
+# The most prisoner IDs the batch endpoint will look up in a single request
+MAX_BATCH_SIZE = int(os.getenv("API_MAX_BATCH_SIZE", "1000"))
+
+# How many rows the export endpoint reads from the database at a time
+EXPORT_CHUNK_SIZE = int(os.getenv("API_EXPORT_CHUNK_SIZE", "5000"))
+
+# Responses smaller than this many bytes are sent uncompressed
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("API_COMPRESSION_MIN_SIZE", "1000"))
+
+# The dashboard is served from the output of build_static.py if it has been built, otherwise straight from static
+STATIC_DIRECTORY = os.getenv("STATIC_DIRECTORY") or (
+    STATIC_BUILD_DIRECTORY
+    if os.path.isdir(STATIC_BUILD_DIRECTORY)
+    else STATIC_SOURCE_DIRECTORY
+)
+
+# How many /api/prisoners/{prisoner_id} responses are cached, and for how many seconds
+PRISONER_CACHE_SIZE = int(os.getenv("API_PRISONER_CACHE_SIZE", "1024"))
+PRISONER_CACHE_TTL = float(os.getenv("API_PRISONER_CACHE_TTL", "300"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Share one async engine and connection pool across every request
+    database_async.init_async_engine()
+    yield
+    await database_async.dispose_async_engine()
+
+
 # Create an instance of the FastAPI class
-app = FastAPI()
+# Endpoints return plain dicts and lists, which orjson encodes far quicker than the standard json module
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# Compress API responses with brotli or gzip, the static files are compressed when they're built
+app.add_middleware(CompressionMiddleware, minimum_size=COMPRESSION_MINIMUM_SIZE)
 
 # Create an instance of the HTTPBasic class
 security = HTTPBasic()
 
+# Check credentials against the users in the credentials file, or the one in .env
+credential_store = (
+    auth.HashedCredentialStore.from_file(CREDENTIALS_FILE)
+    if CREDENTIALS_FILE
+    else auth.PlainCredentialStore({USERNAME: PASSWORD} if USERNAME and PASSWORD else {})
+)
+authenticator = auth.Authenticator(
+    credential_store, max_entries=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL
+)
+
+# Cache of analysis results for the current dataset version, one per combination of filters
+analysis_cache = VersionedCache()
+
+# Cache of the serialised responses for the most requested prisoners in the current dataset version
+prisoner_cache = VersionedCache(
+    max_entries=PRISONER_CACHE_SIZE, ttl=PRISONER_CACHE_TTL
+)
+
 
 # Define a function to authenticate users
-def authenticate_user(credentials: HTTPBasicCredentials = Depends(security)):
-    if credentials.username != USERNAME or credentials.password != PASSWORD:
+async def authenticate_user(credentials: HTTPBasicCredentials = Depends(security)):
+    username, password = credentials.username, credentials.password
+
+    # Recently verified credentials are checked straight away, others are hashed in the threadpool
+    if not authenticator.is_cached(username, password) and not await run_in_threadpool(
+        authenticator.verify, username, password
+    ):
         raise HTTPException(status_code=401, detail="Incorrect credentials supplied")
     return True
 
 
-@app.get("/api/prisoners/{prisoner_id}")
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Checks if an If-None-Match header value matches an ETag
+
+    Parameters:
+    if_none_match (str): The If-None-Match header value, if any.
+    etag (str): The current ETag.
+
+    Returns:
+    bool: True if the client already has the current representation.
+    """
+    if not if_none_match:
+        return False
+
+    candidates = [candidate.strip() for candidate in if_none_match.split(",")]
+
+    return any(
+        candidate == "*" or candidate.removeprefix("W/") == etag
+        for candidate in candidates
+    )
+
+
+def analysis_cache_headers(etag: str) -> dict:
+    """
+    Gets the caching headers for an analysis response
+
+    Parameters:
+    etag (str): The ETag of the analysis.
+
+    Returns:
+    dict: The response headers.
+    """
+    return {"ETag": etag, "Cache-Control": "no-cache"}
+
+
+async def perform_pandas_analysis() -> dict:
+    """
+    Loads every prisoner into a DataFrame and analyses it with pandas.
+    The analysis runs in the threadpool so it doesn't hold up other requests.
+
+    Returns:
+    dict: A dict of all the analysis statistics
+    """
+    rows = await database_async.get_all_prisoner_rows()
+
+    if not rows:
+        raise HTTPException(status_code=404, detail="Prisoners not found")
+
+    prisoners = await run_in_threadpool(database.prisoner_rows_to_data_frame, rows)
+
+    return await run_in_threadpool(analysis.perform_analysis, prisoners)
+
+
+async def perform_sql_analysis(filters: Optional[Analysis_Filters] = None) -> dict:
+    """
+    Aggregates the prisoners table in the database
+
+    Parameters:
+    filters (Analysis_Filters, optional): Only analyse prisoners matching these filters. Defaults to every prisoner.
+
+    Returns:
+    dict: A dict of all the analysis statistics
+    """
+    aggregates = await database_async.run_sync(analysis_sql.sql_aggregates, filters)
+
+    return analysis.analysis_from_aggregates(*aggregates)
+
+
+async def perform_snapshot_analysis() -> dict:
+    """
+    Analyses the columnar snapshot with the fused engine, reading only the columns the analysis needs.
+    Falls back to the SQL engine if the snapshot is missing or was written from another database or dataset version.
+
+    Returns:
+    dict: A dict of all the analysis statistics
+    """
+    if (
+        snapshot.get_snapshot_token_and_version()
+        != await database_async.get_dataset_token_and_version(DATASET_VERSION_MAX_AGE)
+    ):
+        return await perform_sql_analysis()
+
+    prisoners = await run_in_threadpool(
+        snapshot.load_snapshot, snapshot.ANALYSIS_COLUMNS
+    )
+
+    return await run_in_threadpool(analysis_fused.perform_analysis, prisoners)
+
+
+async def perform_summary_analysis() -> dict:
+    """
+    Reads the analysis from the summary tables.
+    Falls back to the SQL engine if the database was loaded before summary tables existed.
+
+    Returns:
+    dict: A dict of all the analysis statistics
+    """
+    try:
+        aggregates = await database_async.run_sync(analysis_sql.summary_aggregates)
+    except OperationalError:
+        return await perform_sql_analysis()
+
+    return analysis.analysis_from_aggregates(*aggregates)
+
+
+ANALYSIS_ENGINES = {
+    "summary": perform_summary_analysis,
+    "pandas": perform_pandas_analysis,
+    "snapshot": perform_snapshot_analysis,
+    "sql": perform_sql_analysis,
+}
+
+if ANALYSIS_ENGINE not in ANALYSIS_ENGINES:
+    raise ValueError(
+        f"Unknown ANALYSIS_ENGINE {ANALYSIS_ENGINE}, expected one of {', '.join(ANALYSIS_ENGINES)}"
+    )
+
+
+# NOTE: Must be registered before /api/prisoners/{prisoner_id} so "export" isn't read as an ID
+@app.get("/api/prisoners/export")
+async def export_prisoners(
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    authenticated: bool = Depends(authenticate_user),
+) -> StreamingResponse:
+    chunks = database_async.iter_prisoner_rows(EXPORT_CHUNK_SIZE)
+
+    return StreamingResponse(
+        export.encode_rows(format, database.PRISONER_COLUMNS, chunks),
+        media_type=export.EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="prisoners.{format}"'},
+    )
+
+
+@app.post("/api/prisoners/batch", response_model=Prisoner_Batch)
+async def prisoners_by_ids(
+    batch: Prisoner_Batch_Request, authenticated: bool = Depends(authenticate_user)
+) -> ORJSONResponse:
+    if len(batch.ids) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_BATCH_SIZE} prisoner IDs can be requested at once",
+        )
+
+    prisoners, missing = await database_async.get_prisoner_rows_by_ids(batch.ids)
+
+    return ORJSONResponse(
+        {"items": responses.prisoner_dicts(prisoners), "missing": missing}
+    )
+
+
+@app.get("/api/prisoners/{prisoner_id}", response_model=Prisoner_Out)
 async def prisoner_by_id(
     prisoner_id: int, authenticated: bool = Depends(authenticate_user)
-) -> Prisoner_Out:
-    prisoner = database.get_prisoner_by_id(prisoner_id)
-    if prisoner:
-        return prisoner.to_out()
-    else:
-        raise HTTPException(status_code=404, detail="Prisoner not found")
+) -> Response:
+    dataset_token, dataset_version = await database_async.get_dataset_token_and_version(
+        DATASET_VERSION_MAX_AGE
+    )
+    content = prisoner_cache.get(dataset_version, prisoner_id, token=dataset_token)
+
+    if content is None:
+        prisoner = await database_async.get_prisoner_row_by_id(prisoner_id)
+
+        if not prisoner:
+            raise HTTPException(status_code=404, detail="Prisoner not found")
 
+        content = responses.prisoner_json(prisoner)
+        prisoner_cache.set(dataset_version, content, prisoner_id, token=dataset_token)
 
-@app.get("/api/prisoners")
+    return Response(content=content, media_type="application/json")
+
+
+@app.get("/api/prisoners", response_model=Union[Prisoner_Page, list[Prisoner_Out]])
 @app.get("/api/prisoners/", include_in_schema=False)
-def read_prisoners(
+async def read_prisoners(
     page: Optional[int] = Query(None, gt=0),
-    per_page: Optional[int] = Query(None, gt=0),
+    per_page: Optional[int] = Query(None, gt=0, le=MAX_PAGE_SIZE),
+    after: Optional[int] = Query(
+        None, ge=0, description="Return prisoners after this cursor (use 0 to start)"
+    ),
     authenticated: bool = Depends(authenticate_user),
-) -> list[Prisoner_Out]:
-    prisoners = database.get_paginated_prisoners(page, per_page)
+) -> ORJSONResponse:
+    per_page = per_page or MAX_PAGE_SIZE
+
+    # Cursor pagination stays fast however deep into the dataset you go
+    if after is not None:
+        prisoners, next_cursor = await database_async.get_prisoner_rows_after(
+            after, per_page
+        )
+        return ORJSONResponse(
+            {"items": responses.prisoner_dicts(prisoners), "next_cursor": next_cursor}
+        )
+
+    prisoners = await database_async.get_paginated_prisoner_rows(page or 1, per_page)
 
     if prisoners is None:
         raise HTTPException(status_code=404, detail="Prisoners not found")
 
-    return list(map(lambda prisoners: prisoners.to_out(), prisoners))
+    return ORJSONResponse(responses.prisoner_dicts(prisoners))
+
+
+async def analysis_filters(
+    prison: Optional[list[str]] = Query(None),
+    crime: Optional[list[str]] = Query(None),
+    gender: Optional[list[str]] = Query(None),
+    min_age: Optional[int] = Query(None, ge=0),
+    max_age: Optional[int] = Query(None, ge=0),
+    min_sentence: Optional[int] = Query(None, ge=0),
+    max_sentence: Optional[int] = Query(None, ge=0),
+) -> Analysis_Filters:
+    # Repeat prison, crime or gender to match any of several values
+    return Analysis_Filters(
+        prison=prison,
+        crime=crime,
+        gender=gender,
+        min_age=min_age,
+        max_age=max_age,
+        min_sentence=min_sentence,
+        max_sentence=max_sentence,
+    )
+
+
+def analysis_etag(
+    dataset_token: str, dataset_version: int, filters: Analysis_Filters
+) -> str:
+    """
+    Gets the ETag of the analysis of a dataset version with some filters applied
+
+    Parameters:
+    dataset_token (str): The token of the database the dataset is in.
+    dataset_version (int): The dataset version.
+    filters (Analysis_Filters): The filters.
+
+    Returns:
+    str: The ETag, which is different for every database, version and combination of filters.
+    """
+    if filters.is_empty():
+        return f'"analysis-{dataset_token}-{dataset_version}"'
+
+    filters_hash = hashlib.sha256(repr(filters.cache_key()).encode()).hexdigest()
+
+    return f'"analysis-{dataset_token}-{dataset_version}-{filters_hash[:16]}"'
 
 
 @app.get("/api/analysis")
 @app.get("/api/analysis/", include_in_schema=False)
-def analysis_output():
-    prisoners = database.get_all_prisoners_as_dataframe()
+async def analysis_output(
+    request: Request,
+    filters: Analysis_Filters = Depends(analysis_filters),
+) -> ORJSONResponse:
+    dataset_token, dataset_version = await database_async.get_dataset_token_and_version(
+        DATASET_VERSION_MAX_AGE
+    )
+    etag = analysis_etag(dataset_token, dataset_version, filters)
+
+    # The dashboard already has this version of the analysis so there's nothing to send
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=analysis_cache_headers(etag))
+
+    summary_analysis = analysis_cache.get(
+        dataset_version, filters.cache_key(), token=dataset_token
+    )
+
+    if summary_analysis is None:
+        if filters.is_empty():
+            summary_analysis = await ANALYSIS_ENGINES[ANALYSIS_ENGINE]()
+        else:
+            # Only the SQL engine can filter, the others work from precomputed or whole-dataset aggregates
+            summary_analysis = await perform_sql_analysis(filters)
+
+        analysis_cache.set(
+            dataset_version, summary_analysis, filters.cache_key(), token=dataset_token
+        )
+
+    if not summary_analysis["prisoners_by_crime_type"]:
+        raise HTTPException(status_code=404, detail="No prisoners match the filters")
+
+    return ORJSONResponse(summary_analysis, headers=analysis_cache_headers(etag))
 
-    if prisoners is None:
-        raise HTTPException(status_code=404, detail="Prisoners not found")
 
-    summary_analysis = analysis.perform_analysis(prisoners)
+@app.get("/api/cache/stats")
+async def cache_stats(authenticated: bool = Depends(authenticate_user)) -> dict:
+    # Hit, miss and eviction counts since the API started, for monitoring
+    return {
+        "prisoner": prisoner_cache.stats(),
+        "analysis": analysis_cache.stats(),
+        "dimension": database.dimension_cache.stats(),
+        "auth": authenticator.cache.stats(),
+    }
 
-    return summary_analysis
 
+# Mount the analysis load_data.py wrote for the dashboard, which is sent without touching the database.
+# The folder isn't there until the data has been loaded, and the dashboard asks the API until then
+if os.path.isdir(DASHBOARD_DATA_DIRECTORY):
+    app.mount(
+        "/data",
+        PrecompressedStaticFiles(directory=DASHBOARD_DATA_DIRECTORY),
+        name="dashboard_data",
+    )
 
 # Mount static files folder for dashboard
 # NOTE: Static file mount must come last
-app.mount("/", StaticFiles(directory="static", html=True), name="static")
+app.mount(
+    "/", PrecompressedStaticFiles(directory=STATIC_DIRECTORY, html=True), name="static"
+)
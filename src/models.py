@@ -11,6 +11,7 @@ from sqlalchemy import Column, Integer, String, BigInteger, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from pydantic import BaseModel
+from typing import Optional
 
 Base = declarative_base()
 
@@ -36,16 +37,61 @@ class Prison(Base):
     name = Column(String, nullable=False)
 
 
+class DatasetVersion(Base):
+    __tablename__ = "dataset_version"
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    # Every database counts its versions from 1, so this tells the data in one database from another's
+    token = Column(String)
+
+
+class CrimeGenderSummary(Base):
+    """
+    Prisoner counts and sentence totals for each combination of crime and gender, rebuilt whenever the data changes
+    """
+
+    __tablename__ = "summary_crime_gender"
+
+    crime_id = Column(Integer, ForeignKey("crime.id"), primary_key=True)
+    gender_id = Column(Integer, ForeignKey("gender.id"), primary_key=True)
+    prisoner_count = Column(Integer, nullable=False)
+    sentence_years_total = Column(BigInteger, nullable=False)
+
+
+class PrisonSummary(Base):
+    """
+    Prisoner counts for each prison, rebuilt whenever the data changes
+    """
+
+    __tablename__ = "summary_prison"
+
+    prison_id = Column(Integer, ForeignKey("prison.id"), primary_key=True)
+    prisoner_count = Column(Integer, nullable=False)
+
+
+class AgeBandSummary(Base):
+    """
+    Prisoner counts for each age band (an index into analysis.AGE_BAND_LABELS), rebuilt whenever the data changes
+    """
+
+    __tablename__ = "summary_age_band"
+
+    age_band = Column(Integer, primary_key=True)
+    prisoner_count = Column(Integer, nullable=False)
+
+
 class Prisoner(Base):
     __tablename__ = "prisoners"
 
     prisoner_id = Column(BigInteger, primary_key=True)
     name = Column(String, nullable=False)
-    age = Column(BigInteger, nullable=False)
-    gender_id = Column(Integer, ForeignKey("gender.id"), nullable=False)
-    crime_id = Column(Integer, ForeignKey("crime.id"), nullable=False)
+    # Indexed so filtered analysis can find matching prisoners without reading every row
+    age = Column(BigInteger, nullable=False, index=True)
+    gender_id = Column(Integer, ForeignKey("gender.id"), nullable=False, index=True)
+    crime_id = Column(Integer, ForeignKey("crime.id"), nullable=False, index=True)
     sentence_years = Column(Integer, nullable=False)
-    prison_id = Column(Integer, ForeignKey("prison.id"), nullable=False)
+    prison_id = Column(Integer, ForeignKey("prison.id"), nullable=False, index=True)
 
     gender = relationship("Gender", back_populates="prisoners")
     crime = relationship("Crime", back_populates="prisoners")
@@ -80,7 +126,49 @@ class Prisoner_Out(BaseModel):
     gender: str
     crime: str
     sentence_years: int
-    prison: str    
+    prison: str
+
+    @classmethod
+    def from_row(cls, row) -> "Prisoner_Out":
+        # Prisoner rows from database.py are already the right shape and types so skip validation
+        return cls.model_construct(**row._asdict())
+
+
+class Prisoner_Page(BaseModel):
+    items: list[Prisoner_Out]
+    next_cursor: Optional[int]
+
+
+class Prisoner_Batch_Request(BaseModel):
+    ids: list[int]
+
+
+class Prisoner_Batch(BaseModel):
+    # Found prisoners are in the order they were asked for, duplicate IDs are only returned once
+    items: list[Prisoner_Out]
+    missing: list[int]
+
+
+class Analysis_Filters(BaseModel):
+    # Prisoners match if they have any of the listed values, ranges include both ends
+    prison: Optional[list[str]] = None
+    crime: Optional[list[str]] = None
+    gender: Optional[list[str]] = None
+    min_age: Optional[int] = None
+    max_age: Optional[int] = None
+    min_sentence: Optional[int] = None
+    max_sentence: Optional[int] = None
+
+    def is_empty(self) -> bool:
+        return all(value is None for value in self.model_dump().values())
+
+    def cache_key(self) -> tuple:
+        # The same filters in a different order give the same key
+        return tuple(
+            (name, tuple(sorted(set(value))) if isinstance(value, list) else value)
+            for name, value in self.model_dump().items()
+            if value is not None
+        )
 
 Gender.prisoners = relationship(
     "Prisoner", order_by=Prisoner.prisoner_id, back_populates="gender"
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: responses.py
+Description: This script encodes API responses straight from database rows with orjson, skipping pydantic
+             validation for output we already trust. Return them in an ORJSONResponse.
+Author: Jack Gilmore
+Date: 2024-07-01
+"""
+
+import orjson
+from typing import Iterable, Sequence
+from database import PRISONER_COLUMNS
+
+# The same options as FastAPI's ORJSONResponse, so a single prisoner is encoded like a page of them
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+
+def prisoner_dicts(prisoners: Iterable[Sequence]) -> list[dict]:
+    """
+    Converts prisoner rows to the dicts the API returns, the same shape as models.Prisoner_Out
+
+    Parameters:
+    prisoners (Iterable[Sequence]): Prisoner rows in PRISONER_COLUMNS order.
+
+    Returns:
+    list[dict]: One dict per prisoner.
+    """
+    return [dict(zip(PRISONER_COLUMNS, prisoner)) for prisoner in prisoners]
+
+
+def prisoner_json(prisoner: Sequence) -> bytes:
+    """
+    Encodes a single prisoner row as JSON, the same shape as models.Prisoner_Out
+
+    Parameters:
+    prisoner (Sequence): A prisoner row in PRISONER_COLUMNS order.
+
+    Returns:
+    bytes: The JSON object.
+    """
+    return orjson.dumps(dict(zip(PRISONER_COLUMNS, prisoner)), option=JSON_OPTIONS)
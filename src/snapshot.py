@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: snapshot.py
+Description: This script writes and reads a columnar (Arrow IPC) snapshot of the prisoner dataset,
+             which can be memory-mapped for analysis instead of reading rows out of the database
+Author: Jack Gilmore
+Date: 2024-06-25
+"""
+
+import logging
+import os
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import database
+from typing import List, Optional
+from sqlalchemy import select, distinct
+from models import Prisoner
+
+# Constants
+SNAPSHOT_PATH = os.getenv("SNAPSHOT_PATH", "prisoners.arrow")
+SNAPSHOT_CHUNK_SIZE = 100_000
+
+# The columns analysis.perform_analysis needs
+ANALYSIS_COLUMNS = ["age", "gender", "crime", "sentence_years", "prison"]
+
+SNAPSHOT_SCHEMA = pa.schema(
+    [
+        ("prisoner_id", pa.int64()),
+        ("name", pa.string()),
+        ("age", pa.int64()),
+        ("gender", pa.dictionary(pa.int32(), pa.string())),
+        ("crime", pa.dictionary(pa.int32(), pa.string())),
+        ("sentence_years", pa.int64()),
+        ("prison", pa.dictionary(pa.int32(), pa.string())),
+    ]
+)
+
+
+def get_snapshot_dictionary(connection, column: str) -> tuple[pa.Array, np.ndarray]:
+    """
+    Builds the dictionary for a lookup column from the values prisoners actually use, sorted alphabetically,
+    so the categories read back match what grouping the plain strings would give.
+
+    Parameters:
+    connection (Connection): The database connection.
+    column (str): The prisoner data column, one of database.LOOKUP_COLUMNS.
+
+    Returns:
+    tuple[pa.Array, np.ndarray]: The dictionary values, and an array mapping lookup IDs to dictionary indices.
+    """
+    lookup_ids = database.get_lookup_ids(connection, column)
+    used_ids = set(
+        connection.execute(select(distinct(Prisoner.__table__.c[f"{column}_id"]))).scalars()
+    )
+
+    values = sorted(value for value, lookup_id in lookup_ids.items() if lookup_id in used_ids)
+
+    id_to_index = np.full(max(lookup_ids.values(), default=0) + 1, -1, dtype=np.int32)
+    for index, value in enumerate(values):
+        id_to_index[lookup_ids[value]] = index
+
+    return pa.array(values, type=pa.string()), id_to_index
+
+
+def write_snapshot(path: str = SNAPSHOT_PATH, chunk_size: int = SNAPSHOT_CHUNK_SIZE) -> int:
+    """
+    Writes the prisoners in the database to a columnar snapshot, a chunk at a time
+
+    Parameters:
+    path (str, optional): Where to write the snapshot. Defaults to SNAPSHOT_PATH.
+    chunk_size (int, optional): How many prisoners are read from the database at a time. Defaults to SNAPSHOT_CHUNK_SIZE.
+
+    Returns:
+    int: The number of prisoners written.
+    """
+
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    prisoner_table = Prisoner.__table__
+    prisoner_count = 0
+
+    with database.get_engine().connect() as connection:
+        dictionaries = {
+            column: get_snapshot_dictionary(connection, column)
+            for column in database.LOOKUP_COLUMNS
+        }
+
+        dataset_token, dataset_version = database.get_dataset_token_and_version()
+        schema = SNAPSHOT_SCHEMA.with_metadata(
+            {"dataset_token": dataset_token, "dataset_version": str(dataset_version)}
+        )
+
+        result = connection.execution_options(yield_per=chunk_size).execute(
+            select(
+                *(prisoner_table.c[column] for column in database.PRISONER_TABLE_COLUMNS)
+            ).order_by(prisoner_table.c.prisoner_id)
+        )
+
+        try:
+            with pa.OSFile(temporary_path, "wb") as sink, pa.ipc.new_file(
+                sink, schema
+            ) as writer:
+                for rows in result.partitions():
+                    columns = dict(zip(database.PRISONER_TABLE_COLUMNS, zip(*rows)))
+                    arrays = []
+
+                    for field in schema:
+                        if field.name in dictionaries:
+                            dictionary, id_to_index = dictionaries[field.name]
+                            indices = id_to_index[np.asarray(columns[f"{field.name}_id"])]
+                            arrays.append(
+                                pa.DictionaryArray.from_arrays(
+                                    pa.array(indices, type=pa.int32()), dictionary
+                                )
+                            )
+                        else:
+                            arrays.append(pa.array(columns[field.name], type=field.type))
+
+                    writer.write_batch(pa.record_batch(arrays, schema=schema))
+                    prisoner_count += len(rows)
+
+            os.replace(temporary_path, path)
+        finally:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+
+    logging.info(f"Wrote {prisoner_count} prisoners to snapshot {path}")
+
+    return prisoner_count
+
+
+def get_snapshot_token_and_version(
+    path: str = SNAPSHOT_PATH,
+) -> Optional[tuple[str, int]]:
+    """
+    Gets the database token and dataset version a snapshot was written from, without reading any of its data
+
+    Parameters:
+    path (str, optional): Where the snapshot is. Defaults to SNAPSHOT_PATH.
+
+    Returns:
+    tuple[str, int]: The token and dataset version, or None if there is no snapshot or it has no token.
+    """
+    if not os.path.exists(path):
+        return None
+
+    with pa.memory_map(path, "r") as source:
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+
+    token = metadata.get(b"dataset_token")
+    version = metadata.get(b"dataset_version")
+
+    if token is None or version is None:
+        return None
+
+    return token.decode(), int(version)
+
+
+def load_snapshot(
+    columns: Optional[List[str]] = None, path: str = SNAPSHOT_PATH
+) -> pd.DataFrame:
+    """
+    Loads the snapshot into a DataFrame. The file is memory-mapped and only the requested columns are read,
+    with lookup columns coming back as pandas categoricals.
+
+    Parameters:
+    columns (List[str], optional): The columns to load. Defaults to all of them.
+    path (str, optional): Where the snapshot is. Defaults to SNAPSHOT_PATH.
+
+    Returns:
+    pd.DataFrame: The prisoner dataset.
+    """
+
+    with pa.memory_map(path, "r") as source:
+        table = pa.ipc.open_file(source).read_all()
+
+        if columns is not None:
+            table = table.select(columns)
+
+        return table.to_pandas()
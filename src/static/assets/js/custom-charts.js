@@ -21,16 +21,59 @@ const dsBackgroundColours = [
 ];
 
 
-// Function to fetch data from the API endpoint
-async function fetchData() {
+// Function to fetch JSON, returning null if it can't be fetched
+async function fetchJson(url) {
     try {
-        const response = await fetch('/api/analysis');
-        const data = await response.json();
-        return data;
+        const response = await fetch(url);
+
+        if (response.ok) {
+            return await response.json();
+        }
     } catch (error) {
         console.error('Error fetching data:', error);
-        return [];
     }
+
+    return null;
+}
+
+// Function to fetch data for the dashboard
+// Without filters this is the analysis load_data.py wrote as a static file, as long as the API says it is for the current
+// dataset version. Otherwise, or if the file isn't there, the analysis comes from the API.
+// Filters in the page's query string (e.g. ?prison=Glasgow&min_age=30) are passed on to the API.
+async function fetchData() {
+    const filters = window.location.search;
+
+    if (filters) {
+        return (await fetchJson(`/api/analysis${filters}`)) ?? [];
+    }
+
+    const staticData = await fetchJson('/data/analysis.json');
+
+    if (!staticData) {
+        return (await fetchJson('/api/analysis')) ?? [];
+    }
+
+    try {
+        // The API answers 304 Not Modified without doing any work if the file is for the current dataset version,
+        // and sends the current analysis if it isn't
+        const response = await fetch('/api/analysis', {
+            cache: 'no-store',
+            headers: { 'If-None-Match': `"analysis-${staticData.dataset_token}-${staticData.dataset_version}"` }
+        });
+
+        if (response.status === 304) {
+            return staticData;
+        }
+
+        if (response.ok) {
+            return await response.json();
+        }
+    } catch (error) {
+        console.error('Error checking the dashboard data version:', error);
+    }
+
+    // The API couldn't say, so the file is the best there is
+    return staticData;
 }
 
 // Function to format a numerical year value into a string of years and months
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: conftest.py
+Description: This script contains the sample prisoner data and throwaway databases shared by the tests
+Author: Jack Gilmore
+Date: 2024-07-05
+"""
+
+import pytest
+import pandas as pd
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import database.py from src
+import database
+
+
+@pytest.fixture
+def sample_data() -> pd.DataFrame:
+    # ARRANGE: Sample data for testing, with ages on the edges of the age bands
+    return pd.DataFrame(
+        [
+            {
+                "prisoner_id": 1,
+                "name": "John Doe",
+                "age": 16,
+                "gender": "Male",
+                "crime": "Theft",
+                "sentence_years": 12,
+                "prison": "Edinburgh",
+            },
+            {
+                "prisoner_id": 2,
+                "name": "Jane Smith",
+                "age": 17,
+                "gender": "Female",
+                "crime": "Assault",
+                "sentence_years": 8,
+                "prison": "Glasgow",
+            },
+            {
+                "prisoner_id": 3,
+                "name": "Bob Johnson",
+                "age": 42,
+                "gender": "Male",
+                "crime": "Robbery",
+                "sentence_years": 15,
+                "prison": "Aberdeen",
+            },
+            {
+                "prisoner_id": 4,
+                "name": "Alice Brown",
+                "age": 74,
+                "gender": "Female",
+                "crime": "Theft",
+                "sentence_years": 10,
+                "prison": "Edinburgh",
+            },
+            {
+                "prisoner_id": 5,
+                "name": "Tom White",
+                "age": 75,
+                "gender": "Male",
+                "crime": "Assault",
+                "sentence_years": 7,
+                "prison": "Glasgow",
+            },
+            {
+                "prisoner_id": 6,
+                "name": "Sarah Green",
+                "age": 29,
+                "gender": "Female",
+                "crime": "Fraud",
+                "sentence_years": 3,
+                "prison": "Glasgow",
+            },
+        ]
+    )
+
+
+@pytest.fixture
+def numbered_sample_data() -> pd.DataFrame:
+    # ARRANGE: Enough sample prisoners to page through, numbered 1 to 25
+    return pd.DataFrame(
+        [
+            {
+                "prisoner_id": prisoner_id,
+                "name": f"Prisoner {prisoner_id}",
+                "age": 20 + prisoner_id,
+                "gender": "Male" if prisoner_id % 2 else "Female",
+                "crime": ["Theft", "Assault", "Fraud"][prisoner_id % 3],
+                "sentence_years": prisoner_id % 10 + 1,
+                "prison": ["Edinburgh", "Glasgow"][prisoner_id % 2],
+            }
+            for prisoner_id in range(1, 26)
+        ]
+    )
+
+
+@pytest.fixture
+def sample_database(tmp_path, sample_data) -> str:
+    # Point the database module at a throwaway database file loaded with the sample data.
+    # Override sample_data in a test module to load different prisoners
+    connection_string = f"sqlite:///{tmp_path / 'test.db'}"
+    database.init_engine(connection_string)
+    database.load_data_frame_to_database(sample_data)
+    yield connection_string
+    database.dispose_engine()
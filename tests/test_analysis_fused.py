@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_analysis_fused.py
+Description: This script is to test that analysis_fused.py gives the same results as analysis.py
+Author: Jack Gilmore
+Date: 2024-06-26
+"""
+
+import pytest
+import numpy as np
+import pandas as pd
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import the analysis engines and database.py from src
+import analysis
+import analysis_fused
+import database
+
+# ARRANGE: Random sample data for testing, with every age band edge included
+rng = np.random.default_rng(7)
+ages = np.concatenate([np.array(analysis.AGE_BAND_EDGES[1:-1]), rng.integers(10, 95, 500)])
+sample_data = pd.DataFrame(
+    {
+        "prisoner_id": np.arange(1, len(ages) + 1),
+        "name": [f"Prisoner {index}" for index in range(1, len(ages) + 1)],
+        "age": ages,
+        "gender": rng.choice(["Male", "Female"], len(ages)),
+        "crime": rng.choice(["Theft", "Assault", "Robbery", "Fraud", "Arson"], len(ages)),
+        "sentence_years": rng.integers(1, 40, len(ages)),
+        "prison": rng.choice(["Edinburgh", "Glasgow", "Aberdeen"], len(ages)),
+    }
+)
+
+
+@pytest.mark.parametrize(
+    "data_frame",
+    [sample_data, database.build_prisoner_data_frame(sample_data)],
+    ids=["object columns", "compact columns"],
+)
+def test_fused_analysis_matches_pandas_analysis(data_frame):
+    # ACT
+    expected = analysis.perform_analysis(sample_data)
+    result = analysis_fused.perform_analysis(data_frame)
+
+    # ASSERT
+    assert result == expected
+
+
+def test_fused_analysis_ignores_unused_categories():
+    # ARRANGE
+    data_frame = database.build_prisoner_data_frame(sample_data)
+    data_frame["crime"] = data_frame["crime"].cat.add_categories(["Piracy"])
+
+    # ACT
+    expected = analysis.perform_analysis(sample_data)
+    result = analysis_fused.perform_analysis(data_frame)
+
+    # ASSERT
+    assert result == expected
+
+
+def test_age_band_codes_match_pandas_cut():
+    # ACT
+    expected = pd.cut(
+        sample_data["age"], bins=analysis.AGE_BAND_EDGES, right=True, labels=False
+    )
+    result = analysis_fused.age_band_codes(sample_data["age"])
+
+    # ASSERT
+    assert result.tolist() == expected.tolist()
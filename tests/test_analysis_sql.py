@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_analysis_sql.py
+Description: This script is to test that analysis_sql.py gives the same results as analysis.py
+Author: Jack Gilmore
+Date: 2024-06-20
+"""
+
+import pytest
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import the analysis engines and database.py from src
+import analysis
+import analysis_sql
+import database
+from models import Analysis_Filters
+
+
+def test_sql_analysis_matches_pandas_analysis(sample_database, sample_data):
+    # ACT
+    expected = analysis.perform_analysis(sample_data)
+    result = analysis_sql.perform_analysis()
+
+    # ASSERT
+    assert result == expected
+
+
+def test_sql_analysis_preserves_ordering(sample_database, sample_data):
+    # ACT
+    expected = analysis.perform_analysis(sample_data)
+    result = analysis_sql.perform_analysis()
+
+    # ASSERT
+    assert list(result["gender_distribution_by_crime_type"]) == list(
+        expected["gender_distribution_by_crime_type"]
+    )
+    assert [row["gender"] for row in result["gender_distribution"]] == [
+        row["gender"] for row in expected["gender_distribution"]
+    ]
+
+
+def test_age_band_counts(sample_database):
+    # ACT
+    session = database.create_session()
+    try:
+        result = analysis_sql.age_band_counts(session)
+    finally:
+        session.close()
+
+    # ASSERT
+    expected_under_16 = 1
+    expected_16_to_17 = 1
+    expected_70_to_74 = 1
+    expected_75_or_over = 1
+
+    assert result[analysis.AGE_BAND_LABELS.index("Under 16")] == expected_under_16
+    assert result[analysis.AGE_BAND_LABELS.index("16-17")] == expected_16_to_17
+    assert result[analysis.AGE_BAND_LABELS.index("70-74")] == expected_70_to_74
+    assert result[analysis.AGE_BAND_LABELS.index("75 or over")] == expected_75_or_over
+
+
+def test_compact_data_frame_analysis_matches_pandas_analysis(sample_data):
+    # ACT
+    expected = analysis.perform_analysis(sample_data)
+    result = analysis.perform_analysis(database.build_prisoner_data_frame(sample_data))
+
+    # ASSERT
+    assert result == expected
+
+
+def test_summary_analysis_matches_pandas_analysis(sample_database, sample_data):
+    # ACT
+    expected = analysis.perform_analysis(sample_data)
+    result = analysis_sql.perform_summary_analysis()
+
+    # ASSERT
+    assert result == expected
+
+
+def test_summary_tables_follow_incremental_loads(sample_database, sample_data):
+    # ARRANGE
+    changed_data = sample_data.assign(
+        crime=sample_data["crime"].replace("Fraud", "Arson"),
+        age=sample_data["age"] + 1,
+    )
+
+    # ACT
+    database.upsert_data_frames_to_database([changed_data], dry_run=True)
+    dry_run_result = analysis_sql.perform_summary_analysis()
+    database.upsert_data_frames_to_database([changed_data])
+    result = analysis_sql.perform_summary_analysis()
+
+    # ASSERT
+    assert dry_run_result == analysis.perform_analysis(sample_data)
+    assert result == analysis.perform_analysis(changed_data)
+
+
+@pytest.mark.parametrize(
+    "filters, mask",
+    [
+        (
+            Analysis_Filters(prison=["Glasgow"]),
+            lambda data: data["prison"] == "Glasgow",
+        ),
+        (
+            Analysis_Filters(crime=["Theft", "Assault"], gender=["Male"]),
+            lambda data: data["crime"].isin(["Theft", "Assault"])
+            & (data["gender"] == "Male"),
+        ),
+        (
+            Analysis_Filters(min_age=17, max_age=42, max_sentence=12),
+            lambda data: data["age"].between(17, 42) & (data["sentence_years"] <= 12),
+        ),
+    ],
+)
+def test_filtered_sql_analysis_matches_pandas_analysis(
+    sample_database, sample_data, filters, mask
+):
+    # ACT
+    expected = analysis.perform_analysis(sample_data[mask(sample_data)])
+    result = analysis_sql.perform_analysis(filters)
+
+    # ASSERT
+    assert result == expected
+
+
+def test_filter_cache_key_ignores_order():
+    # ACT
+    result = Analysis_Filters(crime=["Theft", "Assault"], min_age=20).cache_key()
+    reordered = Analysis_Filters(min_age=20, crime=["Assault", "Theft"]).cache_key()
+
+    # ASSERT
+    assert result == reordered
+    assert Analysis_Filters().is_empty()
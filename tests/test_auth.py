@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_auth.py
+Description: This script is to test the password hashing, credential stores and cached authentication in auth.py
+Author: Jack Gilmore
+Date: 2024-07-04
+"""
+
+import pytest
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import auth.py from src
+import auth
+
+# ARRANGE: Cheap hashing parameters so the tests run quickly
+cheap_parameters = {"scrypt": {"n": 2**4}, "pbkdf2_sha256": {"iterations": 10}}
+
+
+class CountingStore(auth.CredentialStore):
+    # A store that counts how many times a password is checked against it
+    def __init__(self, store: auth.CredentialStore):
+        self.store = store
+        self.verifications = 0
+
+    def verify(self, username: str, password: str) -> bool:
+        self.verifications += 1
+        return self.store.verify(username, password)
+
+
+@pytest.mark.parametrize("scheme", ["scrypt", "pbkdf2_sha256"])
+def test_verify_password(scheme):
+    # ARRANGE
+    password_hash = auth.hash_password("secret", scheme, **cheap_parameters[scheme])
+
+    # ACT & ASSERT
+    assert password_hash.startswith(f"{scheme}$")
+    assert auth.verify_password("secret", password_hash)
+    assert not auth.verify_password("Secret", password_hash)
+
+
+@pytest.mark.parametrize(
+    "password_hash", ["", "md5$abc", "scrypt$16$8$1$!!$!!", "pbkdf2_sha256$x"]
+)
+def test_malformed_hashes_never_match(password_hash):
+    # ACT & ASSERT
+    assert not auth.verify_password("secret", password_hash)
+
+
+def test_hashed_credential_store_from_file(tmp_path):
+    # ARRANGE
+    path = tmp_path / "credentials"
+    path.write_text(
+        "# API users\n"
+        f"alice:{auth.hash_password('alice-password', n=2**4)}\n"
+        "\n"
+        f"bob:{auth.hash_password('bob-password', 'pbkdf2_sha256', iterations=10)}\n"
+    )
+
+    # ACT
+    store = auth.HashedCredentialStore.from_file(str(path))
+    store._unknown_user_hash = auth.hash_password("unused", n=2**4)
+
+    # ASSERT
+    assert sorted(store.password_hashes) == ["alice", "bob"]
+    assert store.verify("alice", "alice-password")
+    assert store.verify("bob", "bob-password")
+    assert not store.verify("alice", "bob-password")
+    assert not store.verify("carol", "alice-password")
+
+
+def test_plain_credential_store():
+    # ARRANGE
+    store = auth.PlainCredentialStore({"joebloggs": "a-very-secure-password"})
+
+    # ACT & ASSERT
+    assert store.verify("joebloggs", "a-very-secure-password")
+    assert not store.verify("joebloggs", "wrong")
+    assert not store.verify("someone", "a-very-secure-password")
+    assert not auth.PlainCredentialStore({}).verify("", "")
+
+
+def test_authenticator_caches_verified_credentials():
+    # ARRANGE
+    store = CountingStore(
+        auth.HashedCredentialStore({"alice": auth.hash_password("secret", n=2**4)})
+    )
+    authenticator = auth.Authenticator(store)
+
+    # ACT
+    first = authenticator.authenticate("alice", "secret")
+    second = authenticator.authenticate("alice", "secret")
+
+    # ASSERT
+    assert first and second
+    assert store.verifications == 1
+    assert authenticator.cache.stats()["hits"] == 1
+
+
+def test_authenticator_does_not_cache_failures():
+    # ARRANGE
+    store = CountingStore(auth.PlainCredentialStore({"alice": "secret"}))
+    authenticator = auth.Authenticator(store)
+    authenticator.authenticate("alice", "secret")
+
+    # ACT
+    wrong = [authenticator.authenticate("alice", "guess") for _ in range(3)]
+    right = authenticator.authenticate("alice", "secret")
+
+    # ASSERT
+    # Every wrong guess is checked against the store, and doesn't evict the verified password
+    assert wrong == [False, False, False]
+    assert right
+    assert store.verifications == 4
+    assert not authenticator.is_cached("alice", "guess")
+    assert authenticator.cache.stats()["hits"] == 1
+
+
+def test_credential_store_needs_verify():
+    # ACT & ASSERT
+    with pytest.raises(TypeError):
+        auth.CredentialStore()
+
+
+def test_authenticator_reverifies_expired_credentials():
+    # ARRANGE
+    store = CountingStore(auth.PlainCredentialStore({"alice": "secret"}))
+    authenticator = auth.Authenticator(store, ttl=0)
+
+    # ACT
+    authenticator.authenticate("alice", "secret")
+    result = authenticator.authenticate("alice", "secret")
+
+    # ASSERT
+    assert result
+    assert store.verifications == 2
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_cache.py
+Description: This script is to test cache.py classes
+Author: Jack Gilmore
+Date: 2024-06-20
+"""
+
+import pytest
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import cache.py from src
+import cache
+from cache import VersionedCache
+
+
+def test_versioned_cache_returns_value_for_same_version():
+    # ARRANGE
+    cache = VersionedCache()
+
+    # ACT
+    cache.set(1, {"count": 5})
+    result = cache.get(1)
+
+    # ASSERT
+    assert result == {"count": 5}
+
+
+def test_versioned_cache_discards_values_from_older_versions():
+    # ARRANGE
+    cache = VersionedCache()
+    cache.set(1, "first", key="a")
+
+    # ACT
+    cache.set(2, "second", key="b")
+
+    # ASSERT
+    assert cache.get(1, key="a") is None
+    assert cache.get(2, key="a") is None
+    assert cache.get(2, key="b") == "second"
+
+
+def test_versioned_cache_ignores_values_for_stale_versions():
+    # ARRANGE
+    cache = VersionedCache()
+    cache.set(2, "new")
+
+    # ACT
+    cache.set(1, "old")
+
+    # ASSERT
+    assert cache.get(2) == "new"
+
+
+def test_versioned_cache_keeps_databases_apart():
+    # ARRANGE: Every database counts its versions from 1
+    cache = VersionedCache()
+    cache.set(2, "first database", token="first")
+
+    # ACT
+    other_database = cache.get(2, token="second")
+    cache.set(1, "second database", token="second")
+
+    # ASSERT
+    assert other_database is None
+    assert cache.get(2, token="first") is None
+    assert cache.get(1, token="second") == "second database"
+
+
+def test_versioned_cache_evicts_least_recently_used_entry():
+    # ARRANGE
+    cache = VersionedCache(max_entries=2)
+    cache.set(1, "a", key="a")
+    cache.set(1, "b", key="b")
+    cache.get(1, key="a")
+
+    # ACT
+    cache.set(1, "c", key="c")
+
+    # ASSERT
+    assert cache.get(1, key="a") == "a"
+    assert cache.get(1, key="b") is None
+    assert cache.get(1, key="c") == "c"
+
+
+def test_versioned_cache_expires_entries_after_ttl(monkeypatch):
+    # ARRANGE: Control the clock the cache reads
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    versioned_cache = VersionedCache(ttl=10)
+    versioned_cache.set(1, "a", key="a")
+
+    # ACT
+    now[0] = 109.0
+    before_expiry = versioned_cache.get(1, key="a")
+    now[0] = 110.0
+    after_expiry = versioned_cache.get(1, key="a")
+
+    # ASSERT
+    assert before_expiry == "a"
+    assert after_expiry is None
+    assert versioned_cache.stats()["entries"] == 0
+
+
+def test_versioned_cache_counts_hits_misses_and_evictions():
+    # ARRANGE
+    versioned_cache = VersionedCache(max_entries=1)
+
+    # ACT
+    versioned_cache.set(1, "a", key="a")
+    versioned_cache.get(1, key="a")
+    versioned_cache.set(1, "b", key="b")
+    versioned_cache.get(1, key="a")
+    versioned_cache.get(2, key="b")
+
+    # ASSERT
+    assert versioned_cache.stats() == {
+        "entries": 1,
+        "max_entries": 1,
+        "ttl": None,
+        "hits": 1,
+        "misses": 2,
+        "evictions": 1,
+    }
+
+
+def test_versioned_cache_counts_values_that_dont_match_as_misses():
+    # ARRANGE
+    versioned_cache = VersionedCache()
+    versioned_cache.set(1, "a", key="a")
+
+    # ACT
+    mismatch = versioned_cache.get(1, key="a", matches=lambda value: value == "b")
+    match = versioned_cache.get(1, key="a", matches=lambda value: value == "a")
+
+    # ASSERT
+    stats = versioned_cache.stats()
+
+    assert mismatch is None
+    assert match == "a"
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 1, 1)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_compression.py
+Description: This script is to test response compression and the pre-compressed static files
+Author: Jack Gilmore
+Date: 2024-07-02
+"""
+
+import pytest
+import sys
+import os
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from fastapi.testclient import TestClient
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import the compression helpers and the static build script from src
+import build_static
+from compression import (
+    CompressionMiddleware,
+    PrecompressedStaticFiles,
+    accepted_encodings,
+    IMMUTABLE_CACHE_CONTROL,
+    REVALIDATE_CACHE_CONTROL,
+)
+
+# ARRANGE: Sample responses for testing
+large_text = "prisoner_id,name,age\n" * 500
+small_text = "ok"
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, minimum_size=500)
+
+    @app.get("/large")
+    def large():
+        return PlainTextResponse(large_text)
+
+    @app.get("/small")
+    def small():
+        return PlainTextResponse(small_text)
+
+    @app.get("/stream")
+    def stream():
+        return StreamingResponse(iter([large_text] * 3), media_type="text/csv")
+
+    @app.get("/image")
+    def image():
+        return Response(b"\x89PNG" * 500, media_type="image/png")
+
+    return TestClient(app)
+
+
+@pytest.fixture
+def static_client(tmp_path):
+    # Build a small dashboard with one asset linked from the page
+    source = tmp_path / "static"
+    (source / "assets").mkdir(parents=True)
+    (source / "assets" / "app.js").write_text("console.log('dashboard');\n" * 200)
+    (source / "index.html").write_text(
+        '<html><script src="/assets/app.js"></script></html>' + " " * 2000
+    )
+    output = tmp_path / "static_build"
+    manifest = build_static.build_static(str(source), str(output))
+
+    app = FastAPI()
+    app.mount("/", PrecompressedStaticFiles(directory=output, html=True))
+
+    return TestClient(app), manifest, output
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate, br", ["br", "gzip"]),
+        ("gzip;q=1.0, br;q=0", ["gzip"]),
+        ("identity", []),
+        ("", []),
+    ],
+)
+def test_accepted_encodings_prefers_brotli(accept_encoding, expected):
+    # ACT
+    result = accepted_encodings(accept_encoding)
+
+    # ASSERT
+    assert result == expected
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip"])
+def test_large_responses_are_compressed(client, encoding):
+    # ACT
+    response = client.get("/large", headers={"Accept-Encoding": encoding})
+
+    # ASSERT
+    assert response.headers["content-encoding"] == encoding
+    assert int(response.headers["content-length"]) < len(large_text)
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.text == large_text
+
+
+def test_streamed_responses_are_compressed(client):
+    # ACT
+    response = client.get("/stream", headers={"Accept-Encoding": "br"})
+
+    # ASSERT
+    assert response.headers["content-encoding"] == "br"
+    assert response.text == large_text * 3
+
+
+@pytest.mark.parametrize(
+    "path, accept_encoding",
+    [("/small", "br"), ("/image", "br"), ("/large", "identity")],
+)
+def test_responses_not_worth_compressing_are_sent_as_they_are(
+    client, path, accept_encoding
+):
+    # ACT
+    response = client.get(path, headers={"Accept-Encoding": accept_encoding})
+
+    # ASSERT
+    assert "content-encoding" not in response.headers
+
+
+def test_build_static_links_pages_to_hashed_assets(static_client):
+    # ARRANGE
+    _, manifest, output = static_client
+
+    # ACT
+    page = (output / "index.html").read_text()
+
+    # ASSERT
+    hashed_url = manifest["/assets/app.js"]
+    assert hashed_url != "/assets/app.js"
+    assert f'src="{hashed_url}"' in page
+    assert (output / hashed_url.lstrip("/")).exists()
+    assert (output / (hashed_url.lstrip("/") + ".br")).exists()
+    assert (output / (hashed_url.lstrip("/") + ".gz")).exists()
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip"])
+def test_static_files_serve_precompressed_variants(static_client, encoding):
+    # ARRANGE
+    client, manifest, output = static_client
+    hashed_url = manifest["/assets/app.js"]
+
+    # ACT
+    response = client.get(hashed_url, headers={"Accept-Encoding": encoding})
+
+    # ASSERT
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.text == (output / hashed_url.lstrip("/")).read_text()
+
+
+def test_static_pages_are_revalidated(static_client):
+    # ARRANGE
+    client, _, _ = static_client
+    response = client.get("/", headers={"Accept-Encoding": "br"})
+
+    # ACT
+    revalidated = client.get(
+        "/",
+        headers={"Accept-Encoding": "br", "If-None-Match": response.headers["etag"]},
+    )
+
+    # ASSERT
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["cache-control"] == REVALIDATE_CACHE_CONTROL
+    assert revalidated.status_code == 304
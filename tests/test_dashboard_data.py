@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_dashboard_data.py
+Description: This script is to test the static dashboard analysis written by dashboard_data.py
+Author: Jack Gilmore
+Date: 2024-07-03
+"""
+
+import brotli
+import gzip
+import orjson
+import sys
+import os
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import analysis_sql.py, dashboard_data.py and database.py from src
+import analysis_sql
+import dashboard_data
+import database
+from compression import PrecompressedStaticFiles
+
+
+def make_client(directory: str) -> TestClient:
+    # Mount the folder like main.py does
+    os.makedirs(directory, exist_ok=True)
+    app = FastAPI()
+    app.mount("/data", PrecompressedStaticFiles(directory=directory))
+
+    return TestClient(app)
+
+
+def test_write_analysis_matches_api_analysis(sample_database, tmp_path):
+    # ARRANGE
+    analysis_result = analysis_sql.perform_analysis()
+    dataset_token, dataset_version = database.get_dataset_token_and_version()
+
+    # ACT
+    path = dashboard_data.write_analysis(
+        analysis_result, dataset_token, dataset_version, str(tmp_path / "data")
+    )
+
+    # ASSERT
+    with open(path, "rb") as file:
+        content = file.read()
+
+    with open(path + ".br", "rb") as file:
+        assert brotli.decompress(file.read()) == content
+
+    with open(path + ".gz", "rb") as file:
+        assert gzip.decompress(file.read()) == content
+
+    result = orjson.loads(content)
+
+    assert result.pop("dataset_token") == dataset_token
+    assert result.pop("dataset_version") == dataset_version
+    assert result == orjson.loads(orjson.dumps(analysis_result))
+
+
+def test_write_analysis_replaces_previous_version(sample_database, tmp_path):
+    # ARRANGE
+    directory = str(tmp_path / "data")
+    analysis_result = analysis_sql.perform_analysis()
+    dashboard_data.write_analysis(analysis_result, "token", 1, directory)
+
+    # ACT
+    path = dashboard_data.write_analysis(analysis_result, "token", 2, directory)
+
+    # ASSERT
+    with open(path + ".br", "rb") as file:
+        assert orjson.loads(brotli.decompress(file.read()))["dataset_version"] == 2
+
+    assert sorted(os.listdir(directory)) == [
+        "analysis.json",
+        "analysis.json.br",
+        "analysis.json.gz",
+    ]
+
+
+def test_analysis_is_served_as_a_static_file(sample_database, tmp_path):
+    # ARRANGE
+    directory = str(tmp_path / "data")
+    client = make_client(directory)
+
+    # ACT
+    missing = client.get("/data/analysis.json")
+    dashboard_data.write_analysis(
+        analysis_sql.perform_analysis(),
+        *database.get_dataset_token_and_version(),
+        directory,
+    )
+    response = client.get("/data/analysis.json", headers={"Accept-Encoding": "br"})
+    revalidated = client.get(
+        "/data/analysis.json",
+        headers={"Accept-Encoding": "br", "If-None-Match": response.headers["etag"]},
+    )
+
+    # ASSERT
+    # The dashboard falls back to the API until the data has been loaded
+    assert missing.status_code == 404
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+    assert response.json()["prisoners_by_crime_type"]
+    assert revalidated.status_code == 304
+
+
+def test_get_analysis_token_and_version(sample_database, tmp_path):
+    # ARRANGE
+    directory = str(tmp_path / "data")
+    missing = dashboard_data.get_analysis_token_and_version(directory)
+
+    # ACT
+    dashboard_data.write_analysis(
+        analysis_sql.perform_analysis(), "token", 3, directory
+    )
+
+    # ASSERT
+    assert missing is None
+    assert dashboard_data.get_analysis_token_and_version(directory) == ("token", 3)
+
+
+def test_remove_analysis_removes_compressed_variants(sample_database, tmp_path):
+    # ARRANGE
+    directory = str(tmp_path / "data")
+    dashboard_data.write_analysis(
+        analysis_sql.perform_analysis(), "token", 1, directory
+    )
+
+    # ACT
+    dashboard_data.remove_analysis(directory)
+    dashboard_data.remove_analysis(directory)
+
+    # ASSERT
+    assert os.listdir(directory) == []
+    assert dashboard_data.get_analysis_token_and_version(directory) is None
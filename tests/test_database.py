@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_database.py
+Description: This script is to test database.py functions
+Author: Jack Gilmore
+Date: 2024-06-20
+"""
+
+import pytest
+import pandas as pd
+import sqlalchemy
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import database.py from src
+import database
+
+
+@pytest.fixture
+def sample_data(numbered_sample_data):
+    # These tests page through more prisoners than the default sample data has
+    return numbered_sample_data
+
+
+def test_load_data_frame_to_database_bumps_dataset_version(
+    sample_database, sample_data
+):
+    # ARRANGE
+    version_before = database.get_dataset_version()
+
+    # ACT
+    database.load_data_frame_to_database(sample_data)
+
+    # ASSERT
+    assert database.get_dataset_version() == version_before + 1
+
+
+def test_separately_loaded_databases_have_different_tokens(
+    sample_database, sample_data, tmp_path
+):
+    # ARRANGE
+    token, version = database.get_dataset_token_and_version()
+
+    # ACT
+    database.init_engine(f"sqlite:///{tmp_path / 'other.db'}")
+    database.load_data_frame_to_database(sample_data)
+
+    # ASSERT
+    other_token, other_version = database.get_dataset_token_and_version()
+
+    assert other_version == version
+    assert other_token != token
+    assert len(other_token) == len(token) == 32
+
+
+def test_loading_gives_older_databases_a_token(sample_database, sample_data):
+    # ARRANGE: A database created before the dataset version had a token
+    with database.get_engine().begin() as connection:
+        connection.exec_driver_sql("ALTER TABLE dataset_version DROP COLUMN token")
+
+    database.init_engine(sample_database)
+    version_before = database.get_dataset_token_and_version()
+
+    # ACT
+    database.upsert_data_frames_to_database([sample_data.assign(name="Renamed")])
+
+    # ASSERT
+    token, version = database.get_dataset_token_and_version()
+
+    assert version_before == ("", 0)
+    assert token
+    assert version == 2
+
+
+def test_pooled_connections_have_sqlite_pragmas_applied(sample_database):
+    # ACT
+    with database.get_engine().connect() as connection:
+        foreign_keys = connection.exec_driver_sql("PRAGMA foreign_keys").scalar()
+        journal_mode = connection.exec_driver_sql("PRAGMA journal_mode").scalar()
+
+    # ASSERT
+    assert foreign_keys == 1
+    assert journal_mode == "wal"
+
+
+def test_load_data_frames_to_database_loads_chunks_in_batches(
+    sample_database, sample_data
+):
+    # ARRANGE
+    chunks = [sample_data.iloc[:10], sample_data.iloc[10:]]
+
+    # ACT
+    loaded_count = database.load_data_frames_to_database(chunks, batch_size=4)
+
+    # ASSERT
+    prisoners = database.get_all_prisoners_as_dataframe()
+
+    assert loaded_count == len(sample_data)
+    assert prisoners["prisoner_id"].tolist() == sample_data["prisoner_id"].tolist()
+    assert database.get_prisoner_by_id(3).to_out().model_dump() == {
+        "prisoner_id": 3,
+        "name": "Prisoner 3",
+        "age": 23,
+        "gender": "Male",
+        "crime": "Theft",
+        "sentence_years": 4,
+        "prison": "Glasgow",
+    }
+
+
+@pytest.mark.parametrize("chunks_before_failure", [0, 1])
+def test_failed_load_keeps_current_prisoners(
+    sample_database, sample_data, chunks_before_failure
+):
+    # ARRANGE: A dataset that can't be read past its first few chunks
+    version_before = database.get_dataset_version()
+
+    def failing_chunks():
+        for start in range(0, chunks_before_failure * 10, 10):
+            yield sample_data.iloc[start : start + 10].assign(name="Replacement")
+
+        raise ValueError("Could not read the rest of the dataset")
+
+    # ACT
+    with pytest.raises(ValueError):
+        database.load_data_frames_to_database(failing_chunks(), batch_size=4)
+
+    # ASSERT
+    prisoners = database.get_all_prisoners_as_dataframe()
+
+    assert database.get_dataset_version() == version_before
+    assert prisoners["prisoner_id"].tolist() == sample_data["prisoner_id"].tolist()
+    assert "Replacement" not in prisoners["name"].tolist()
+    assert not sqlalchemy.inspect(database.get_engine()).has_table(
+        database.PRISONER_STAGING_TABLE_NAME
+    )
+
+
+def test_reloading_reuses_lookup_rows(sample_database, sample_data):
+    # ACT
+    database.load_data_frame_to_database(sample_data)
+
+    # ASSERT
+    with database.get_engine().connect() as connection:
+        crime_ids = database.get_lookup_ids(connection, "crime")
+
+    expected_crimes = {"Theft", "Assault", "Fraud"}
+
+    assert set(crime_ids) == expected_crimes
+    assert len(set(crime_ids.values())) == len(expected_crimes)
+
+
+def test_upsert_reports_and_writes_only_changes(sample_database, sample_data):
+    # ARRANGE
+    changed_data = sample_data.copy()
+    changed_data.loc[changed_data["prisoner_id"] == 3, "sentence_years"] = 30
+    new_prisoner = changed_data.iloc[[0]].assign(prisoner_id=26, crime="Arson")
+    changed_data = pd.concat([changed_data, new_prisoner], ignore_index=True)
+
+    # ACT
+    counts = database.upsert_data_frames_to_database([changed_data])
+
+    # ASSERT
+    expected_counts = {"inserted": 1, "updated": 1, "unchanged": 24}
+
+    assert counts == expected_counts
+    assert database.get_prisoner_by_id(3).sentence_years == 30
+    assert database.get_prisoner_by_id(26).crime.name == "Arson"
+
+
+def test_upsert_dry_run_writes_nothing(sample_database, sample_data):
+    # ARRANGE
+    version_before = database.get_dataset_version()
+    changed_data = sample_data.assign(crime="Arson")
+
+    # ACT
+    counts = database.upsert_data_frames_to_database([changed_data], dry_run=True)
+
+    # ASSERT
+    with database.get_engine().connect() as connection:
+        crime_ids = database.get_lookup_ids(connection, "crime")
+
+    assert counts["updated"] == len(sample_data)
+    assert database.get_prisoner_by_id(1).crime.name != "Arson"
+    assert "Arson" not in crime_ids
+    assert database.get_dataset_version() == version_before
+
+
+def test_upsert_of_unchanged_data_keeps_dataset_version(sample_database, sample_data):
+    # ARRANGE
+    version_before = database.get_dataset_version()
+
+    # ACT
+    counts = database.upsert_data_frames_to_database([sample_data])
+
+    # ASSERT
+    assert counts["unchanged"] == len(sample_data)
+    assert database.get_dataset_version() == version_before
+
+
+def test_build_prisoner_data_frame_uses_compact_types(sample_data):
+    # ACT
+    result = database.build_prisoner_data_frame(sample_data)
+    report = database.get_memory_report(sample_data, result)
+
+    # ASSERT
+    assert result["crime"].cat.categories.tolist() == ["Assault", "Fraud", "Theft"]
+    assert result["age"].dtype == "int8"
+    assert result["name"].tolist() == sample_data["name"].tolist()
+    assert report.loc["total", "after"] < report.loc["total", "before"]
+
+
+def test_get_all_prisoners_as_dataframe_is_compact(sample_database, sample_data):
+    # ACT
+    result = database.get_all_prisoners_as_dataframe()
+
+    # ASSERT
+    assert isinstance(result["prison"].dtype, pd.CategoricalDtype)
+    assert result.astype({"gender": str, "crime": str, "prison": str}).equals(
+        sample_data.astype(result.dtypes.drop(["gender", "crime", "prison"]))
+    )
+
+
+def test_loading_creates_prisoner_indexes(sample_database):
+    # ACT
+    indexes = sqlalchemy.inspect(database.get_engine()).get_indexes("prisoners")
+
+    # ASSERT
+    indexed_columns = {column for index in indexes for column in index["column_names"]}
+
+    assert {"age", "gender_id", "crime_id", "prison_id"} <= indexed_columns
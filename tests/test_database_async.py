@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_database_async.py
+Description: This script is to test the async prisoner reads in database_async.py
+Author: Jack Gilmore
+Date: 2024-06-29
+"""
+
+import pytest
+import sqlalchemy
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import the analysis engines, both database modules and models.py from src
+import analysis_sql
+import database
+import database_async
+from models import Prisoner_Out
+
+# Run the async tests on asyncio, which is what uvicorn uses
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def sample_data(numbered_sample_data):
+    # These tests page through more prisoners than the default sample data has
+    return numbered_sample_data
+
+
+@pytest.fixture
+async def async_database(sample_database):
+    # Point the async engine at the sample database too
+    database_async.init_async_engine(sample_database)
+    yield
+    await database_async.dispose_async_engine()
+
+
+async def test_get_prisoner_row_by_id_matches_orm_record(async_database):
+    # ACT
+    row = await database_async.get_prisoner_row_by_id(7)
+    prisoner = database.get_prisoner_by_id(7)
+
+    # ASSERT
+    assert Prisoner_Out.from_row(row) == prisoner.to_out()
+
+
+async def test_get_prisoner_row_by_id_returns_none_when_missing(async_database):
+    # ACT
+    row = await database_async.get_prisoner_row_by_id(999)
+
+    # ASSERT
+    assert row is None
+
+
+async def test_get_prisoner_rows_after_walks_every_prisoner_once(async_database):
+    # ACT
+    seen_ids = []
+    cursor = 0
+    while cursor is not None:
+        prisoners, cursor = await database_async.get_prisoner_rows_after(cursor, 10)
+        seen_ids += [prisoner.prisoner_id for prisoner in prisoners]
+
+    # ASSERT
+    assert seen_ids == list(range(1, 26))
+
+
+async def test_get_prisoner_rows_after_returns_next_cursor(async_database):
+    # ACT
+    prisoners, next_cursor = await database_async.get_prisoner_rows_after(5, 10)
+
+    # ASSERT
+    expected_first_id = 6
+    expected_next_cursor = 15
+
+    assert prisoners[0].prisoner_id == expected_first_id
+    assert next_cursor == expected_next_cursor
+
+
+async def test_get_prisoner_rows_after_has_no_cursor_on_last_page(async_database):
+    # ACT
+    prisoners, next_cursor = await database_async.get_prisoner_rows_after(20, 5)
+
+    # ASSERT
+    expected_count = 5
+
+    assert len(prisoners) == expected_count
+    assert next_cursor is None
+
+
+async def test_get_prisoner_rows_by_ids_keeps_requested_order(
+    async_database, monkeypatch
+):
+    # ARRANGE: Small chunks so the IDs are split over several IN queries
+    monkeypatch.setattr(database, "SQL_IN_CHUNK_SIZE", 2)
+
+    # ACT
+    rows, missing = await database_async.get_prisoner_rows_by_ids(
+        [9, 999, 3, 9, 25, 0, 1]
+    )
+
+    # ASSERT
+    assert [row.prisoner_id for row in rows] == [9, 3, 25, 1]
+    assert rows[0] == (9, "Prisoner 9", 29, "Male", "Theft", 10, "Glasgow")
+    assert missing == [999, 0]
+
+
+async def test_get_paginated_prisoner_rows(async_database):
+    # ACT
+    rows = await database_async.get_paginated_prisoner_rows(page=3, per_page=10)
+
+    # ASSERT
+    assert [row.prisoner_id for row in rows] == list(range(21, 26))
+
+
+async def test_iter_prisoner_rows_streams_in_chunks(async_database):
+    # ACT
+    chunks = [chunk async for chunk in database_async.iter_prisoner_rows(10)]
+
+    # ASSERT
+    expected_chunk_sizes = [10, 10, 5]
+
+    assert [len(chunk) for chunk in chunks] == expected_chunk_sizes
+    assert tuple(chunks[0][0]) == (1, "Prisoner 1", 21, "Male", "Assault", 2, "Glasgow")
+
+
+async def test_prisoner_reads_only_query_prisoners_table_once_dimensions_cached(
+    async_database,
+):
+    # ARRANGE: Record every query sent to the database after the first read
+    await database_async.get_prisoner_row_by_id(1)
+    statements = []
+    sqlalchemy.event.listen(
+        database_async.get_async_engine().sync_engine,
+        "before_cursor_execute",
+        lambda conn, cursor, statement, *args: statements.append(statement),
+    )
+
+    # ACT
+    row = await database_async.get_prisoner_row_by_id(7)
+    rows, _ = await database_async.get_prisoner_rows_after(0, 5)
+
+    # ASSERT
+    assert (row.gender, row.crime, row.prison) == ("Male", "Assault", "Glasgow")
+    assert len(rows) == 5
+    assert statements
+    assert all("FROM prisoners" in statement for statement in statements)
+    assert not any("JOIN" in statement for statement in statements)
+
+
+async def test_prisoner_reads_see_lookup_values_added_after_caching(
+    async_database, sample_data
+):
+    # ARRANGE: Cache the dimensions, then add a prisoner with a new crime
+    await database_async.get_prisoner_row_by_id(1)
+    new_prisoner = sample_data.iloc[[0]].assign(prisoner_id=100, crime="Arson")
+    database.upsert_data_frames_to_database([new_prisoner])
+
+    # ACT
+    row = await database_async.get_prisoner_row_by_id(100)
+
+    # ASSERT
+    assert row.crime == "Arson"
+
+
+async def test_prisoner_reads_refresh_dimensions_for_unknown_lookup_ids(
+    async_database,
+):
+    # ARRANGE: Cache the dimensions, then move a prisoner to a new prison without bumping the dataset version
+    await database_async.get_prisoner_row_by_id(1)
+
+    with database.get_engine().begin() as connection:
+        connection.execute(
+            sqlalchemy.text("INSERT INTO prison (id, name) VALUES (99, 'Perth')")
+        )
+        connection.execute(
+            sqlalchemy.text("UPDATE prisoners SET prison_id = 99 WHERE prisoner_id = 1")
+        )
+
+    # ACT
+    row = await database_async.get_prisoner_row_by_id(1)
+
+    # ASSERT
+    assert row.prison == "Perth"
+
+
+async def test_run_sync_shares_analysis_queries(async_database):
+    # ACT
+    result = await database_async.run_sync(analysis_sql.summary_aggregates)
+
+    # ASSERT
+    session = database.create_session()
+    try:
+        assert result == analysis_sql.sql_aggregates(session)
+    finally:
+        session.close()
+
+
+async def test_get_dataset_version_matches_sync(async_database):
+    # ACT
+    result = await database_async.get_dataset_version()
+
+    # ASSERT
+    assert result == database.get_dataset_version()
+
+
+async def test_async_connections_have_sqlite_pragmas_applied(async_database):
+    # ACT
+    async with database_async.get_async_engine().connect() as connection:
+        foreign_keys = (await connection.exec_driver_sql("PRAGMA foreign_keys")).scalar()
+        journal_mode = (await connection.exec_driver_sql("PRAGMA journal_mode")).scalar()
+
+    # ASSERT
+    assert foreign_keys == 1
+    assert journal_mode == "wal"
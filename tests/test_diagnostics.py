@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_diagnostics.py
+Description: This script is to test the lazy logging helpers in diagnostics.py
+Author: Jack Gilmore
+Date: 2024-06-27
+"""
+
+import logging
+import pandas as pd
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import diagnostics.py from src
+import diagnostics
+
+
+def test_log_frame_builds_nothing_when_level_is_disabled(caplog):
+    # ARRANGE
+    built = []
+
+    def build_frame():
+        built.append(True)
+        return pd.DataFrame({"count": [1]})
+
+    # ACT
+    with caplog.at_level(logging.WARNING):
+        diagnostics.log_frame("Counts", build_frame)
+
+    # ASSERT
+    assert built == []
+    assert caplog.records == []
+
+
+def test_log_frame_logs_title_and_table(caplog):
+    # ARRANGE
+    data_frame = pd.DataFrame({"count": [1, 2]})
+
+    # ACT
+    with caplog.at_level(logging.INFO):
+        diagnostics.log_frame("Counts", data_frame)
+
+    # ASSERT
+    assert caplog.messages == ["Counts", "\n" + data_frame.to_string(index=False)]
+
+
+def test_lazy_text_is_only_formatted_when_logged(caplog):
+    # ARRANGE
+    calls = []
+
+    def format_value(value):
+        calls.append(value)
+        return f"value {value}"
+
+    # ACT
+    with caplog.at_level(logging.WARNING):
+        logging.info("%s", diagnostics.LazyText(format_value, 1))
+        logging.warning("%s", diagnostics.LazyText(format_value, 2))
+
+    # ASSERT
+    assert 1 not in calls
+    assert caplog.messages == ["value 2"]
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_export.py
+Description: This script is to test export.py functions
+Author: Jack Gilmore
+Date: 2024-06-21
+"""
+
+import asyncio
+import orjson
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import export.py from src
+from export import encode_rows
+
+# ARRANGE: Sample data for testing
+columns = ("prisoner_id", "name", "prison")
+chunks = [
+    [(1, "John Doe", "Edinburgh"), (2, "Jane Smith", "Glasgow")],
+    [(3, "Smith, Bob", "Aberdeen")],
+]
+
+
+def encode(format: str) -> list:
+    # Stream the sample chunks through encode_rows, like the export endpoint does
+    async def async_chunks():
+        for chunk in chunks:
+            yield chunk
+
+    async def collect():
+        return [text async for text in encode_rows(format, columns, async_chunks())]
+
+    return asyncio.run(collect())
+
+
+def test_encode_rows_as_ndjson():
+    # ACT
+    result = encode("ndjson")
+
+    # ASSERT
+    lines = b"".join(result).splitlines()
+    expected_line_count = 3
+
+    assert len(result) == len(chunks)
+    assert len(lines) == expected_line_count
+    assert orjson.loads(lines[0]) == {
+        "prisoner_id": 1,
+        "name": "John Doe",
+        "prison": "Edinburgh",
+    }
+
+
+def test_encode_rows_as_csv():
+    # ACT
+    result = encode("csv")
+
+    # ASSERT
+    expected_csv = (
+        b"prisoner_id,name,prison\n"
+        b"1,John Doe,Edinburgh\n"
+        b"2,Jane Smith,Glasgow\n"
+        b'3,"Smith, Bob",Aberdeen\n'
+    )
+
+    # The header, then the rows of each chunk
+    assert len(result) == len(chunks) + 1
+    assert b"".join(result) == expected_csv
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_load_data.py
+Description: This script is to test load_data.py functions
+Author: Jack Gilmore
+Date: 2024-06-22
+"""
+
+import pytest
+import pymupdf
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import load_data.py and the modules it writes with from src
+import dashboard_data
+import database
+import extraction_cache
+import load_data
+import snapshot
+from load_data import DATASET_HEADER, extract_pages, iter_dataset_lines, iter_data_frames
+
+# ARRANGE: Sample pages of prisoner rows, the first being instructions
+sample_pages = [
+    ["Instructions", "Load the data below"],
+    ["Some notes", DATASET_HEADER, "1,John Doe,34,M,Murder,25,Barnard Castle"],
+    ["2,Jane Smith,29,F,Fraud,5,Edinburgh", "3,Bob Johnson,45,M,Assault,10,Glasgow"],
+    ["4,Alice Brown,38,F,Theft,3,Inverness"],
+    ["5,Tom White,22,M,Drug Possession,2,Dumfries"],
+]
+
+
+def write_pdf(path: str, pages: list) -> None:
+    document = pymupdf.open()
+
+    for lines in pages:
+        page = document.new_page()
+        page.insert_text((72, 72), "\n".join(lines), fontsize=11)
+
+    document.save(path)
+    document.close()
+
+
+@pytest.fixture
+def sample_pdf(tmp_path):
+    path = str(tmp_path / "sample.pdf")
+    write_pdf(path, sample_pages)
+    return path
+
+
+@pytest.fixture
+def cached_sample_pdf(sample_pdf, tmp_path, monkeypatch):
+    # Read the sample PDF and cache its text in a throwaway folder
+    monkeypatch.setattr(load_data, "get_data_source_path", lambda: sample_pdf)
+    monkeypatch.setattr(extraction_cache, "CACHE_DIRECTORY", str(tmp_path / "cache"))
+
+    # Record which pages get extracted from the PDF rather than the cache
+    extracted_pages = []
+    get_page_lines = load_data.get_page_lines
+
+    def recording_get_page_lines(document, page_number):
+        extracted_pages.append(page_number)
+        return get_page_lines(document, page_number)
+
+    monkeypatch.setattr(load_data, "get_page_lines", recording_get_page_lines)
+
+    list(load_data.iter_source_pages(workers=1))
+    extracted_pages.clear()
+
+    return extracted_pages
+
+
+@pytest.fixture
+def loaded_sample_pdf(sample_pdf, tmp_path, monkeypatch):
+    # Load the sample PDF into a throwaway database. The snapshot and dashboard data are written to the
+    # working directory, so run from a throwaway folder too
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(load_data, "get_data_source_path", lambda: sample_pdf)
+    monkeypatch.setattr(extraction_cache, "CACHE_DIRECTORY", str(tmp_path / "cache"))
+    database.init_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+    load_data.main(["load_data.py", "--workers", "1"])
+
+    # Record which outputs are written by the next load
+    written = []
+
+    for module, function_name in [
+        (snapshot, "write_snapshot"),
+        (dashboard_data, "write_analysis"),
+    ]:
+
+        def recording_write(*args, write=getattr(module, function_name), **kwargs):
+            written.append(write.__name__)
+            return write(*args, **kwargs)
+
+        monkeypatch.setattr(module, function_name, recording_write)
+
+    yield written
+    database.dispose_engine()
+
+
+def test_extract_pages(sample_pdf):
+    # ACT
+    result = list(extract_pages(sample_pdf, range(1, len(sample_pages)), workers=1))
+
+    # ASSERT
+    assert result == sample_pages[1:]
+
+
+def test_extract_pages_in_parallel_keeps_page_order(sample_pdf):
+    # ACT
+    result = list(extract_pages(sample_pdf, range(1, len(sample_pages)), workers=2))
+
+    # ASSERT
+    assert result == sample_pages[1:]
+
+
+def test_iter_dataset_lines_starts_at_header():
+    # ACT
+    result = list(iter_dataset_lines(sample_pages[1:]))
+
+    # ASSERT
+    expected_row_count = 5
+
+    assert result[0] == DATASET_HEADER
+    assert len(result) == expected_row_count + 1
+
+
+def test_iter_dataset_lines_raises_without_header():
+    # ARRANGE
+    pages = [["Instructions"], ["1,John Doe,34,M,Murder,25,Glasgow"]]
+
+    # ACT & ASSERT
+    with pytest.raises(load_data.DataSourceError):
+        list(iter_dataset_lines(pages))
+
+
+def test_iter_data_frames_parses_in_chunks():
+    # ARRANGE
+    dataset_lines = iter_dataset_lines(sample_pages[1:])
+
+    # ACT
+    result = list(iter_data_frames(dataset_lines, chunk_size=2))
+
+    # ASSERT
+    expected_chunk_sizes = [2, 2, 1]
+
+    assert [len(data_frame) for data_frame in result] == expected_chunk_sizes
+    assert result[0]["gender"].tolist() == ["Male", "Female"]
+    assert result[2]["prisoner_id"].tolist() == [5]
+
+
+def test_unchanged_pdf_is_read_from_cache(cached_sample_pdf):
+    # ACT
+    result = list(load_data.iter_source_pages(workers=1))
+
+    # ASSERT
+    assert result == sample_pages[1:]
+    assert cached_sample_pdf == []
+
+
+def test_only_changed_pages_are_extracted(cached_sample_pdf, sample_pdf):
+    # ARRANGE
+    changed_pages = [list(lines) for lines in sample_pages]
+    changed_pages[3] = ["4,Alice Brown,38,F,Fraud,6,Inverness"]
+    write_pdf(sample_pdf, changed_pages)
+
+    # ACT
+    result = list(load_data.iter_source_pages(workers=1))
+
+    # ASSERT
+    expected_extracted_pages = [3]
+
+    assert result == changed_pages[1:]
+    assert cached_sample_pdf == expected_extracted_pages
+
+
+def test_unchanged_incremental_load_keeps_snapshot_and_dashboard_data(
+    loaded_sample_pdf,
+):
+    # ARRANGE
+    version_before = database.get_dataset_token_and_version()
+
+    # ACT
+    load_data.main(["load_data.py", "--incremental", "--workers", "1"])
+
+    # ASSERT
+    assert database.get_dataset_token_and_version() == version_before
+    assert snapshot.get_snapshot_token_and_version() == version_before
+    assert dashboard_data.get_analysis_token_and_version() == version_before
+    assert loaded_sample_pdf == []
+
+
+def test_full_load_rewrites_snapshot_and_dashboard_data(loaded_sample_pdf):
+    # ACT
+    load_data.main(["load_data.py", "--workers", "1"])
+
+    # ASSERT
+    current = database.get_dataset_token_and_version()
+
+    assert snapshot.get_snapshot_token_and_version() == current
+    assert dashboard_data.get_analysis_token_and_version() == current
+    assert loaded_sample_pdf == ["write_snapshot", "write_analysis"]
+
+
+@pytest.mark.parametrize(
+    "pages",
+    [
+        [["Instructions"], ["1,John Doe,34,M,Murder,25,Glasgow"]],
+        [["Instructions"], [DATASET_HEADER]],
+    ],
+)
+@pytest.mark.parametrize("load_arguments", [[], ["--incremental"]])
+def test_unreadable_dataset_leaves_database_alone(
+    loaded_sample_pdf, sample_pdf, pages, load_arguments
+):
+    # ARRANGE: Replace the PDF with one missing its header or rows
+    write_pdf(sample_pdf, pages)
+    version_before = database.get_dataset_version()
+
+    # ACT
+    with pytest.raises(load_data.DataSourceError):
+        load_data.main(["load_data.py", "--workers", "1"] + load_arguments)
+
+    # ASSERT
+    assert database.get_dataset_version() == version_before
+    assert database.get_all_prisoners_as_dataframe()["prisoner_id"].tolist() == [1, 2, 3, 4, 5]
+    assert loaded_sample_pdf == []
+
+
+def test_no_dashboard_data_removes_stale_dashboard_data(loaded_sample_pdf):
+    # ACT
+    load_data.main(["load_data.py", "--workers", "1", "--no-dashboard-data"])
+
+    # ASSERT
+    assert os.listdir(dashboard_data.DASHBOARD_DATA_DIRECTORY) == []
+    assert loaded_sample_pdf == ["write_snapshot"]
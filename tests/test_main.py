@@ -0,0 +1,487 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_main.py
+Description: This script is to test the API endpoints in main.py over HTTP
+Author: Jack Gilmore
+Date: 2024-07-05
+"""
+
+import orjson
+import pytest
+import sys
+import os
+from fastapi.testclient import TestClient
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# The API serves the dashboard from a folder relative to where it's run, so point it at the source
+os.environ.setdefault(
+    "STATIC_DIRECTORY", os.path.abspath(os.path.join(src_dir, "static"))
+)
+
+# Import the API and the modules it is built on from src
+import analysis_sql
+import auth
+import dashboard_data
+import database
+import database_async
+import main
+from cache import VersionedCache
+
+# ARRANGE: The API user for testing
+USERNAME = "joebloggs"
+PASSWORD = "a-very-secure-password"
+
+
+@pytest.fixture
+def sample_data(numbered_sample_data):
+    # These tests page through more prisoners than the default sample data has
+    return numbered_sample_data
+
+
+@pytest.fixture
+def client(sample_database, monkeypatch):
+    # The API connects to the sample database when it starts
+    monkeypatch.setattr(database, "DB_CONNECTION_STRING", sample_database)
+    monkeypatch.setattr(
+        main,
+        "authenticator",
+        auth.Authenticator(auth.PlainCredentialStore({USERNAME: PASSWORD})),
+    )
+
+    # Start with empty caches, so their hit and miss counts are only this test's
+    monkeypatch.setattr(main, "analysis_cache", VersionedCache())
+    monkeypatch.setattr(
+        main,
+        "prisoner_cache",
+        VersionedCache(
+            max_entries=main.PRISONER_CACHE_SIZE, ttl=main.PRISONER_CACHE_TTL
+        ),
+    )
+
+    with TestClient(main.app) as client:
+        client.auth = (USERNAME, PASSWORD)
+        yield client
+
+
+def test_analysis_has_etag_and_cache_control(client):
+    # ACT
+    response = client.get("/api/analysis")
+
+    # ASSERT
+    dataset_token, dataset_version = database.get_dataset_token_and_version()
+
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"analysis-{dataset_token}-{dataset_version}"'
+    assert response.headers["cache-control"] == "no-cache"
+    assert response.json()["prisoners_by_crime_type"]
+
+
+def test_analysis_is_not_modified_for_matching_etag(client):
+    # ARRANGE
+    etag = client.get("/api/analysis").headers["etag"]
+
+    # ACT
+    response = client.get("/api/analysis", headers={"If-None-Match": etag})
+    weak_response = client.get("/api/analysis", headers={"If-None-Match": f"W/{etag}"})
+
+    # ASSERT
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    assert response.headers["cache-control"] == "no-cache"
+    assert weak_response.status_code == 304
+
+
+def test_analysis_etag_changes_when_data_is_loaded(client, sample_data):
+    # ARRANGE
+    etag = client.get("/api/analysis").headers["etag"]
+
+    # ACT
+    database.load_data_frame_to_database(sample_data.iloc[:10])
+    response = client.get("/api/analysis", headers={"If-None-Match": etag})
+
+    # ASSERT
+    expected_prisoner_count = 10
+
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert (
+        sum(row["count"] for row in response.json()["prisoners_by_crime_type"])
+        == expected_prisoner_count
+    )
+
+
+def test_separately_loaded_databases_have_different_etags(
+    client, sample_data, tmp_path
+):
+    # ARRANGE: Another database loaded from scratch, so it's at the same dataset version as the sample database
+    etag = client.get("/api/analysis").headers["etag"]
+    dataset_version = database.get_dataset_version()
+
+    other_database = f"sqlite:///{tmp_path / 'other.db'}"
+    database.init_engine(other_database)
+    database.load_data_frame_to_database(sample_data.iloc[:10])
+
+    # ACT: Switch the API to the other database, as if it had been redeployed with it
+    client.portal.call(database_async.dispose_async_engine)
+    database_async.init_async_engine(other_database)
+    response = client.get("/api/analysis", headers={"If-None-Match": etag})
+
+    # ASSERT
+    expected_prisoner_count = 10
+
+    assert database.get_dataset_version() == dataset_version
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+    assert prisoner_count(response.json()) == expected_prisoner_count
+
+
+def test_cursor_pages_walk_every_prisoner_once(client):
+    # ACT
+    seen_ids = []
+    cursor = 0
+    while cursor is not None:
+        page = client.get(f"/api/prisoners?after={cursor}&per_page=10").json()
+        seen_ids += [prisoner["prisoner_id"] for prisoner in page["items"]]
+        cursor = page["next_cursor"]
+
+    # ASSERT
+    assert seen_ids == list(range(1, 26))
+
+
+def test_cursor_page_shape(client):
+    # ACT
+    page = client.get("/api/prisoners?after=5&per_page=2").json()
+    last_page = client.get("/api/prisoners?after=20&per_page=10").json()
+
+    # ASSERT
+    assert page == {
+        "items": [
+            {
+                "prisoner_id": 6,
+                "name": "Prisoner 6",
+                "age": 26,
+                "gender": "Female",
+                "crime": "Theft",
+                "sentence_years": 7,
+                "prison": "Edinburgh",
+            },
+            {
+                "prisoner_id": 7,
+                "name": "Prisoner 7",
+                "age": 27,
+                "gender": "Male",
+                "crime": "Assault",
+                "sentence_years": 8,
+                "prison": "Glasgow",
+            },
+        ],
+        "next_cursor": 7,
+    }
+    last_page_ids = [prisoner["prisoner_id"] for prisoner in last_page["items"]]
+
+    assert last_page_ids == list(range(21, 26))
+    assert last_page["next_cursor"] is None
+
+
+def test_page_size_is_limited(client):
+    # ARRANGE
+    largest = main.MAX_PAGE_SIZE
+
+    # ACT
+    largest_response = client.get(f"/api/prisoners?after=0&per_page={largest}")
+    too_large = client.get(f"/api/prisoners?after=0&per_page={largest + 1}")
+    too_large_offset = client.get(f"/api/prisoners?page=1&per_page={largest + 1}")
+
+    # ASSERT
+    assert largest_response.status_code == 200
+    assert too_large.status_code == 422
+    assert too_large_offset.status_code == 422
+
+
+def test_offset_pages_are_plain_lists(client):
+    # ACT
+    response = client.get("/api/prisoners?page=3&per_page=10")
+
+    # ASSERT
+    prisoner_ids = [prisoner["prisoner_id"] for prisoner in response.json()]
+
+    assert prisoner_ids == list(range(21, 26))
+
+
+def test_export_ndjson(client):
+    # ACT
+    response = client.get("/api/prisoners/export")
+
+    # ASSERT
+    lines = response.text.splitlines()
+
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "prisoners.ndjson" in response.headers["content-disposition"]
+    assert len(lines) == 25
+    assert orjson.loads(lines[0]) == {
+        "prisoner_id": 1,
+        "name": "Prisoner 1",
+        "age": 21,
+        "gender": "Male",
+        "crime": "Assault",
+        "sentence_years": 2,
+        "prison": "Glasgow",
+    }
+
+
+def test_export_csv(client):
+    # ACT
+    response = client.get("/api/prisoners/export?format=csv")
+
+    # ASSERT
+    lines = response.text.splitlines()
+
+    assert response.headers["content-type"].startswith("text/csv")
+    assert lines[0] == ",".join(database.PRISONER_COLUMNS)
+    assert lines[1] == "1,Prisoner 1,21,Male,Assault,2,Glasgow"
+    assert len(lines) == 26
+
+
+@pytest.mark.parametrize("format", ["ndjson", "csv"])
+def test_export_is_gzipped(client, format):
+    # ACT
+    response = client.get(
+        f"/api/prisoners/export?format={format}",
+        headers={"Accept-Encoding": "gzip"},
+    )
+    uncompressed = client.get(
+        f"/api/prisoners/export?format={format}",
+        headers={"Accept-Encoding": "identity"},
+    )
+
+    # ASSERT
+    # The test client decompresses the response, so it should match the uncompressed one
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-encoding" not in uncompressed.headers
+    assert response.content == uncompressed.content
+
+
+def test_export_rejects_unknown_formats(client):
+    # ACT
+    response = client.get("/api/prisoners/export?format=xml")
+
+    # ASSERT
+    assert response.status_code == 422
+
+
+def prisoner_count(analysis_result: dict) -> int:
+    # Every prisoner has one crime, so the crime counts add up to the number of prisoners analysed
+    return sum(row["count"] for row in analysis_result["prisoners_by_crime_type"])
+
+
+@pytest.mark.parametrize(
+    "query, expected_count",
+    [
+        ("prison=Glasgow", 13),
+        ("prison=Glasgow&prison=Edinburgh", 25),
+        ("gender=Female&crime=Theft", 4),
+        ("min_age=40", 6),
+        ("min_age=30&max_age=34&min_sentence=5", 1),
+    ],
+)
+def test_analysis_filters(client, query, expected_count):
+    # ACT
+    response = client.get(f"/api/analysis?{query}")
+
+    # ASSERT
+    assert response.status_code == 200
+    assert prisoner_count(response.json()) == expected_count
+
+
+def test_filtered_analysis_etags(client):
+    # ARRANGE
+    dataset_token, dataset_version = database.get_dataset_token_and_version()
+
+    # ACT
+    unfiltered = client.get("/api/analysis")
+    filtered = client.get("/api/analysis?crime=Theft&crime=Fraud")
+    reordered = client.get("/api/analysis?crime=Fraud&crime=Theft")
+    other_filter = client.get("/api/analysis?crime=Theft")
+    not_modified = client.get(
+        "/api/analysis?crime=Theft&crime=Fraud",
+        headers={"If-None-Match": filtered.headers["etag"]},
+    )
+
+    # ASSERT
+    # The same filters in any order share an ETag, which differs from other filters and no filters
+    assert filtered.headers["etag"].startswith(
+        f'"analysis-{dataset_token}-{dataset_version}-'
+    )
+    assert filtered.headers["etag"] == reordered.headers["etag"]
+    assert filtered.headers["etag"] != unfiltered.headers["etag"]
+    assert filtered.headers["etag"] != other_filter.headers["etag"]
+    assert not_modified.status_code == 304
+
+
+def test_analysis_filter_errors(client):
+    # ACT
+    invalid = client.get("/api/analysis?min_age=-1")
+    no_matches = client.get("/api/analysis?prison=Perth")
+
+    # ASSERT
+    assert invalid.status_code == 422
+    assert no_matches.status_code == 404
+
+
+def test_batch_keeps_requested_order_and_reports_missing_ids(client):
+    # ACT
+    response = client.post("/api/prisoners/batch", json={"ids": [9, 999, 3, 9, 25]})
+
+    # ASSERT
+    result = response.json()
+
+    assert response.status_code == 200
+    assert [prisoner["prisoner_id"] for prisoner in result["items"]] == [9, 3, 25]
+    assert result["items"][0]["name"] == "Prisoner 9"
+    assert result["missing"] == [999]
+
+
+def test_batch_size_is_limited(client, monkeypatch):
+    # ARRANGE
+    monkeypatch.setattr(main, "MAX_BATCH_SIZE", 3)
+
+    # ACT
+    largest = client.post("/api/prisoners/batch", json={"ids": [1, 2, 3]})
+    too_large = client.post("/api/prisoners/batch", json={"ids": [1, 2, 3, 4]})
+
+    # ASSERT
+    assert largest.status_code == 200
+    assert too_large.status_code == 400
+
+
+def test_prisoner_responses_are_cached_per_dataset_version(client, sample_data):
+    # ARRANGE
+    first = client.get("/api/prisoners/7")
+
+    # ACT
+    cached = client.get("/api/prisoners/7")
+    database.load_data_frame_to_database(sample_data.assign(name="Renamed"))
+    reloaded = client.get("/api/prisoners/7")
+
+    # ASSERT
+    stats = client.get("/api/cache/stats").json()["prisoner"]
+
+    assert first.json()["name"] == cached.json()["name"] == "Prisoner 7"
+    assert reloaded.json()["name"] == "Renamed"
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 1)
+
+
+def test_missing_prisoners_are_not_cached(client):
+    # ACT
+    responses = [client.get("/api/prisoners/999") for _ in range(2)]
+
+    # ASSERT
+    stats = client.get("/api/cache/stats").json()["prisoner"]
+
+    assert [response.status_code for response in responses] == [404, 404]
+    assert (stats["hits"], stats["entries"]) == (0, 0)
+
+
+def test_cache_stats(client):
+    # ACT
+    response = client.get("/api/cache/stats")
+    unauthenticated = client.get("/api/cache/stats", auth=("someone", "guess"))
+
+    # ASSERT
+    stats = response.json()
+
+    assert set(stats) == {"prisoner", "analysis", "dimension", "auth"}
+    assert set(stats["prisoner"]) == {
+        "entries",
+        "max_entries",
+        "ttl",
+        "hits",
+        "misses",
+        "evictions",
+    }
+    assert stats["prisoner"]["max_entries"] == main.PRISONER_CACHE_SIZE
+    assert unauthenticated.status_code == 401
+
+
+@pytest.fixture
+def threadpool_verifications(client, monkeypatch):
+    # Record each time credentials are verified in the threadpool rather than found in the cache
+    verifications = []
+    run_in_threadpool = main.run_in_threadpool
+
+    async def recording_run_in_threadpool(function, *args, **kwargs):
+        if function == main.authenticator.verify:
+            verifications.append(args)
+        return await run_in_threadpool(function, *args, **kwargs)
+
+    monkeypatch.setattr(main, "run_in_threadpool", recording_run_in_threadpool)
+
+    return verifications
+
+
+def test_verified_credentials_are_cached(client, threadpool_verifications):
+    # ACT
+    responses = [client.get("/api/prisoners/1") for _ in range(3)]
+
+    # ASSERT
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert threadpool_verifications == [(USERNAME, PASSWORD)]
+    assert main.authenticator.is_cached(USERNAME, PASSWORD)
+
+
+def test_wrong_credentials_are_always_verified(client, threadpool_verifications):
+    # ARRANGE
+    client.get("/api/prisoners/1")
+
+    # ACT
+    wrong = [client.get("/api/prisoners/1", auth=(USERNAME, "guess")) for _ in range(2)]
+    right = client.get("/api/prisoners/1")
+    missing = client.get("/api/prisoners/1", auth=None)
+
+    # ASSERT
+    # Wrong passwords are hashed every time and don't evict the cached one
+    assert [response.status_code for response in wrong] == [401, 401]
+    assert right.status_code == 200
+    assert missing.status_code == 401
+    assert threadpool_verifications == [
+        (USERNAME, PASSWORD),
+        (USERNAME, "guess"),
+        (USERNAME, "guess"),
+    ]
+    # The right password and the stats request itself are the only cache hits
+    assert client.get("/api/cache/stats").json()["auth"]["hits"] == 2
+
+
+def test_dashboard_data_version_is_checked_with_the_api(client, sample_data, tmp_path):
+    # ARRANGE: The If-None-Match the dashboard sends for the analysis file written by load_data.py
+    path = dashboard_data.write_analysis(
+        analysis_sql.perform_analysis(),
+        *database.get_dataset_token_and_version(),
+        str(tmp_path / "data"),
+    )
+
+    with open(path, "rb") as file:
+        static_data = orjson.loads(file.read())
+
+    headers = {
+        "If-None-Match": f'"analysis-{static_data["dataset_token"]}-{static_data["dataset_version"]}"'
+    }
+
+    # ACT
+    current = client.get("/api/analysis", headers=headers)
+    database.load_data_frame_to_database(sample_data.iloc[:10])
+    stale = client.get("/api/analysis", headers=headers)
+
+    # ASSERT
+    # The dashboard keeps the file's analysis while it is current, and shows the API's once it is out of date
+    assert current.status_code == 304
+    assert stale.status_code == 200
+    assert prisoner_count(stale.json()) == 10
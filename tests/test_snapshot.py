@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""
+Script Name: test_snapshot.py
+Description: This script is to test the columnar snapshot in snapshot.py
+Author: Jack Gilmore
+Date: 2024-06-25
+"""
+
+import pytest
+import sys
+import os
+
+# Get the current directory of this script
+current_dir = os.path.dirname(__file__)
+
+# Add the 'src' directory to the sys.path
+src_dir = os.path.join(current_dir, "..", "src")
+sys.path.insert(0, src_dir)
+
+# Import analysis.py, database.py and snapshot.py from src
+import analysis
+import database
+import snapshot
+
+
+@pytest.fixture
+def snapshot_path(sample_database, sample_data, tmp_path):
+    # Load the sample data again after a crime nobody is convicted of, so a lookup value goes unused
+    database.load_data_frame_to_database(
+        sample_data.assign(crime=sample_data["crime"].replace("Fraud", "Arson"))
+    )
+    database.load_data_frame_to_database(sample_data)
+    path = str(tmp_path / "prisoners.arrow")
+    snapshot.write_snapshot(path)
+    return path
+
+
+def test_snapshot_round_trip(snapshot_path, sample_data):
+    # ACT
+    result = snapshot.load_snapshot(path=snapshot_path)
+
+    # ASSERT
+    assert len(result) == len(sample_data)
+    assert result["name"].tolist() == sample_data["name"].tolist()
+    assert result["crime"].astype(str).tolist() == sample_data["crime"].tolist()
+
+
+def test_snapshot_dictionaries_are_sorted_and_used(snapshot_path, sample_data):
+    # ACT
+    result = snapshot.load_snapshot(["crime"], path=snapshot_path)
+
+    # ASSERT
+    expected_categories = sorted(sample_data["crime"].unique())
+
+    assert list(result.columns) == ["crime"]
+    assert result["crime"].cat.categories.tolist() == expected_categories
+
+
+def test_snapshot_analysis_matches_pandas_analysis(snapshot_path, sample_data):
+    # ACT
+    expected = analysis.perform_analysis(sample_data)
+    result = analysis.perform_analysis(
+        snapshot.load_snapshot(snapshot.ANALYSIS_COLUMNS, path=snapshot_path)
+    )
+
+    # ASSERT
+    assert result == expected
+
+
+def test_snapshot_token_and_version(snapshot_path, tmp_path):
+    # ACT
+    result = snapshot.get_snapshot_token_and_version(snapshot_path)
+    missing = snapshot.get_snapshot_token_and_version(str(tmp_path / "missing.arrow"))
+
+    # ASSERT
+    assert result == database.get_dataset_token_and_version()
+    assert missing is None